@@ -0,0 +1,98 @@
+"""Benchmark allocation state machine throughput under contention.
+
+Workers toggle the calling flag on a small pool of allocations as fast as they
+can, so most transitions race each other. Reports committed transitions per
+second, the share rejected as stale (409), and latency percentiles.
+
+Run it against a scratch database, never production:
+
+    MONGO_URL=mongodb://localhost:27088 python bench_state_machine.py --db smartflags_bench
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import uuid
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", required=True, help="Scratch database name (overrides DB_NAME)")
+    parser.add_argument("--workers", type=int, default=32, help="Concurrent workers")
+    parser.add_argument("--allocations", type=int, default=4, help="Allocations shared by all workers (fewer = more contention)")
+    parser.add_argument("--seconds", type=float, default=10.0, help="Benchmark duration")
+    return parser.parse_args()
+
+
+async def run(args):
+    import server
+    from fastapi import HTTPException
+
+    property_id = f"bench-{uuid.uuid4()}"
+    allocation_ids = []
+    for i in range(args.allocations):
+        allocation = server.Allocation(
+            propertyId=property_id,
+            guestId=str(uuid.uuid4()),
+            roomNumber=str(100 + i),
+            guestName=f"Bench Guest {i}",
+            fbManagerId=str(uuid.uuid4()),
+            allocationDate=time.strftime('%Y-%m-%d'),
+            status="Active"
+        )
+        doc = allocation.model_dump()
+        doc['createdAt'] = doc['createdAt'].isoformat()
+        doc['updatedAt'] = doc['updatedAt'].isoformat()
+        await server.db.allocations.insert_one(doc)
+        allocation_ids.append(allocation.id)
+
+    committed = 0
+    conflicts = 0
+    latencies = []
+    deadline = time.perf_counter() + args.seconds
+
+    async def worker():
+        nonlocal committed, conflicts
+        while time.perf_counter() < deadline:
+            allocation_id = random.choice(allocation_ids)
+            current = await server.db.allocations.find_one({"id": allocation_id}, {"_id": 0, "callingFlag": 1})
+            expected = current['callingFlag']
+            target = "Non Calling" if expected != "Non Calling" else "Calling"
+            started = time.perf_counter()
+            try:
+                await server.apply_allocation_transition(allocation_id, "callingFlag", target, expected)
+                committed += 1
+            except HTTPException as e:
+                if e.status_code != 409:
+                    raise
+                conflicts += 1
+            latencies.append(time.perf_counter() - started)
+
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.workers)))
+        elapsed = time.perf_counter() - started
+    finally:
+        for collection in ("allocations", "allocation_events", "notifications"):
+            await server.db[collection].delete_many({"propertyId": property_id})
+
+    attempts = committed + conflicts
+    latencies.sort()
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0.0
+
+    print(f"transactions: {'yes' if server._transactions_supported else 'no (standalone server)'}")
+    print(f"workers={args.workers} allocations={args.allocations} duration={elapsed:.1f}s")
+    print(f"committed: {committed} ({committed / elapsed:.0f}/s)")
+    print(f"rejected as stale: {conflicts} ({(conflicts / attempts * 100) if attempts else 0:.1f}%)")
+    print(f"latency ms: p50={percentile(0.50):.2f} p95={percentile(0.95):.2f} p99={percentile(0.99):.2f}")
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    os.environ["DB_NAME"] = args.db
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    asyncio.run(run(args))
@@ -0,0 +1,53 @@
+"""Bulk load country, state and city master data from a local dataset.
+
+The dataset is CSV with a header row, a JSON array or NDJSON, one row per record with
+countryCode, countryName and optionally stateCode, stateName and cityName. Rows repeat
+their parents, so an ISO-3166-2 subdivision list or a world cities file loads as-is.
+Records that already exist are left alone, so a dataset can be loaded again after an update.
+
+    MONGO_URL=mongodb://localhost:27088 python load_geo.py cities.csv
+
+A running API keeps serving its cached hierarchy until it restarts; to load into a live
+server, POST the file to /api/admin/geo/load instead.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="Dataset file")
+    parser.add_argument("--format", choices=["csv", "json", "ndjson", "jsonl"], help="Dataset format (default: from the file extension)")
+    parser.add_argument("--db", help="Database name (overrides DB_NAME)")
+    return parser.parse_args()
+
+
+async def run(args):
+    import server
+
+    fmt = args.format or Path(args.path).suffix.lstrip('.').lower()
+    if fmt not in server.GEO_DATASET_FORMATS:
+        sys.exit(f"Unsupported dataset format: {fmt!r}; pass --format")
+
+    await server.ensure_indexes(["countries", "states", "cities"])
+    started = time.perf_counter()
+    with open(args.path, encoding="utf-8-sig", newline="") as stream:
+        result = await server.load_geo_dataset(server.iter_geo_rows(stream, fmt))
+    elapsed = time.perf_counter() - started
+
+    print(f"rows: {result['rowsRead']} read, {result['rowsSkipped']} skipped")
+    for collection, count in result['inserted'].items():
+        print(f"{collection}: {count} inserted")
+    print(f"done in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.db:
+        os.environ["DB_NAME"] = args.db
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    asyncio.run(run(args))
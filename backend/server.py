@@ -1,7 +1,10 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Request, Response
+from fastapi.responses import StreamingResponse, JSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, InsertOne, UpdateOne, UpdateMany, ReplaceOne, DeleteMany
+from pymongo.errors import OperationFailure, BulkWriteError, DuplicateKeyError
 import os
 import logging
 from pathlib import Path
@@ -14,6 +17,20 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import random
 import string
+import asyncio
+import bisect
+import csv
+import hashlib
+import heapq
+import io
+import json
+import math
+import re
+import time
+import unicodedata
+import zlib
+import numpy as np
+import pandas as pd
 
 
 ROOT_DIR = Path(__file__).parent
@@ -218,6 +235,8 @@ class Seat(BaseModel):
     sectionId: Optional[str] = None  # Section assignment
     staticDeviceId: Optional[str] = None  # Static device assigned to seat
     status: str = "Free"  # Free, Allocated, Blocked
+    x: Optional[float] = None  # Position on the property layout
+    y: Optional[float] = None
     createdAt: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updatedAt: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
@@ -229,6 +248,11 @@ class SeatBulkCreate(BaseModel):
     suffix: Optional[str] = ""
     startNumber: int
     endNumber: int
+    originX: Optional[float] = None  # If set with originY, seats are laid out in rows from this point
+    originY: Optional[float] = None
+    spacingX: float = 1.0
+    spacingY: float = 1.0
+    perRow: Optional[int] = None  # Seats per row; all in one row if not set
 
 class SeatUpdate(BaseModel):
     seatTypeId: Optional[str] = None
@@ -236,6 +260,8 @@ class SeatUpdate(BaseModel):
     sectionId: Optional[str] = None
     staticDeviceId: Optional[str] = None
     status: Optional[str] = None
+    x: Optional[float] = None
+    y: Optional[float] = None
 
 class SeatStatusUpdate(BaseModel):
     status: str  # Free, Allocated, Blocked
@@ -255,6 +281,32 @@ class DeviceCreate(BaseModel):
     propertyId: str
     deviceId: str
 
+class DeviceEvent(BaseModel):
+    deviceId: str  # Physical device identifier
+    action: str  # call, checkout or cancel
+
+class DeviceEventBatch(BaseModel):
+    propertyId: str
+    events: List[DeviceEvent]
+
+class DeviceReading(BaseModel):
+    deviceId: str  # Physical device identifier
+    battery: Optional[float] = None  # Percent; a reading with neither metric is a plain heartbeat
+    signal: Optional[float] = None  # RSSI in dBm
+    timestamp: Optional[datetime] = None  # When the device took the reading; defaults to arrival
+
+class DeviceTelemetryBatch(BaseModel):
+    propertyId: str
+    readings: List[DeviceReading]
+
+class DeviceBulkCreate(BaseModel):
+    propertyId: str
+    deviceIds: List[str] = []  # Explicit physical device identifiers
+    prefix: Optional[str] = ""  # Range: prefix + zero-padded number + suffix
+    suffix: Optional[str] = ""
+    startNumber: Optional[int] = None
+    endNumber: Optional[int] = None
+
 class DeviceUpdate(BaseModel):
     deviceId: Optional[str] = None
     enabled: Optional[bool] = None
@@ -267,6 +319,7 @@ class Section(BaseModel):
     propertyId: str
     name: str
     seatIds: List[str] = []
+    zone: Optional[List[List[float]]] = None  # Polygon [[x, y], ...] in seat layout coordinates
     createdAt: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updatedAt: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
@@ -274,10 +327,12 @@ class SectionCreate(BaseModel):
     propertyId: str
     name: str
     seatIds: List[str] = []
+    zone: Optional[List[List[float]]] = None
 
 class SectionUpdate(BaseModel):
     name: Optional[str] = None
     seatIds: Optional[List[str]] = None
+    zone: Optional[List[List[float]]] = None
 
 # Staff Models
 class Staff(BaseModel):
@@ -327,6 +382,9 @@ class StaffLoginResponse(BaseModel):
     staff: Optional[dict] = None
     propertyId: Optional[str] = None
 
+class StaffCheckIn(BaseModel):
+    sectionId: Optional[str] = None  # None = on duty for the whole property
+
 
 # Role Models
 class Role(BaseModel):
@@ -548,12 +606,18 @@ class GuestBulkCreate(BaseModel):
 
 # Allocation Models
 class AllocationEvent(BaseModel):
-    """Event in allocation timeline"""
+    """Event in allocation timeline (stored in the allocation_events collection)"""
+    model_config = ConfigDict(extra="ignore")
+    
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    allocationId: str
+    propertyId: str
     eventType: str  # Created, Status Change, Calling On, Calling Off, Complete
     oldValue: Optional[str] = None
     newValue: Optional[str] = None
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     description: str
+    staffId: Optional[str] = None  # Staff member who made the change, when known
 
 class Allocation(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -572,7 +636,7 @@ class Allocation(BaseModel):
     allocationDate: str  # Date in YYYY-MM-DD format
     status: str = "Allocated"  # Allocated, Active, Billing, Clear, Complete
     callingFlag: str = "Non Calling"  # Non Calling, Calling, Calling for Checkout
-    events: List[dict] = []  # Timeline of events
+    recentEvents: List[dict] = []  # Last RECENT_EVENTS_LIMIT events; full timeline lives in allocation_events
     createdAt: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updatedAt: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
@@ -583,6 +647,19 @@ class AllocationCreate(BaseModel):
     seatIds: List[str]
     deviceIds: Optional[List[str]] = []
     allocationDate: Optional[str] = None  # Defaults to today
+    autoAssignDevice: bool = False  # Assign a free device when none is given, preferring the seats' static devices
+
+class AllocationBulkMember(BaseModel):
+    roomNumber: str
+    seatIds: List[str]
+    deviceIds: Optional[List[str]] = []
+
+class AllocationBulkCreate(BaseModel):
+    propertyId: str
+    fbManagerId: str
+    members: List[AllocationBulkMember]
+    allocationDate: Optional[str] = None  # Defaults to today
+    allOrNothing: bool = True  # If False, valid members are allocated and the rest reported
 
 class AllocationUpdate(BaseModel):
     fbManagerId: Optional[str] = None
@@ -591,15 +668,143 @@ class AllocationUpdate(BaseModel):
 
 class AllocationStatusUpdate(BaseModel):
     status: str  # Allocated, Active, Billing, Clear, Complete
+    expectedStatus: Optional[str] = None  # Status the client last saw; update is rejected if it changed
 
 class AllocationCallingFlagUpdate(BaseModel):
     callingFlag: str  # Non Calling, Calling, Calling for Checkout
+    expectedCallingFlag: Optional[str] = None  # Flag the client last saw; update is rejected if it changed
+    staffId: Optional[str] = None  # Staff member answering the call, credited with the response time
 
 # Helper Functions
 def generate_otp() -> str:
     """Generate a 6-digit OTP"""
     return ''.join(random.choices(string.digits, k=6))
 
+# Fields that list endpoints may project via the `fields` query parameter.
+# Sensitive fields (staff passwords) are left out so they can never be requested.
+LIST_FIELD_WHITELISTS = {
+    "organisations": set(Organisation.model_fields),
+    "properties": set(Property.model_fields),
+    "countries": set(Country.model_fields),
+    "states": set(State.model_fields),
+    "cities": set(City.model_fields),
+    "seat_types": set(SeatType.model_fields),
+    "seats": set(Seat.model_fields),
+    "devices": set(Device.model_fields),
+    "sections": set(Section.model_fields),
+    "staff": set(Staff.model_fields) - {"password"},
+    "menu_categories": set(MenuCategory.model_fields),
+    "menu_tags": set(MenuTag.model_fields),
+    "dietary_restrictions": set(DietaryRestriction.model_fields),
+    "menu_items": set(MenuItem.model_fields),
+    "menus": set(Menu.model_fields),
+    "guests": set(Guest.model_fields),
+    "allocations": set(Allocation.model_fields),
+}
+
+def build_list_projection(collection: str, fields: Optional[str] = None, exclude: Optional[List[str]] = None) -> dict:
+    """Translate a comma-separated `fields` parameter into a Mongo projection.
+
+    Without `fields` the full document is returned (minus `_id` and any `exclude`d
+    fields). With `fields`, only the requested whitelisted fields plus `id` are
+    returned. Unknown fields raise a 400.
+    """
+    if not fields:
+        projection = {"_id": 0}
+        for field in exclude or []:
+            projection[field] = 0
+        return projection
+
+    allowed = LIST_FIELD_WHITELISTS[collection]
+    requested = {f.strip() for f in fields.split(',') if f.strip()}
+    invalid = sorted(requested - allowed)
+    if invalid:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid fields: {', '.join(invalid)}. Allowed fields: {', '.join(sorted(allowed))}"
+        )
+
+    projection = {"_id": 0, "id": 1}
+    for field in requested:
+        projection[field] = 1
+    return projection
+
+def apply_list_projection(docs: List[dict], projection: dict) -> List[dict]:
+    """Apply a build_list_projection() projection to documents already in memory"""
+    included = [field for field, flag in projection.items() if flag == 1]
+    if included:
+        return [{field: doc[field] for field in included if field in doc} for doc in docs]
+    excluded = {field for field, flag in projection.items() if flag == 0 and field != "_id"}
+    if excluded:
+        return [{k: v for k, v in doc.items() if k not in excluded} for doc in docs]
+    return docs
+
+# Number of most recent events kept inline on each allocation document
+RECENT_EVENTS_LIMIT = 10
+
+def push_recent_event(event: dict) -> dict:
+    """Build the $push clause that appends an event to the bounded recentEvents summary"""
+    return {"recentEvents": {"$each": [event], "$slice": -RECENT_EVENTS_LIMIT}}
+
+# Transactions need a replica set; the docker-compose Mongo is standalone, so writes
+# fall back to running without a transaction there
+_transactions_supported: Optional[bool] = None
+
+async def run_in_transaction(callback):
+    """Run `callback(session)` inside a transaction, or with session=None if unsupported"""
+    global _transactions_supported
+    if _transactions_supported is not False:
+        try:
+            async with await client.start_session() as session:
+                result = await session.with_transaction(callback)
+            _transactions_supported = True
+            return result
+        except OperationFailure as e:
+            if e.code != 20:  # IllegalOperation: not a replica set member or mongos
+                raise
+            _transactions_supported = False
+            logger.warning("MongoDB transactions not supported, running multi-document writes without a transaction")
+    return await callback(None)
+
+async def record_allocation_event(allocation_id: str, property_id: str, event: dict, session=None):
+    """Append an event to the allocation_events timeline"""
+    await db.allocation_events.insert_one({
+        "id": str(uuid.uuid4()),
+        "allocationId": allocation_id,
+        "propertyId": property_id,
+        **event
+    }, session=session)
+
+async def migrate_embedded_allocation_events():
+    """Move timelines embedded on older allocation documents into allocation_events"""
+    migrated = 0
+    async for allocation in db.allocations.find(
+        {"events": {"$exists": True}},
+        {"_id": 0, "id": 1, "propertyId": 1, "events": 1}
+    ):
+        events = allocation.get('events') or []
+        if events:
+            await db.allocation_events.insert_many([
+                {
+                    "id": str(uuid.uuid4()),
+                    "allocationId": allocation['id'],
+                    "propertyId": allocation.get('propertyId'),
+                    **event
+                }
+                for event in events
+            ])
+        await db.allocations.update_one(
+            {"id": allocation['id']},
+            {
+                "$set": {"recentEvents": events[-RECENT_EVENTS_LIMIT:]},
+                "$unset": {"events": ""}
+            }
+        )
+        migrated += 1
+    
+    if migrated:
+        logger.info(f"Migrated embedded event timelines for {migrated} allocations")
+
 async def send_welcome_email(name: str, email: str, login_url: str) -> bool:
     """Send welcome email to the new admin user"""
     try:
@@ -851,13 +1056,231 @@ async def create_admin_login(request: CreateAdminRequest):
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 
+# ============= DASHBOARD COUNTERS =============
+
+# Dashboards read precomputed counts instead of pulling full lists. Each property has a
+# counter document, and every change to it is applied to its organisation's document and
+# the global one as well, so each level is the sum of the properties below it. Counts are
+# dotted paths: properties, seats.total, seats.byStatus.<status>, allocations.active
+# (not Complete), staff.total, staff.byRole.<roleId>, devices.total, devices.enabled; the
+# global document also counts organisations.
+EMPTY_COUNTERS = {
+    "properties": 0,
+    "seats": {"total": 0, "byStatus": {}},
+    "allocations": {"active": 0},
+    "staff": {"total": 0, "byRole": {}},
+    "devices": {"total": 0, "enabled": 0},
+}
+
+# propertyId -> organisationId, so rolling a property's counts up needs no lookup
+property_organisations = {}
+
+async def property_organisation(property_id: str) -> Optional[str]:
+    if property_id not in property_organisations:
+        property_doc = await db.properties.find_one({"id": property_id}, {"_id": 0, "organisationId": 1})
+        if not property_doc:
+            return None
+        property_organisations[property_id] = property_doc['organisationId']
+    return property_organisations[property_id]
+
+def add_deltas(total: dict, deltas: dict) -> dict:
+    for path, value in deltas.items():
+        total[path] = total.get(path, 0) + value
+    return total
+
+def flatten_counters(doc: dict, prefix: str = "") -> dict:
+    """Dotted path -> value for every count in a counter document"""
+    flat = {}
+    for key, value in doc.items():
+        if isinstance(value, dict):
+            flat.update(flatten_counters(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+async def bump_counters(property_id: str, deltas: dict, session=None):
+    """Add deltas to a property's counters and roll them up to its organisation and the global counts"""
+    deltas = {path: value for path, value in deltas.items() if value}
+    if not deltas:
+        return
+    organisation_id = await property_organisation(property_id)
+    if organisation_id is None:
+        return  # Property already deleted; its counts were taken out then
+    await db.counters.bulk_write([
+        UpdateOne(
+            {"id": f"property:{property_id}"},
+            {"$inc": deltas, "$set": {"organisationId": organisation_id}},
+            upsert=True
+        ),
+        UpdateOne({"id": f"organisation:{organisation_id}"}, {"$inc": deltas}, upsert=True),
+        UpdateOne({"id": "global"}, {"$inc": deltas}, upsert=True),
+    ], ordered=False, session=session)
+
+async def seat_status_deltas(seat_ids: List[str], status: str, session=None) -> dict:
+    """Counter deltas, per property, for moving these seats to `status`"""
+    deltas = {}
+    if not seat_ids:
+        return deltas
+    async for group in db.seats.aggregate([
+        {"$match": {"id": {"$in": seat_ids}, "status": {"$ne": status}}},
+        {"$group": {
+            "_id": {"propertyId": "$propertyId", "status": {"$ifNull": ["$status", "Free"]}},
+            "count": {"$sum": 1}
+        }}
+    ], session=session):
+        add_deltas(deltas.setdefault(group['_id']['propertyId'], {}), {
+            f"seats.byStatus.{group['_id']['status']}": -group['count'],
+            f"seats.byStatus.{status}": group['count']
+        })
+    return deltas
+
+async def set_seat_statuses(seat_ids: List[str], status: str, now: str, session=None):
+    """Set the status of these seats, moving them between the status counters"""
+    deltas = await seat_status_deltas(seat_ids, status, session=session)
+    result = await db.seats.update_many(
+        {"id": {"$in": seat_ids}},
+        {"$set": {"status": status, "updatedAt": now}},
+        session=session
+    )
+    for property_id, changes in deltas.items():
+        await bump_counters(property_id, changes, session=session)
+    return result
+
+async def count_property(property_id: str) -> dict:
+    """Count a property's documents from scratch, as counter deltas from zero"""
+    counts = {"properties": 1, "seats.total": 0, "staff.total": 0, "devices.total": 0, "devices.enabled": 0}
+    async for group in db.seats.aggregate([
+        {"$match": {"propertyId": property_id}},
+        {"$group": {"_id": {"$ifNull": ["$status", "Free"]}, "count": {"$sum": 1}}}
+    ]):
+        counts[f"seats.byStatus.{group['_id']}"] = group['count']
+        counts["seats.total"] += group['count']
+    async for group in db.staff.aggregate([
+        {"$match": {"propertyId": property_id}},
+        {"$group": {"_id": "$roleId", "count": {"$sum": 1}}}
+    ]):
+        counts[f"staff.byRole.{group['_id']}"] = group['count']
+        counts["staff.total"] += group['count']
+    async for group in db.devices.aggregate([
+        {"$match": {"propertyId": property_id}},
+        {"$group": {"_id": "$enabled", "count": {"$sum": 1}}}
+    ]):
+        counts["devices.total"] += group['count']
+        if group['_id'] is not False:
+            counts["devices.enabled"] += group['count']
+    counts["allocations.active"] = await db.allocations.count_documents(
+        {"propertyId": property_id, "status": {"$ne": "Complete"}}
+    )
+    return counts
+
+async def recount_property_counters(property_id: str) -> dict:
+    """Recount a property and apply whatever differs from its counters, returning the corrections"""
+    current = await db.counters.find_one({"id": f"property:{property_id}"}, {"_id": 0}) or {}
+    fresh = await count_property(property_id)
+    old = flatten_counters(current)
+    corrections = {path: fresh.get(path, 0) - old.get(path, 0) for path in set(fresh) | set(old)}
+    corrections = {path: value for path, value in corrections.items() if value}
+    await bump_counters(property_id, corrections)
+    return corrections
+
+async def rebuild_counters() -> int:
+    """Throw all counters away and recount every property, returning how many were counted"""
+    await db.counters.delete_many({})
+    property_organisations.clear()
+    await db.counters.update_one(
+        {"id": "global"},
+        {"$set": {"organisations": await db.organisations.count_documents({})}},
+        upsert=True
+    )
+    counted = 0
+    async for property_doc in db.properties.find({}, {"_id": 0, "id": 1, "organisationId": 1}):
+        property_organisations[property_doc['id']] = property_doc['organisationId']
+        await recount_property_counters(property_doc['id'])
+        counted += 1
+    return counted
+
+async def drop_property_counters(property_id: str):
+    """Take a deleted property's counts back out of its organisation's and the global counters"""
+    property_organisations.pop(property_id, None)
+    doc = await db.counters.find_one_and_delete({"id": f"property:{property_id}"}, projection={"_id": 0})
+    if not doc:
+        return
+    negated = {path: -value for path, value in flatten_counters(doc).items() if value}
+    if negated:
+        await db.counters.bulk_write([
+            UpdateOne({"id": f"organisation:{doc['organisationId']}"}, {"$inc": negated}),
+            UpdateOne({"id": "global"}, {"$inc": negated}),
+        ], ordered=False)
+
+async def drop_organisation_counters(organisation_id: str):
+    """Take a deleted organisation and all its properties out of the global counters"""
+    for property_id, owner in list(property_organisations.items()):
+        if owner == organisation_id:
+            del property_organisations[property_id]
+    doc = await db.counters.find_one_and_delete({"id": f"organisation:{organisation_id}"}, projection={"_id": 0})
+    await db.counters.delete_many({"organisationId": organisation_id})
+    negated = {path: -value for path, value in flatten_counters(doc or {}).items() if value}
+    add_deltas(negated, {"organisations": -1})
+    await db.counters.update_one({"id": "global"}, {"$inc": negated}, upsert=True)
+
+async def move_property_counters(property_id: str, organisation_id: str):
+    """Move a property's counts to the organisation it was reassigned to"""
+    property_organisations[property_id] = organisation_id
+    doc = await db.counters.find_one_and_update(
+        {"id": f"property:{property_id}"},
+        {"$set": {"organisationId": organisation_id}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.BEFORE
+    )
+    if not doc or doc.get('organisationId') == organisation_id:
+        return
+    counts = {path: value for path, value in flatten_counters(doc).items() if value}
+    if counts:
+        await db.counters.bulk_write([
+            UpdateOne({"id": f"organisation:{doc['organisationId']}"}, {"$inc": {p: -v for p, v in counts.items()}}),
+            UpdateOne({"id": f"organisation:{organisation_id}"}, {"$inc": counts}, upsert=True),
+        ], ordered=False)
+
+@api_router.get("/rollup")
+async def get_rollup(organisationId: Optional[str] = None, propertyId: Optional[str] = None):
+    """Get dashboard counts for a property, an organisation, or the whole system"""
+    try:
+        if propertyId:
+            counter_id = f"property:{propertyId}"
+        elif organisationId:
+            counter_id = f"organisation:{organisationId}"
+        else:
+            counter_id = "global"
+        
+        doc = await db.counters.find_one({"id": counter_id}, {"_id": 0, "id": 0, "organisationId": 0}) or {}
+        counters = {
+            key: {**default, **doc.get(key, {})} if isinstance(default, dict) else doc.get(key, default)
+            for key, default in EMPTY_COUNTERS.items()
+        }
+        # Statuses and roles that have dropped back to zero are left out
+        for group in counters.values():
+            if isinstance(group, dict):
+                for key, value in group.items():
+                    if isinstance(value, dict):
+                        group[key] = {name: count for name, count in value.items() if count}
+        if counter_id == "global":
+            counters["organisations"] = doc.get("organisations", 0)
+        return {"success": True, "counters": counters}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching rollup: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
 # Organisation Endpoints
 @api_router.get("/organisations")
-async def get_organisations():
+async def get_organisations(fields: Optional[str] = None):
     """Get all organisations"""
     try:
-        organisations = await db.organisations.find({}, {"_id": 0}).to_list(1000)
+        organisations = await db.organisations.find({}, build_list_projection("organisations", fields)).to_list(1000)
         return {"success": True, "organisations": organisations}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching organisations: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
@@ -887,6 +1310,7 @@ async def create_organisation(org_data: OrganisationCreate):
         org_dict['updatedAt'] = org_dict['updatedAt'].isoformat()
         
         await db.organisations.insert_one(org_dict)
+        await db.counters.update_one({"id": "global"}, {"$inc": {"organisations": 1}}, upsert=True)
         
         logger.info(f"Organisation created: {new_org.id}")
         return {"success": True, "organisation": new_org}
@@ -932,8 +1356,12 @@ async def delete_organisation(organisation_id: str):
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Organisation not found")
         
+        # Properties, their data and admin logins are removed in the background
+        await drop_organisation_counters(organisation_id)
+        job_id = await enqueue_cascade("organisation", organisation_id)
+        
         logger.info(f"Organisation deleted: {organisation_id}")
-        return {"success": True, "message": "Organisation deleted successfully"}
+        return {"success": True, "message": "Organisation deleted successfully", "cleanupJobId": job_id}
     except HTTPException:
         raise
     except Exception as e:
@@ -942,21 +1370,25 @@ async def delete_organisation(organisation_id: str):
 
 # Property Endpoints (Admin)
 @api_router.get("/properties")
-async def get_properties():
+async def get_properties(fields: Optional[str] = None):
     """Get all properties"""
     try:
-        properties = await db.properties.find({}, {"_id": 0}).to_list(1000)
+        properties = await db.properties.find({}, build_list_projection("properties", fields)).to_list(1000)
         return {"success": True, "properties": properties}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching properties: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @api_router.get("/properties/organisation/{organisation_id}")
-async def get_properties_by_organisation(organisation_id: str):
+async def get_properties_by_organisation(organisation_id: str, fields: Optional[str] = None):
     """Get all properties for an organisation"""
     try:
-        properties = await db.properties.find({"organisationId": organisation_id}, {"_id": 0}).to_list(1000)
+        properties = await db.properties.find({"organisationId": organisation_id}, build_list_projection("properties", fields)).to_list(1000)
         return {"success": True, "properties": properties}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching properties: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
@@ -991,6 +1423,8 @@ async def create_property(property_data: PropertyCreate):
         prop_dict['updatedAt'] = prop_dict['updatedAt'].isoformat()
         
         await db.properties.insert_one(prop_dict)
+        property_organisations[new_property.id] = new_property.organisationId
+        await bump_counters(new_property.id, {"properties": 1})
         
         logger.info(f"Property created: {new_property.id}")
         return {"success": True, "property": new_property}
@@ -1026,6 +1460,8 @@ async def update_property(property_id: str, update_data: PropertyUpdate):
             raise HTTPException(status_code=404, detail="Property not found")
         
         updated_property = await db.properties.find_one({"id": property_id}, {"_id": 0})
+        if 'organisationId' in update_dict:
+            await move_property_counters(property_id, update_dict['organisationId'])
         
         logger.info(f"Property updated: {property_id}")
         return {"success": True, "property": updated_property}
@@ -1044,8 +1480,12 @@ async def delete_property(property_id: str):
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Property not found")
         
+        # Seats, staff, allocations, menus etc. are removed in the background
+        await drop_property_counters(property_id)
+        job_id = await enqueue_cascade("property", property_id)
+        
         logger.info(f"Property deleted: {property_id}")
-        return {"success": True, "message": "Property deleted successfully"}
+        return {"success": True, "message": "Property deleted successfully", "cleanupJobId": job_id}
     except HTTPException:
         raise
     except Exception as e:
@@ -1053,13 +1493,287 @@ async def delete_property(property_id: str):
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 
+# ============= GEO HIERARCHY CACHE =============
+
+class GeoHierarchyCache:
+    """In-process copy of the country -> state -> city master data.
+
+    The hierarchy changes a few times a year, so it is loaded from Mongo once and served
+    from memory until a country, state or city handler invalidates it. Each load gets a
+    new version; the ETag is a hash of the tree, so it stays valid across restarts and
+    clients can revalidate with If-None-Match.
+    """
+    
+    def __init__(self):
+        self._data = None
+        self._version = 0
+        self._lock = asyncio.Lock()
+    
+    def invalidate(self):
+        self._version += 1
+        self._data = None
+    
+    async def _build(self, version: int) -> dict:
+        countries = await db.countries.find({}, {"_id": 0}).to_list(None)
+        states = await db.states.find({}, {"_id": 0}).to_list(None)
+        cities = await db.cities.find({}, {"_id": 0}).to_list(None)
+        
+        states_by_country = {}
+        for state in states:
+            states_by_country.setdefault(state['countryId'], []).append(state)
+        cities_by_state = {}
+        for city in cities:
+            cities_by_state.setdefault(city['stateId'], []).append(city)
+        
+        tree = [
+            {**country, "states": [
+                {**state, "cities": cities_by_state.get(state['id'], [])}
+                for state in states_by_country.get(country['id'], [])
+            ]}
+            for country in countries
+        ]
+        digest = hashlib.sha1(json.dumps(tree, sort_keys=True, default=str).encode()).hexdigest()
+        return {
+            "version": version,
+            "etag": f'"{digest}"',
+            "countries": countries,
+            "states": states,
+            "cities": cities,
+            "statesByCountry": states_by_country,
+            "citiesByState": cities_by_state,
+            "tree": tree
+        }
+    
+    async def get(self) -> dict:
+        if self._data is not None:
+            return self._data
+        async with self._lock:
+            # A write during the load bumps the version; load again rather than cache stale data
+            while self._data is None:
+                version = self._version
+                data = await self._build(version)
+                if version == self._version:
+                    self._data = data
+            return self._data
+
+geo_cache = GeoHierarchyCache()
+
+GEO_SEARCH_MAX_LIMIT = 50
+
+def normalize_search_text(text: str) -> str:
+    """Casefold, strip accents and collapse whitespace, so 'São  Paulo' matches 'sao paulo'"""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return " ".join("".join(ch for ch in decomposed if not unicodedata.combining(ch)).split())
+
+def trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class GeoSearchIndex:
+    """Typeahead index over state and city names.
+
+    Prefix lookups bisect a sorted list of every name and each word-start inside it, so
+    "jose" finds "San Jose"; fuzzy lookups score trigram overlap to catch misspellings.
+    The index is built at startup and the state and city handlers apply their changes to
+    it directly instead of rebuilding it.
+    """
+    FUZZY_THRESHOLD = 0.4
+    
+    def __init__(self):
+        self._records = {}  # id -> {"type", "id", "name", "parentId", "grams"}
+        self._keys = []  # sorted (name or word-start suffix, id)
+        self._grams = {}  # trigram -> ids
+        self._loaded = False
+        self._version = 0
+        self._lock = asyncio.Lock()
+    
+    @staticmethod
+    def _keys_for(name: str) -> set:
+        words = normalize_search_text(name).split(" ")
+        return {" ".join(words[i:]) for i in range(len(words)) if words[i]}
+    
+    @staticmethod
+    def _record(kind: str, doc: dict) -> dict:
+        return {
+            "type": kind,
+            "id": doc['id'],
+            "name": doc['name'],
+            "parentId": doc['countryId'] if kind == "state" else doc['stateId'],
+            "grams": trigrams(normalize_search_text(doc['name']))
+        }
+    
+    async def _build(self) -> tuple:
+        records = {}
+        async for state in db.states.find({}, {"_id": 0, "id": 1, "name": 1, "countryId": 1}):
+            records[state['id']] = self._record("state", state)
+        async for city in db.cities.find({}, {"_id": 0, "id": 1, "name": 1, "stateId": 1}):
+            records[city['id']] = self._record("city", city)
+        
+        keys = sorted((key, record_id) for record_id, record in records.items() for key in self._keys_for(record['name']))
+        grams = {}
+        for record_id, record in records.items():
+            for gram in record['grams']:
+                grams.setdefault(gram, set()).add(record_id)
+        return records, keys, grams
+    
+    async def ensure_loaded(self):
+        if self._loaded:
+            return
+        async with self._lock:
+            # A change during the build bumps the version; build again so it isn't lost
+            while not self._loaded:
+                version = self._version
+                built = await self._build()
+                if version == self._version:
+                    self._records, self._keys, self._grams = built
+                    self._loaded = True
+    
+    def _insert(self, record: dict):
+        self._records[record['id']] = record
+        for key in self._keys_for(record['name']):
+            bisect.insort(self._keys, (key, record['id']))
+        for gram in record['grams']:
+            self._grams.setdefault(gram, set()).add(record['id'])
+    
+    def _delete(self, record_id: str):
+        record = self._records.pop(record_id, None)
+        if record is None:
+            return
+        for key in self._keys_for(record['name']):
+            i = bisect.bisect_left(self._keys, (key, record_id))
+            if i < len(self._keys) and self._keys[i] == (key, record_id):
+                del self._keys[i]
+        for gram in record['grams']:
+            ids = self._grams.get(gram)
+            if ids is not None:
+                ids.discard(record_id)
+                if not ids:
+                    del self._grams[gram]
+    
+    def upsert(self, kind: str, doc: dict):
+        self._version += 1
+        if self._loaded:
+            self._delete(doc['id'])
+            self._insert(self._record(kind, doc))
+    
+    def remove(self, record_id: str):
+        self._version += 1
+        if self._loaded:
+            self._delete(record_id)
+    
+    def reset(self):
+        self._version += 1
+        self._loaded = False
+        self._records, self._keys, self._grams = {}, [], {}
+    
+    def _country_of(self, record: dict) -> Optional[str]:
+        if record['type'] == "state":
+            return record['parentId']
+        state = self._records.get(record['parentId'])
+        return state['parentId'] if state else None
+    
+    def search(self, query: str, kinds: set, country_id: Optional[str], state_id: Optional[str], limit: int) -> List[dict]:
+        """Prefix matches in name order, then fuzzy matches by similarity, up to `limit`"""
+        text = normalize_search_text(query)
+        if not text:
+            return []
+        
+        def accept(record: dict) -> bool:
+            return (
+                record['type'] in kinds
+                and (state_id is None or (record['type'] == "city" and record['parentId'] == state_id))
+                and (country_id is None or self._country_of(record) == country_id)
+            )
+        
+        matches = []
+        seen = set()
+        i = bisect.bisect_left(self._keys, (text,))
+        while i < len(self._keys) and len(matches) < limit and self._keys[i][0].startswith(text):
+            record_id = self._keys[i][1]
+            if record_id not in seen:
+                seen.add(record_id)
+                if accept(self._records[record_id]):
+                    matches.append((self._records[record_id], 1.0))
+            i += 1
+        
+        if len(matches) < limit and len(text) >= 3:
+            query_grams = trigrams(text)
+            # A name scoring above the threshold shares at least `needed` trigrams with the
+            # query, so it must appear in one of the len - needed + 1 rarest ones
+            needed = max(1, math.ceil(self.FUZZY_THRESHOLD * len(query_grams) / (2 - self.FUZZY_THRESHOLD)))
+            rarest = sorted(query_grams, key=lambda gram: len(self._grams.get(gram, ())))
+            candidates = set()
+            for gram in rarest[:len(rarest) - needed + 1]:
+                candidates.update(self._grams.get(gram, ()))
+            scored = []
+            for record_id in candidates - seen:
+                record = self._records[record_id]
+                score = 2 * len(query_grams & record['grams']) / (len(query_grams) + len(record['grams']))
+                if score >= self.FUZZY_THRESHOLD and accept(record):
+                    scored.append((score, record_id))
+            for score, record_id in heapq.nlargest(limit - len(matches), scored):
+                matches.append((self._records[record_id], round(score, 3)))
+        
+        results = []
+        for record, score in matches:
+            result = {"type": record['type'], "id": record['id'], "name": record['name'], "score": score}
+            if record['type'] == "city":
+                state = self._records.get(record['parentId'])
+                result.update(stateId=record['parentId'], stateName=state['name'] if state else None)
+            result['countryId'] = self._country_of(record)
+            results.append(result)
+        return results
+
+geo_search_index = GeoSearchIndex()
+
+@api_router.get("/geo/tree")
+async def get_geo_tree(request: Request):
+    """Get the whole country -> state -> city hierarchy"""
+    try:
+        geo = await geo_cache.get()
+        headers = {"ETag": geo['etag'], "Cache-Control": "no-cache"}
+        if geo['etag'] in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers=headers)
+        return JSONResponse(
+            content={"success": True, "version": geo['version'], "countries": geo['tree']},
+            headers=headers
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching geo tree: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@api_router.get("/geo/search")
+async def search_geo(q: str, type: Optional[str] = None, countryId: Optional[str] = None,
+                     stateId: Optional[str] = None, limit: int = 10):
+    """Typeahead search over state and city names"""
+    try:
+        if type not in (None, "state", "city"):
+            raise HTTPException(status_code=400, detail="type must be 'state' or 'city'")
+        if limit < 1 or limit > GEO_SEARCH_MAX_LIMIT:
+            raise HTTPException(status_code=400, detail=f"limit must be between 1 and {GEO_SEARCH_MAX_LIMIT}")
+        
+        await geo_search_index.ensure_loaded()
+        kinds = {type} if type else {"state", "city"}
+        results = geo_search_index.search(q, kinds, countryId, stateId, limit)
+        return {"success": True, "results": results}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error searching geo data: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
 # Master Data Endpoints - Countries
 @api_router.get("/countries")
-async def get_countries():
+async def get_countries(fields: Optional[str] = None):
     """Get all countries"""
     try:
-        countries = await db.countries.find({}, {"_id": 0}).to_list(1000)
+        geo = await geo_cache.get()
+        countries = apply_list_projection(geo['countries'], build_list_projection("countries", fields))
         return {"success": True, "countries": countries}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching countries: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
@@ -1073,10 +1787,16 @@ async def create_country(country_data: CountryCreate):
         country_dict = new_country.model_dump()
         country_dict['createdAt'] = country_dict['createdAt'].isoformat()
         
-        await db.countries.insert_one(country_dict)
+        try:
+            await db.countries.insert_one(country_dict)
+        except DuplicateKeyError:
+            raise HTTPException(status_code=400, detail=f"Country code {new_country.code} already exists")
+        geo_cache.invalidate()
         
         logger.info(f"Country created: {new_country.id}")
         return {"success": True, "country": new_country}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error creating country: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
@@ -1090,13 +1810,17 @@ async def update_country(country_id: str, update_data: CountryUpdate):
         if not update_dict:
             raise HTTPException(status_code=400, detail="No fields to update")
         
-        result = await db.countries.update_one(
-            {"id": country_id},
-            {"$set": update_dict}
-        )
+        try:
+            result = await db.countries.update_one(
+                {"id": country_id},
+                {"$set": update_dict}
+            )
+        except DuplicateKeyError:
+            raise HTTPException(status_code=400, detail="A country with this code already exists")
         
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="Country not found")
+        geo_cache.invalidate()
         
         updated_country = await db.countries.find_one({"id": country_id}, {"_id": 0})
         
@@ -1116,6 +1840,7 @@ async def delete_country(country_id: str):
         
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Country not found")
+        geo_cache.invalidate()
         
         logger.info(f"Country deleted: {country_id}")
         return {"success": True, "message": "Country deleted successfully"}
@@ -1127,21 +1852,27 @@ async def delete_country(country_id: str):
 
 # Master Data Endpoints - States
 @api_router.get("/states")
-async def get_states():
+async def get_states(fields: Optional[str] = None):
     """Get all states"""
     try:
-        states = await db.states.find({}, {"_id": 0}).to_list(1000)
+        geo = await geo_cache.get()
+        states = apply_list_projection(geo['states'], build_list_projection("states", fields))
         return {"success": True, "states": states}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching states: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @api_router.get("/states/country/{country_id}")
-async def get_states_by_country(country_id: str):
+async def get_states_by_country(country_id: str, fields: Optional[str] = None):
     """Get all states for a country"""
     try:
-        states = await db.states.find({"countryId": country_id}, {"_id": 0}).to_list(1000)
+        geo = await geo_cache.get()
+        states = apply_list_projection(geo['statesByCountry'].get(country_id, []), build_list_projection("states", fields))
         return {"success": True, "states": states}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching states: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
@@ -1160,7 +1891,12 @@ async def create_state(state_data: StateCreate):
         state_dict = new_state.model_dump()
         state_dict['createdAt'] = state_dict['createdAt'].isoformat()
         
-        await db.states.insert_one(state_dict)
+        try:
+            await db.states.insert_one(state_dict)
+        except DuplicateKeyError:
+            raise HTTPException(status_code=400, detail=f"State {new_state.name} already exists in this country")
+        geo_cache.invalidate()
+        geo_search_index.upsert("state", state_dict)
         
         logger.info(f"State created: {new_state.id}")
         return {"success": True, "state": new_state}
@@ -1185,15 +1921,20 @@ async def update_state(state_id: str, update_data: StateUpdate):
             if not country:
                 raise HTTPException(status_code=404, detail="Country not found")
         
-        result = await db.states.update_one(
-            {"id": state_id},
-            {"$set": update_dict}
-        )
+        try:
+            result = await db.states.update_one(
+                {"id": state_id},
+                {"$set": update_dict}
+            )
+        except DuplicateKeyError:
+            raise HTTPException(status_code=400, detail="A state with this name already exists in the country")
         
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="State not found")
+        geo_cache.invalidate()
         
         updated_state = await db.states.find_one({"id": state_id}, {"_id": 0})
+        geo_search_index.upsert("state", updated_state)
         
         logger.info(f"State updated: {state_id}")
         return {"success": True, "state": updated_state}
@@ -1211,6 +1952,8 @@ async def delete_state(state_id: str):
         
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="State not found")
+        geo_cache.invalidate()
+        geo_search_index.remove(state_id)
         
         logger.info(f"State deleted: {state_id}")
         return {"success": True, "message": "State deleted successfully"}
@@ -1222,21 +1965,27 @@ async def delete_state(state_id: str):
 
 # Master Data Endpoints - Cities
 @api_router.get("/cities")
-async def get_cities():
+async def get_cities(fields: Optional[str] = None):
     """Get all cities"""
     try:
-        cities = await db.cities.find({}, {"_id": 0}).to_list(1000)
+        geo = await geo_cache.get()
+        cities = apply_list_projection(geo['cities'], build_list_projection("cities", fields))
         return {"success": True, "cities": cities}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching cities: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @api_router.get("/cities/state/{state_id}")
-async def get_cities_by_state(state_id: str):
+async def get_cities_by_state(state_id: str, fields: Optional[str] = None):
     """Get all cities for a state"""
     try:
-        cities = await db.cities.find({"stateId": state_id}, {"_id": 0}).to_list(1000)
+        geo = await geo_cache.get()
+        cities = apply_list_projection(geo['citiesByState'].get(state_id, []), build_list_projection("cities", fields))
         return {"success": True, "cities": cities}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching cities: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
@@ -1255,7 +2004,12 @@ async def create_city(city_data: CityCreate):
         city_dict = new_city.model_dump()
         city_dict['createdAt'] = city_dict['createdAt'].isoformat()
         
-        await db.cities.insert_one(city_dict)
+        try:
+            await db.cities.insert_one(city_dict)
+        except DuplicateKeyError:
+            raise HTTPException(status_code=400, detail=f"City {new_city.name} already exists in this state")
+        geo_cache.invalidate()
+        geo_search_index.upsert("city", city_dict)
         
         logger.info(f"City created: {new_city.id}")
         return {"success": True, "city": new_city}
@@ -1280,15 +2034,20 @@ async def update_city(city_id: str, update_data: CityUpdate):
             if not state:
                 raise HTTPException(status_code=404, detail="State not found")
         
-        result = await db.cities.update_one(
-            {"id": city_id},
-            {"$set": update_dict}
-        )
+        try:
+            result = await db.cities.update_one(
+                {"id": city_id},
+                {"$set": update_dict}
+            )
+        except DuplicateKeyError:
+            raise HTTPException(status_code=400, detail="A city with this name already exists in the state")
         
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="City not found")
+        geo_cache.invalidate()
         
         updated_city = await db.cities.find_one({"id": city_id}, {"_id": 0})
+        geo_search_index.upsert("city", updated_city)
         
         logger.info(f"City updated: {city_id}")
         return {"success": True, "city": updated_city}
@@ -1306,6 +2065,8 @@ async def delete_city(city_id: str):
         
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="City not found")
+        geo_cache.invalidate()
+        geo_search_index.remove(city_id)
         
         logger.info(f"City deleted: {city_id}")
         return {"success": True, "message": "City deleted successfully"}
@@ -1315,6 +2076,175 @@ async def delete_city(city_id: str):
         logger.error(f"Error deleting city: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+# Master Data Endpoints - Bulk Load
+GEO_LOAD_BATCH_SIZE = 5000
+GEO_DATASET_FORMATS = ("csv", "json", "ndjson", "jsonl")
+
+def iter_geo_rows(stream, fmt: str):
+    """Yield dataset rows from a text stream: CSV with a header row, a JSON array, or NDJSON"""
+    if fmt == "csv":
+        rows = csv.DictReader(stream)
+    elif fmt == "json":
+        rows = json.load(stream)
+        if not isinstance(rows, list):
+            raise ValueError("A JSON dataset must be an array of objects")
+    else:
+        rows = (json.loads(line) for line in stream if line.strip())
+    for number, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            raise ValueError(f"Row {number} is not an object")
+        yield row
+
+async def load_geo_dataset(rows) -> dict:
+    """Insert the countries, states and cities in `rows` that don't exist yet.
+
+    Each row names a country (countryCode, countryName) and optionally a state (stateCode,
+    stateName) and a city (cityName) in it. Existing records are matched in memory -
+    countries by code, states and cities by name under their parent - so no parent is
+    looked up per row and loading the same dataset twice inserts nothing. New records are
+    written in unordered batches, parents before children.
+    """
+    countries = {
+        country['code']: country['id']
+        for country in await db.countries.find({}, {"_id": 0, "id": 1, "code": 1}).to_list(None)
+    }
+    states = {
+        (state['countryId'], state['name']): state['id']
+        for state in await db.states.find({}, {"_id": 0, "id": 1, "countryId": 1, "name": 1}).to_list(None)
+    }
+    cities = {
+        (city['stateId'], city['name'])
+        for city in await db.cities.find({}, {"_id": 0, "stateId": 1, "name": 1}).to_list(None)
+    }
+    
+    pending = {"countries": [], "states": [], "cities": []}
+    inserted = {collection: 0 for collection in pending}
+    rows_read = 0
+    rows_skipped = 0
+    created_at = datetime.now(timezone.utc).isoformat()
+    
+    async def adopt_existing(collection: str, rejected: List[dict]):
+        """Point children at the records that won a unique-index race instead of our rejected copies"""
+        remap = {}
+        if collection == "countries":
+            winners = {
+                country['code']: country['id'] async for country in db.countries.find(
+                    {"code": {"$in": [doc['code'] for doc in rejected]}}, {"_id": 0, "id": 1, "code": 1}
+                )
+            }
+            for doc in rejected:
+                if doc['code'] in winners:
+                    remap[doc['id']] = countries[doc['code']] = winners[doc['code']]
+            for key in [key for key in states if key[0] in remap]:
+                states.setdefault((remap[key[0]], key[1]), states.pop(key))
+            for state in pending['states']:
+                state['countryId'] = remap.get(state['countryId'], state['countryId'])
+        else:
+            winners = {
+                (state['countryId'], state['name']): state['id'] async for state in db.states.find(
+                    {"$or": [{"countryId": doc['countryId'], "name": doc['name']} for doc in rejected]},
+                    {"_id": 0, "id": 1, "countryId": 1, "name": 1}
+                )
+            }
+            for doc in rejected:
+                key = (doc['countryId'], doc['name'])
+                if key in winners:
+                    remap[doc['id']] = states[key] = winners[key]
+            for key in [key for key in cities if key[0] in remap]:
+                cities.discard(key)
+                cities.add((remap[key[0]], key[1]))
+            for city in pending['cities']:
+                city['stateId'] = remap.get(city['stateId'], city['stateId'])
+    
+    async def flush():
+        # Parents go first, so children can still be re-pointed before they are written
+        for collection, docs in pending.items():
+            if not docs:
+                continue
+            try:
+                await db[collection].insert_many(docs, ordered=False)
+                inserted[collection] += len(docs)
+            except BulkWriteError as e:
+                # Only tolerate records created meanwhile through the CRUD endpoints
+                if any(error['code'] != 11000 for error in e.details['writeErrors']):
+                    raise
+                inserted[collection] += e.details['nInserted']
+                if collection != "cities":
+                    await adopt_existing(collection, [docs[error['index']] for error in e.details['writeErrors']])
+            pending[collection] = []
+    
+    for row in rows:
+        rows_read += 1
+        country_code = str(row.get('countryCode') or '').strip()
+        country_name = str(row.get('countryName') or '').strip()
+        state_name = str(row.get('stateName') or '').strip()
+        city_name = str(row.get('cityName') or '').strip()
+        
+        country_id = countries.get(country_code)
+        if country_id is None:
+            if not country_code or not country_name:
+                rows_skipped += 1
+                continue
+            country = Country(name=country_name, code=country_code).model_dump()
+            country['createdAt'] = created_at
+            pending['countries'].append(country)
+            country_id = countries[country_code] = country['id']
+        
+        if state_name:
+            state_id = states.get((country_id, state_name))
+            if state_id is None:
+                state = State(
+                    countryId=country_id, name=state_name, code=str(row.get('stateCode') or '').strip()
+                ).model_dump()
+                state['createdAt'] = created_at
+                pending['states'].append(state)
+                state_id = states[(country_id, state_name)] = state['id']
+            
+            if city_name and (state_id, city_name) not in cities:
+                city = City(stateId=state_id, name=city_name).model_dump()
+                city['createdAt'] = created_at
+                pending['cities'].append(city)
+                cities.add((state_id, city_name))
+        elif city_name:
+            rows_skipped += 1  # A city needs a state
+        
+        if sum(len(docs) for docs in pending.values()) >= GEO_LOAD_BATCH_SIZE:
+            await flush()
+    await flush()
+    
+    return {"rowsRead": rows_read, "rowsSkipped": rows_skipped, "inserted": inserted}
+
+@api_router.post("/admin/geo/load")
+async def load_geo_data(file: UploadFile = File(...), format: Optional[str] = None):
+    """Bulk load countries, states and cities from a CSV, JSON or NDJSON dataset"""
+    try:
+        fmt = (format or Path(file.filename or '').suffix.lstrip('.')).lower()
+        if fmt not in GEO_DATASET_FORMATS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unsupported dataset format. Use one of: {', '.join(GEO_DATASET_FORMATS)}"
+            )
+        
+        stream = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+        try:
+            # Parsing runs off the event loop
+            rows = await asyncio.to_thread(lambda: list(iter_geo_rows(stream, fmt)))
+        except (ValueError, csv.Error) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid dataset: {str(e)}")
+        
+        try:
+            result = await load_geo_dataset(rows)
+        finally:
+            geo_cache.invalidate()  # Also after a partial load
+            geo_search_index.reset()
+        
+        logger.info(f"Geo dataset loaded from {file.filename}: {result}")
+        return {"success": True, **result}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error loading geo dataset: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 
 @api_router.post("/user/request-otp", response_model=RequestOTPResponse)
@@ -1417,16 +2347,18 @@ async def create_seat_type(seat_type: SeatTypeCreate):
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @api_router.get("/seat-types/{property_id}")
-async def get_seat_types(property_id: str):
+async def get_seat_types(property_id: str, fields: Optional[str] = None):
     """Get all seat types for a property"""
     try:
         seat_types = await db.seat_types.find(
             {"propertyId": property_id},
-            {"_id": 0}
+            build_list_projection("seat_types", fields)
         ).to_list(1000)
         
         return {"success": True, "seatTypes": seat_types}
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching seat types: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
@@ -1471,8 +2403,10 @@ async def delete_seat_type(seat_type_id: str):
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Seat type not found")
         
+        job_id = await enqueue_cascade("seat_type", seat_type_id)
+        
         logger.info(f"Seat type deleted: {seat_type_id}")
-        return {"success": True, "message": "Seat type deleted successfully"}
+        return {"success": True, "message": "Seat type deleted successfully", "cleanupJobId": job_id}
         
     except HTTPException:
         raise
@@ -1494,9 +2428,12 @@ async def create_seats_bulk(seat_data: SeatBulkCreate):
         # Determine padding length based on end number
         padding_length = len(str(seat_data.endNumber))
         
+        place = seat_data.originX is not None and seat_data.originY is not None
+        per_row = seat_data.perRow or (seat_data.endNumber - seat_data.startNumber + 1)
+        
         # Generate seats
         seats = []
-        for num in range(seat_data.startNumber, seat_data.endNumber + 1):
+        for index, num in enumerate(range(seat_data.startNumber, seat_data.endNumber + 1)):
             # Format number with zero padding
             formatted_num = str(num).zfill(padding_length)
             seat_number = f"{seat_data.prefix}{formatted_num}{seat_data.suffix}"
@@ -1505,7 +2442,9 @@ async def create_seats_bulk(seat_data: SeatBulkCreate):
                 propertyId=seat_data.propertyId,
                 seatTypeId=seat_data.seatTypeId,
                 seatNumber=seat_number,
-                sectionId=seat_data.sectionId
+                sectionId=seat_data.sectionId,
+                x=seat_data.originX + (index % per_row) * seat_data.spacingX if place else None,
+                y=seat_data.originY + (index // per_row) * seat_data.spacingY if place else None
             )
             
             # Convert to dict and serialize datetime
@@ -1515,8 +2454,21 @@ async def create_seats_bulk(seat_data: SeatBulkCreate):
             
             seats.append(seat_doc)
         
-        # Insert all seats
-        await db.seats.insert_many(seats)
+        # Insert all seats, listing them on their section in the same transaction
+        async def write(session):
+            await db.seats.insert_many(seats, session=session)
+            await bump_counters(
+                seat_data.propertyId, {"seats.total": len(seats), "seats.byStatus.Free": len(seats)}, session=session
+            )
+            if seat_data.sectionId:
+                await db.sections.update_one(
+                    {"id": seat_data.sectionId},
+                    {"$addToSet": {"seatIds": {"$each": [seat['id'] for seat in seats]}}},
+                    session=session
+                )
+        
+        await run_in_transaction(write)
+        seat_layout_index.reset(seat_data.propertyId)
         
         logger.info(f"Created {len(seats)} seats for property {seat_data.propertyId}")
         return {
@@ -1532,16 +2484,18 @@ async def create_seats_bulk(seat_data: SeatBulkCreate):
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @api_router.get("/seats/{property_id}")
-async def get_seats(property_id: str):
+async def get_seats(property_id: str, fields: Optional[str] = None):
     """Get all seats for a property"""
     try:
         seats = await db.seats.find(
             {"propertyId": property_id},
-            {"_id": 0}
+            build_list_projection("seats", fields)
         ).to_list(10000)
         
         return {"success": True, "seats": seats}
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching seats: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
@@ -1557,16 +2511,36 @@ async def update_seat(seat_id: str, update_data: SeatUpdate):
         
         update_dict['updatedAt'] = datetime.now(timezone.utc).isoformat()
         
-        result = await db.seats.update_one(
-            {"id": seat_id},
-            {"$set": update_dict}
-        )
+        # A section change also moves the seat between the sections' seatIds, in one transaction
+        async def write(session):
+            old_seat = await db.seats.find_one_and_update(
+                {"id": seat_id},
+                {"$set": update_dict},
+                projection={"_id": 0, "propertyId": 1, "sectionId": 1, "status": 1},
+                return_document=ReturnDocument.BEFORE,
+                session=session
+            )
+            if old_seat and 'status' in update_dict and update_dict['status'] != old_seat.get('status', "Free"):
+                await bump_counters(old_seat['propertyId'], {
+                    f"seats.byStatus.{old_seat.get('status', 'Free')}": -1,
+                    f"seats.byStatus.{update_dict['status']}": 1
+                }, session=session)
+            old_section_id = (old_seat or {}).get('sectionId')
+            if old_seat and 'sectionId' in update_dict and update_dict['sectionId'] != old_section_id:
+                if old_section_id:
+                    await db.sections.update_one({"id": old_section_id}, {"$pull": {"seatIds": seat_id}}, session=session)
+                if update_dict['sectionId']:
+                    await db.sections.update_one(
+                        {"id": update_dict['sectionId']}, {"$addToSet": {"seatIds": seat_id}}, session=session
+                    )
+            return old_seat
         
-        if result.matched_count == 0:
+        if not await run_in_transaction(write):
             raise HTTPException(status_code=404, detail="Seat not found")
         
         # Get updated seat
         updated_seat = await db.seats.find_one({"id": seat_id}, {"_id": 0})
+        seat_layout_index.reset(updated_seat['propertyId'])
         
         logger.info(f"Seat updated: {seat_id}")
         return {"success": True, "seat": updated_seat}
@@ -1581,13 +2555,19 @@ async def update_seat(seat_id: str, update_data: SeatUpdate):
 async def delete_seat(seat_id: str):
     """Delete a seat"""
     try:
-        result = await db.seats.delete_one({"id": seat_id})
+        deleted_seat = await db.seats.find_one_and_delete({"id": seat_id}, projection={"_id": 0, "propertyId": 1, "status": 1})
         
-        if result.deleted_count == 0:
+        if not deleted_seat:
             raise HTTPException(status_code=404, detail="Seat not found")
+        seat_layout_index.reset(deleted_seat['propertyId'])
+        await bump_counters(deleted_seat['propertyId'], {
+            "seats.total": -1, f"seats.byStatus.{deleted_seat.get('status', 'Free')}": -1
+        })
+        
+        job_id = await enqueue_cascade("seat", seat_id)
         
         logger.info(f"Seat deleted: {seat_id}")
-        return {"success": True, "message": "Seat deleted successfully"}
+        return {"success": True, "message": "Seat deleted successfully", "cleanupJobId": job_id}
         
     except HTTPException:
         raise
@@ -1606,18 +2586,13 @@ async def update_seat_status(seat_id: str, status_update: SeatStatusUpdate):
                 detail=f"Invalid status. Must be one of: {', '.join(valid_statuses)}"
             )
         
-        result = await db.seats.update_one(
-            {"id": seat_id},
-            {"$set": {
-                "status": status_update.status,
-                "updatedAt": datetime.now(timezone.utc).isoformat()
-            }}
-        )
+        result = await set_seat_statuses([seat_id], status_update.status, datetime.now(timezone.utc).isoformat())
         
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="Seat not found")
         
         updated_seat = await db.seats.find_one({"id": seat_id}, {"_id": 0})
+        seat_layout_index.reset(updated_seat['propertyId'])
         
         logger.info(f"Seat status updated: {seat_id} -> {status_update.status}")
         return {"success": True, "seat": updated_seat}
@@ -1642,15 +2617,10 @@ async def toggle_seat_block(seat_id: str):
         current_status = seat.get('status', 'Free')
         new_status = "Free" if current_status == "Blocked" else "Blocked"
         
-        result = await db.seats.update_one(
-            {"id": seat_id},
-            {"$set": {
-                "status": new_status,
-                "updatedAt": datetime.now(timezone.utc).isoformat()
-            }}
-        )
+        result = await set_seat_statuses([seat_id], new_status, datetime.now(timezone.utc).isoformat())
         
         updated_seat = await db.seats.find_one({"id": seat_id}, {"_id": 0})
+        seat_layout_index.reset(updated_seat['propertyId'])
         
         logger.info(f"Seat block toggled: {seat_id} -> {new_status}")
         return {"success": True, "seat": updated_seat, "status": new_status}
@@ -1674,13 +2644,9 @@ async def update_bulk_seat_status(seat_ids: List[str], status: str):
                 detail=f"Invalid status. Must be one of: {', '.join(valid_statuses)}"
             )
         
-        result = await db.seats.update_many(
-            {"id": {"$in": seat_ids}},
-            {"$set": {
-                "status": status,
-                "updatedAt": datetime.now(timezone.utc).isoformat()
-            }}
-        )
+        result = await set_seat_statuses(seat_ids, status, datetime.now(timezone.utc).isoformat())
+        
+        seat_layout_index.reset()  # Seats may span properties here
         
         logger.info(f"Updated {result.modified_count} seats to status: {status}")
         return {
@@ -1695,15 +2661,391 @@ async def update_bulk_seat_status(seat_ids: List[str], status: str):
         logger.error(f"Error updating bulk seat status: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+# ============= SEAT LAYOUT ENDPOINTS =============
+
+def point_in_polygon(x: float, y: float, polygon: List[List[float]]) -> bool:
+    """Ray-casting test for a point inside a (non self-intersecting) polygon"""
+    inside = False
+    j = len(polygon) - 1
+    for i in range(len(polygon)):
+        xi, yi = polygon[i][0], polygon[i][1]
+        xj, yj = polygon[j][0], polygon[j][1]
+        if (yi > y) != (yj > y) and x < (xj - xi) * (y - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+def validate_zone(zone: Optional[List[List[float]]]):
+    """Reject zone polygons that aren't at least three [x, y] points"""
+    if zone is not None and (len(zone) < 3 or any(len(point) != 2 for point in zone)):
+        raise HTTPException(status_code=400, detail="Zone must be a polygon of at least 3 [x, y] points")
+
+SEAT_NUMBER_PATTERN = re.compile(r'^(.*?)(\d+)(\D*)$')
+
+class SeatLayoutIndex:
+    """Per-property seat layout: a uniform grid over x/y coordinates plus numbered rows.
+
+    A property's layout is built from Mongo on first use and dropped whenever its seats or
+    sections change. The grid cell size is chosen so an average cell holds a few seats, so
+    it works whatever units the layout is drawn in; seats without coordinates stay out of
+    the grid. Rows group seats of one section and seat type numbered prefix + number +
+    suffix (as seats/bulk creates them) in number order, so consecutive numbers are
+    neighbours; loungers 1-10 and cabanas 1-5 are separate rows even without a prefix.
+    """
+    SEATS_PER_CELL = 4
+    
+    def __init__(self):
+        self._layouts = {}
+        self._locks = {}
+    
+    async def _build(self, property_id: str) -> dict:
+        all_seats = await db.seats.find(
+            {"propertyId": property_id},
+            {"_id": 0, "id": 1, "seatNumber": 1, "seatTypeId": 1, "sectionId": 1, "status": 1, "x": 1, "y": 1}
+        ).to_list(None)
+        zones = {
+            section['id']: section['zone'] async for section in db.sections.find(
+                {"propertyId": property_id, "zone": {"$ne": None}}, {"_id": 0, "id": 1, "zone": 1}
+            )
+        }
+        
+        rows = {}
+        for seat in all_seats:
+            match = SEAT_NUMBER_PATTERN.match(seat.get('seatNumber') or '')
+            if match:
+                prefix, number, suffix = match.groups()
+                key = (seat.get('sectionId') or '', seat.get('seatTypeId') or '', prefix, suffix)
+                rows.setdefault(key, []).append((int(number), seat))
+        for row in rows.values():
+            row.sort(key=lambda item: item[0])
+        
+        seats = [seat for seat in all_seats if seat.get('x') is not None and seat.get('y') is not None]
+        layout = {
+            "cell": 1.0,
+            "cells": {},
+            "seats": {seat['id']: seat for seat in seats},
+            "rows": rows,
+            "zones": zones,
+            "spacing": 1.0
+        }
+        if not seats:
+            return layout
+        
+        min_x = min(seat['x'] for seat in seats)
+        max_x = max(seat['x'] for seat in seats)
+        min_y = min(seat['y'] for seat in seats)
+        max_y = max(seat['y'] for seat in seats)
+        area = max(max_x - min_x, 1e-9) * max(max_y - min_y, 1e-9)
+        layout["cell"] = max(math.sqrt(area * self.SEATS_PER_CELL / len(seats)), 1e-6)
+        
+        for seat in seats:
+            layout["cells"].setdefault(self._cell_of(layout, seat['x'], seat['y']), []).append(seat)
+        keys = layout["cells"].keys()
+        layout["bounds"] = (
+            min(k[0] for k in keys), max(k[0] for k in keys),
+            min(k[1] for k in keys), max(k[1] for k in keys)
+        )
+        
+        # Typical seat spacing (median nearest-neighbour distance over a sample) sets the default adjacency radius
+        sample = seats[::max(1, len(seats) // 200)]
+        gaps = sorted(
+            found[0][0] for found in (
+                self.nearest(layout, seat['x'], seat['y'], 1, lambda other, me=seat: other is not me)
+                for seat in sample
+            ) if found
+        )
+        if gaps:
+            layout["spacing"] = gaps[len(gaps) // 2] or layout["cell"]
+        return layout
+    
+    def _cell_of(self, layout: dict, x: float, y: float) -> tuple:
+        return (math.floor(x / layout["cell"]), math.floor(y / layout["cell"]))
+    
+    async def get(self, property_id: str) -> dict:
+        layout = self._layouts.get(property_id)
+        if layout is not None:
+            return layout
+        async with self._locks.setdefault(property_id, asyncio.Lock()):
+            if property_id not in self._layouts:
+                self._layouts[property_id] = await self._build(property_id)
+        return self._layouts[property_id]
+    
+    def reset(self, property_id: Optional[str] = None):
+        """Drop a property's grid (or all of them); it is rebuilt on next use"""
+        if property_id is None:
+            self._layouts.clear()
+        else:
+            self._layouts.pop(property_id, None)
+    
+    def in_rect(self, layout: dict, min_x: float, min_y: float, max_x: float, max_y: float):
+        """Seats inside an axis-aligned rectangle"""
+        if not layout["cells"]:
+            return
+        lo = self._cell_of(layout, min_x, min_y)
+        hi = self._cell_of(layout, max_x, max_y)
+        bx0, bx1, by0, by1 = layout["bounds"]
+        for cx in range(max(lo[0], bx0), min(hi[0], bx1) + 1):
+            for cy in range(max(lo[1], by0), min(hi[1], by1) + 1):
+                for seat in layout["cells"].get((cx, cy), ()):
+                    if min_x <= seat['x'] <= max_x and min_y <= seat['y'] <= max_y:
+                        yield seat
+    
+    def nearest(self, layout: dict, x: float, y: float, count: int, accept) -> list:
+        """Up to `count` (distance, seat) pairs closest to a point, searching outward ring by ring"""
+        if not layout["cells"]:
+            return []
+        cx, cy = self._cell_of(layout, x, y)
+        bx0, bx1, by0, by1 = layout["bounds"]
+        max_ring = max(abs(cx - bx0), abs(cx - bx1), abs(cy - by0), abs(cy - by1))
+        found = []
+        for ring in range(max_ring + 1):
+            for gx in range(cx - ring, cx + ring + 1):
+                edge = gx in (cx - ring, cx + ring)
+                for gy in (range(cy - ring, cy + ring + 1) if edge else (cy - ring, cy + ring)):
+                    for seat in layout["cells"].get((gx, gy), ()):
+                        if accept(seat):
+                            found.append((math.hypot(seat['x'] - x, seat['y'] - y), seat))
+            # Seats in later rings are at least `ring` cells away
+            if len(found) >= count and heapq.nsmallest(count, found, key=lambda item: item[0])[-1][0] <= ring * layout["cell"]:
+                break
+        return heapq.nsmallest(count, found, key=lambda item: item[0])
+    
+    def suggest_groups(self, layout: dict, size: int, accept, x: Optional[float] = None, y: Optional[float] = None,
+                       radius: Optional[float] = None, limit: int = 5) -> List[list]:
+        """Disjoint groups of `size` accepted seats, each chained by gaps of at most `radius`"""
+        radius = radius or layout["spacing"] * 1.5
+        candidates = [seat for seat in layout["seats"].values() if accept(seat)]
+        if x is not None and y is not None:
+            starts = heapq.nsmallest(200, candidates, key=lambda seat: math.hypot(seat['x'] - x, seat['y'] - y))
+        else:
+            starts = candidates[:200]
+        
+        used = set()
+        groups = []
+        for start in starts:
+            if start['id'] in used:
+                continue
+            group = [start]
+            members = {start['id']}
+            frontier = []
+            
+            def push_neighbours(seat):
+                for other in self.in_rect(layout, seat['x'] - radius, seat['y'] - radius, seat['x'] + radius, seat['y'] + radius):
+                    if other['id'] not in members:
+                        heapq.heappush(frontier, (math.hypot(other['x'] - start['x'], other['y'] - start['y']), other['id'], other))
+            
+            # Grow from the start seat, always taking the frontier seat closest to it
+            push_neighbours(start)
+            while len(group) < size and frontier:
+                _, seat_id, seat = heapq.heappop(frontier)
+                if seat_id in members or seat_id in used or not accept(seat):
+                    continue
+                if min(math.hypot(seat['x'] - m['x'], seat['y'] - m['y']) for m in group) > radius:
+                    continue
+                group.append(seat)
+                members.add(seat_id)
+                push_neighbours(seat)
+            
+            if len(group) == size:
+                groups.append(group)
+                used.update(members)
+                if len(groups) >= limit:
+                    break
+        return groups
+
+    def free_runs(self, layout: dict, size: int, accept) -> List[dict]:
+        """Maximal runs of consecutively numbered accepted seats, at least `size` long, per row"""
+        runs = []
+        for (section_id, seat_type_id, prefix, suffix), row in layout["rows"].items():
+            run = []
+            previous = None
+            # One pass over the number-sorted row: a taken seat or a numbering gap ends the run
+            for number, seat in row + [(None, None)]:
+                if seat is not None and accept(seat) and (not run or number == previous + 1):
+                    run.append(seat)
+                else:
+                    if len(run) >= size:
+                        runs.append({"sectionId": section_id, "seatTypeId": seat_type_id,
+                                     "prefix": prefix, "suffix": suffix, "seats": run})
+                    run = [seat] if seat is not None and accept(seat) else []
+                previous = number
+        return runs
+
+seat_layout_index = SeatLayoutIndex()
+
+async def seat_filter(property_id: str, date: Optional[str], free_only: bool,
+                      seat_type_id: Optional[str], section_id: Optional[str]):
+    """Predicate over indexed seats for the layout queries"""
+    held = set()
+    if free_only:
+        allocation_date = date or datetime.now(timezone.utc).strftime('%Y-%m-%d')
+        held = (await availability_index.get(property_id, allocation_date))["seat"]
+    
+    def accept(seat: dict) -> bool:
+        if free_only and (seat['id'] in held or seat.get('status') == 'Blocked'):
+            return False
+        if seat_type_id and seat.get('seatTypeId') != seat_type_id:
+            return False
+        if section_id and seat.get('sectionId') != section_id:
+            return False
+        return True
+    return accept
+
+def layout_seat(seat: dict, distance: Optional[float] = None) -> dict:
+    result = {k: seat.get(k) for k in ("id", "seatNumber", "seatTypeId", "sectionId", "x", "y")}
+    if distance is not None:
+        result["distance"] = round(distance, 3)
+    return result
+
+@api_router.get("/seats/{property_id}/layout/range")
+async def get_seats_in_range(
+    property_id: str,
+    minX: Optional[float] = None,
+    minY: Optional[float] = None,
+    maxX: Optional[float] = None,
+    maxY: Optional[float] = None,
+    zone: Optional[str] = None,
+    date: Optional[str] = None,
+    freeOnly: bool = False,
+    seatTypeId: Optional[str] = None
+):
+    """Get seats inside a rectangle and/or a section's zone polygon"""
+    try:
+        layout = await seat_layout_index.get(property_id)
+        polygon = None
+        if zone:
+            polygon = layout["zones"].get(zone)
+            if not polygon:
+                raise HTTPException(status_code=400, detail="Section has no zone polygon")
+            minX = max(minX if minX is not None else -math.inf, min(p[0] for p in polygon))
+            maxX = min(maxX if maxX is not None else math.inf, max(p[0] for p in polygon))
+            minY = max(minY if minY is not None else -math.inf, min(p[1] for p in polygon))
+            maxY = min(maxY if maxY is not None else math.inf, max(p[1] for p in polygon))
+        elif None in (minX, minY, maxX, maxY):
+            raise HTTPException(status_code=400, detail="Provide minX, minY, maxX and maxY, or a zone")
+        
+        accept = await seat_filter(property_id, date, freeOnly, seatTypeId, None)
+        seats = [
+            layout_seat(seat) for seat in seat_layout_index.in_rect(layout, minX, minY, maxX, maxY)
+            if accept(seat) and (polygon is None or point_in_polygon(seat['x'], seat['y'], polygon))
+        ]
+        return {"success": True, "seats": seats, "count": len(seats)}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error querying seat range: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@api_router.get("/seats/{property_id}/layout/nearest")
+async def get_nearest_seats(
+    property_id: str,
+    x: float,
+    y: float,
+    count: int = 1,
+    date: Optional[str] = None,
+    freeOnly: bool = True,
+    seatTypeId: Optional[str] = None,
+    sectionId: Optional[str] = None
+):
+    """Get the seats closest to a point (e.g. the nearest free lounger to the bar)"""
+    try:
+        if count < 1 or count > 100:
+            raise HTTPException(status_code=400, detail="count must be between 1 and 100")
+        
+        layout = await seat_layout_index.get(property_id)
+        accept = await seat_filter(property_id, date, freeOnly, seatTypeId, sectionId)
+        nearest = seat_layout_index.nearest(layout, x, y, count, accept)
+        return {"success": True, "seats": [layout_seat(seat, distance) for distance, seat in nearest]}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error querying nearest seats: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@api_router.get("/seats/{property_id}/layout/suggest")
+async def suggest_adjacent_seats(
+    property_id: str,
+    size: int = 2,
+    x: Optional[float] = None,
+    y: Optional[float] = None,
+    maxDistance: Optional[float] = None,
+    date: Optional[str] = None,
+    seatTypeId: Optional[str] = None,
+    sectionId: Optional[str] = None,
+    limit: int = 5
+):
+    """Suggest groups of free seats next to each other, nearest to a point if given"""
+    try:
+        if size < 1 or size > 50 or limit < 1 or limit > 50:
+            raise HTTPException(status_code=400, detail="size and limit must be between 1 and 50")
+        
+        layout = await seat_layout_index.get(property_id)
+        accept = await seat_filter(property_id, date, True, seatTypeId, sectionId)
+        groups = seat_layout_index.suggest_groups(layout, size, accept, x, y, maxDistance, limit)
+        return {
+            "success": True,
+            "suggestions": [{"seatIds": [seat['id'] for seat in group], "seats": [layout_seat(seat) for seat in group]} for group in groups]
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error suggesting seats: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@api_router.get("/seats/{property_id}/layout/blocks")
+async def find_seat_blocks(
+    property_id: str,
+    size: int,
+    date: Optional[str] = None,
+    sectionId: Optional[str] = None,
+    seatTypeId: Optional[str] = None,
+    limit: int = 10
+):
+    """Find runs of consecutively numbered free seats for a group, tightest fit first"""
+    try:
+        if size < 1 or size > 50 or limit < 1 or limit > 100:
+            raise HTTPException(status_code=400, detail="size must be between 1 and 50 and limit between 1 and 100")
+        
+        layout = await seat_layout_index.get(property_id)
+        accept = await seat_filter(property_id, date, True, seatTypeId, sectionId)
+        
+        # Smallest runs first, so large runs aren't broken up for small groups
+        runs = sorted(seat_layout_index.free_runs(layout, size, accept), key=lambda run: len(run["seats"]))[:limit]
+        blocks = [
+            {
+                "sectionId": run["sectionId"],
+                "seatTypeId": run["seatTypeId"],
+                "prefix": run["prefix"],
+                "suffix": run["suffix"],
+                "runLength": len(run["seats"]),
+                "seatIds": [seat['id'] for seat in run["seats"][:size]],
+                "seatNumbers": [seat['seatNumber'] for seat in run["seats"][:size]],
+                "runSeatIds": [seat['id'] for seat in run["seats"]]
+            }
+            for run in runs
+        ]
+        return {"success": True, "blocks": blocks, "count": len(blocks)}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error finding seat blocks: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
 # ============= DEVICE ENDPOINTS =============
 
 @api_router.get("/devices/{property_id}")
-async def get_devices_by_property(property_id: str):
+async def get_devices_by_property(property_id: str, fields: Optional[str] = None):
     """Get all devices for a property"""
     try:
-        devices = await db.devices.find({"propertyId": property_id}, {"_id": 0}).to_list(1000)
+        devices = await db.devices.find({"propertyId": property_id}, build_list_projection("devices", fields)).to_list(1000)
         logger.info(f"Fetched {len(devices)} devices for property {property_id}")
         return {"success": True, "devices": devices}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching devices: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
@@ -1730,7 +3072,14 @@ async def create_device(device: DeviceCreate):
         device_dict['createdAt'] = device_dict['createdAt'].isoformat()
         device_dict['updatedAt'] = device_dict['updatedAt'].isoformat()
         
-        await db.devices.insert_one(device_dict)
+        try:
+            await db.devices.insert_one(device_dict)
+        except DuplicateKeyError:
+            raise HTTPException(status_code=400, detail=f"Device ID {device.deviceId} already exists")
+        await bump_counters(new_device.propertyId, {"devices.total": 1, "devices.enabled": 1})
+        availability_index.reset(new_device.propertyId)  # Refresh the free-device pool
+        device_routes.reset(new_device.propertyId)
+        device_last_seen.reset(new_device.propertyId)
         
         logger.info(f"Device created: {new_device.deviceId}")
         return new_device
@@ -1741,6 +3090,81 @@ async def create_device(device: DeviceCreate):
         logger.error(f"Error creating device: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+@api_router.post("/devices/bulk")
+async def create_devices_bulk(device_data: DeviceBulkCreate):
+    """Create multiple devices from a list and/or a numbered range, skipping existing IDs"""
+    try:
+        device_ids = list(device_data.deviceIds)
+        
+        if device_data.startNumber is not None or device_data.endNumber is not None:
+            if device_data.startNumber is None or device_data.endNumber is None:
+                raise HTTPException(status_code=400, detail="Both start number and end number are required for a range")
+            if device_data.startNumber > device_data.endNumber:
+                raise HTTPException(status_code=400, detail="Start number must be less than or equal to end number")
+            # Size the request before expanding the range, so a huge range isn't built just to be refused
+            if device_data.endNumber - device_data.startNumber + 1 + len(device_ids) > 1000:
+                raise HTTPException(status_code=400, detail="Cannot create more than 1000 devices at once")
+            
+            # Determine padding length based on end number
+            padding_length = len(str(device_data.endNumber))
+            for num in range(device_data.startNumber, device_data.endNumber + 1):
+                device_ids.append(f"{device_data.prefix}{str(num).zfill(padding_length)}{device_data.suffix}")
+        
+        device_ids = list(dict.fromkeys(d.strip() for d in device_ids if d and d.strip()))
+        if not device_ids:
+            raise HTTPException(status_code=400, detail="No device IDs provided")
+        if len(device_ids) > 1000:
+            raise HTTPException(status_code=400, detail="Cannot create more than 1000 devices at once")
+        
+        # Skip existing devices up front: the unique index can't be relied on alone, as it
+        # isn't built while a property has legacy duplicates
+        existing = set(await db.devices.distinct(
+            "deviceId", {"propertyId": device_data.propertyId, "deviceId": {"$in": device_ids}}
+        ))
+        skipped = [physical_id for physical_id in device_ids if physical_id in existing]
+        
+        devices = []
+        for physical_id in device_ids:
+            if physical_id in existing:
+                continue
+            device_doc = Device(propertyId=device_data.propertyId, deviceId=physical_id).model_dump()
+            device_doc['createdAt'] = device_doc['createdAt'].isoformat()
+            device_doc['updatedAt'] = device_doc['updatedAt'].isoformat()
+            devices.append(device_doc)
+        
+        # Devices created concurrently are still rejected by the index; unordered so the rest still go in
+        created = 0
+        if devices:
+            try:
+                result = await db.devices.insert_many(devices, ordered=False)
+                created = len(result.inserted_ids)
+            except BulkWriteError as e:
+                write_errors = e.details.get('writeErrors', [])
+                if any(err.get('code') != 11000 for err in write_errors):
+                    raise
+                skipped.extend(err['op']['deviceId'] for err in write_errors)
+                created = e.details.get('nInserted', 0)
+        
+        if created:
+            availability_index.reset(device_data.propertyId)  # Refresh the free-device pool
+            device_routes.reset(device_data.propertyId)
+            device_last_seen.reset(device_data.propertyId)
+            await bump_counters(device_data.propertyId, {"devices.total": created, "devices.enabled": created})
+        
+        logger.info(f"Created {created} devices for property {device_data.propertyId}, skipped {len(skipped)} duplicates")
+        return {
+            "success": True,
+            "message": f"Successfully created {created} devices" + (f", skipped {len(skipped)} existing" if skipped else ""),
+            "count": created,
+            "skipped": skipped
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error creating devices: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
 @api_router.put("/devices/{device_id}")
 async def update_device(device_id: str, device: DeviceUpdate):
     """Update a device"""
@@ -1752,15 +3176,25 @@ async def update_device(device_id: str, device: DeviceUpdate):
         
         update_data['updatedAt'] = datetime.now(timezone.utc).isoformat()
         
-        result = await db.devices.update_one(
-            {"id": device_id},
-            {"$set": update_data}
-        )
-        
-        if result.matched_count == 0:
+        try:
+            old_device = await db.devices.find_one_and_update(
+                {"id": device_id},
+                {"$set": update_data},
+                projection={"_id": 0, "enabled": 1},
+                return_document=ReturnDocument.BEFORE
+            )
+        except DuplicateKeyError:
+            raise HTTPException(status_code=400, detail=f"Device ID {update_data['deviceId']} already exists")
+
+        if not old_device:
             raise HTTPException(status_code=404, detail="Device not found")
-        
+
         updated_device = await db.devices.find_one({"id": device_id}, {"_id": 0})
+        availability_index.reset(updated_device['propertyId'])  # Refresh the free-device pool
+        device_routes.reset(updated_device['propertyId'])
+        device_last_seen.reset(updated_device['propertyId'])
+        if 'enabled' in update_data and update_data['enabled'] != old_device.get('enabled', True):
+            await bump_counters(updated_device['propertyId'], {"devices.enabled": 1 if update_data['enabled'] else -1})
         
         logger.info(f"Device updated: {device_id}")
         return {"success": True, "device": updated_device}
@@ -1775,10 +3209,16 @@ async def update_device(device_id: str, device: DeviceUpdate):
 async def delete_device(device_id: str):
     """Delete a device"""
     try:
-        result = await db.devices.delete_one({"id": device_id})
+        deleted_device = await db.devices.find_one_and_delete({"id": device_id}, projection={"_id": 0, "propertyId": 1, "enabled": 1})
         
-        if result.deleted_count == 0:
+        if not deleted_device:
             raise HTTPException(status_code=404, detail="Device not found")
+        availability_index.reset(deleted_device['propertyId'])  # Refresh the free-device pool
+        device_routes.reset(deleted_device['propertyId'])
+        device_last_seen.reset(deleted_device['propertyId'])
+        await bump_counters(deleted_device['propertyId'], {
+            "devices.total": -1, "devices.enabled": -1 if deleted_device.get('enabled', True) else 0
+        })
         
         logger.info(f"Device deleted: {device_id}")
         return {"success": True, "message": "Device deleted successfully"}
@@ -1790,57 +3230,74 @@ async def delete_device(device_id: str):
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 # Section CRUD Endpoints
+async def move_seats_to_section(section_id: str, seat_ids: List[str], session=None):
+    """Point seats at a section and drop them from any other section's seatIds"""
+    await db.sections.update_many(
+        {"id": {"$ne": section_id}, "seatIds": {"$in": seat_ids}},
+        {"$pull": {"seatIds": {"$in": seat_ids}}},
+        session=session
+    )
+    await db.seats.update_many(
+        {"id": {"$in": seat_ids}},
+        {"$set": {"sectionId": section_id}},
+        session=session
+    )
+
 @api_router.post("/sections")
 async def create_section(section: SectionCreate):
     """Create a new section"""
     try:
+        validate_zone(section.zone)
         group_obj = Section(**section.model_dump())
+        group_obj.seatIds = list(dict.fromkeys(group_obj.seatIds))
         
         # Convert to dict and serialize datetime
         doc = group_obj.model_dump()
         doc['createdAt'] = doc['createdAt'].isoformat()
         doc['updatedAt'] = doc['updatedAt'].isoformat()
         
-        await db.sections.insert_one(doc)
+        # Section and seat sectionIds are written together
+        async def write(session):
+            await db.sections.insert_one(doc, session=session)
+            if group_obj.seatIds:
+                await move_seats_to_section(group_obj.id, group_obj.seatIds, session)
         
-        # Update seats with this section ID
+        await run_in_transaction(write)
         if group_obj.seatIds:
-            await db.seats.update_many(
-                {"id": {"$in": group_obj.seatIds}},
-                {"$set": {"sectionId": group_obj.id}}
-            )
             logger.info(f"Updated {len(group_obj.seatIds)} seats with sectionId: {group_obj.id}")
+        seat_layout_index.reset(group_obj.propertyId)
         
         logger.info(f"Section created: {group_obj.id}")
         return {"success": True, "section": group_obj}
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error creating section: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @api_router.get("/sections/{property_id}")
-async def get_sections(property_id: str):
+async def get_sections(property_id: str, fields: Optional[str] = None):
     """Get all sections for a property"""
     try:
         sections = await db.sections.find(
             {"propertyId": property_id},
-            {"_id": 0}
+            build_list_projection("sections", fields)
         ).to_list(1000)
         
         return {"success": True, "sections": sections}
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching sections: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @api_router.put("/sections/{group_id}")
-async def update_section(section_id: str, update_data: SectionUpdate):
+async def update_section(group_id: str, update_data: SectionUpdate):
     """Update a section"""
     try:
-        # Get the old section to compare seat assignments
-        old_group = await db.sections.find_one({"id": group_id}, {"_id": 0})
-        if not old_group:
-            raise HTTPException(status_code=404, detail="Section not found")
+        validate_zone(update_data.zone)
         
         update_dict = {k: v for k, v in update_data.model_dump().items() if v is not None}
         
@@ -1848,37 +3305,48 @@ async def update_section(section_id: str, update_data: SectionUpdate):
             raise HTTPException(status_code=400, detail="No fields to update")
         
         update_dict['updatedAt'] = datetime.now(timezone.utc).isoformat()
-        
-        result = await db.sections.update_one(
-            {"id": group_id},
-            {"$set": update_dict}
-        )
-        
-        # Handle seat assignments if seatIds was updated
         if 'seatIds' in update_dict:
-            new_seat_ids = update_dict['seatIds']
-            old_seat_ids = old_group.get('seatIds', [])
-            
-            # Remove sectionId from seats that are no longer in this section
-            removed_seats = [sid for sid in old_seat_ids if sid not in new_seat_ids]
-            if removed_seats:
-                await db.seats.update_many(
-                    {"id": {"$in": removed_seats}, "sectionId": group_id},
-                    {"$set": {"sectionId": ""}}
-                )
-                logger.info(f"Removed sectionId from {len(removed_seats)} seats")
+            update_dict['seatIds'] = list(dict.fromkeys(update_dict['seatIds']))
+        
+        # The section and its seats' sectionId change in one transaction
+        async def write(session):
+            # Read the old section in the same write, so the diff is against what we replaced
+            old_group = await db.sections.find_one_and_update(
+                {"id": group_id},
+                {"$set": update_dict},
+                projection={"_id": 0},
+                return_document=ReturnDocument.BEFORE,
+                session=session
+            )
+            if not old_group:
+                return None
             
-            # Add sectionId to new seats
-            added_seats = [sid for sid in new_seat_ids if sid not in old_seat_ids]
-            if added_seats:
-                await db.seats.update_many(
-                    {"id": {"$in": added_seats}},
-                    {"$set": {"sectionId": group_id}}
-                )
-                logger.info(f"Added sectionId to {len(added_seats)} seats")
+            if 'seatIds' in update_dict:
+                new_seat_ids = set(update_dict['seatIds'])
+                old_seat_ids = set(old_group.get('seatIds', []))
+                
+                # Remove sectionId from seats that are no longer in this section
+                removed_seats = list(old_seat_ids - new_seat_ids)
+                if removed_seats:
+                    await db.seats.update_many(
+                        {"id": {"$in": removed_seats}, "sectionId": group_id},
+                        {"$set": {"sectionId": ""}},
+                        session=session
+                    )
+                
+                # Add sectionId to new seats
+                added_seats = list(new_seat_ids - old_seat_ids)
+                if added_seats:
+                    await move_seats_to_section(group_id, added_seats, session)
+                logger.info(f"Section {group_id}: {len(added_seats)} seats added, {len(removed_seats)} removed")
+            return old_group
+        
+        if not await run_in_transaction(write):
+            raise HTTPException(status_code=404, detail="Section not found")
         
         # Get updated section
         updated_group = await db.sections.find_one({"id": group_id}, {"_id": 0})
+        seat_layout_index.reset(updated_group['propertyId'])
         
         logger.info(f"Section updated: {group_id}")
         return {"success": True, "section": updated_group}
@@ -1890,16 +3358,20 @@ async def update_section(section_id: str, update_data: SectionUpdate):
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @api_router.delete("/sections/{group_id}")
-async def delete_section(section_id: str):
+async def delete_section(group_id: str):
     """Delete a section"""
     try:
-        result = await db.sections.delete_one({"id": group_id})
+        deleted_group = await db.sections.find_one_and_delete({"id": group_id}, projection={"_id": 0, "propertyId": 1})
         
-        if result.deleted_count == 0:
+        if not deleted_group:
             raise HTTPException(status_code=404, detail="Section not found")
+        seat_layout_index.reset(deleted_group['propertyId'])
+        
+        # Seats still pointing at the section are cleared in the background
+        job_id = await enqueue_cascade("section", group_id)
         
         logger.info(f"Section deleted: {group_id}")
-        return {"success": True, "message": "Section deleted successfully"}
+        return {"success": True, "message": "Section deleted successfully", "cleanupJobId": job_id}
         
     except HTTPException:
         raise
@@ -1907,6 +3379,105 @@ async def delete_section(section_id: str):
         logger.error(f"Error deleting section: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+SECTION_RECONCILE_INTERVAL_SECONDS = 15 * 60
+SECTION_RECONCILE_BATCH_SIZE = 500
+SECTION_RECONCILE_BATCH_PAUSE_SECONDS = 0.05
+
+async def reconcile_section_memberships(property_id: Optional[str] = None) -> dict:
+    """Repair drift between Section.seatIds and Seat.sectionId.
+
+    A seat listed by a section belongs to it; if several sections list it, the one its
+    sectionId names (else the first) keeps it. A seat no section lists joins the section
+    its sectionId names if that exists, otherwise its sectionId is cleared. IDs of deleted
+    seats are dropped. Fixes go out in batches with a short pause between them.
+    """
+    if property_id:
+        property_ids = [property_id]
+    else:
+        property_ids = set(await db.sections.distinct("propertyId"))
+        property_ids.update(await db.seats.distinct("propertyId", {"sectionId": {"$nin": [None, ""]}}))
+    
+    report = {"properties": 0, "seatsUpdated": 0, "sectionsUpdated": 0}
+    for pid in property_ids:
+        # Seats are read before sections: a section update that commits in between then
+        # shows up as a seat whose sectionId has moved on, which the re-check below skips
+        seats = {
+            seat['id']: seat.get('sectionId') async for seat in db.seats.find(
+                {"propertyId": pid}, {"_id": 0, "id": 1, "sectionId": 1}
+            )
+        }
+        sections = await db.sections.find({"propertyId": pid}, {"_id": 0, "id": 1, "seatIds": 1}).to_list(None)
+        section_ids = {section['id'] for section in sections}
+        
+        owner = {}
+        pulls = {}
+        for section in sections:
+            for seat_id in section.get('seatIds', []):
+                if seat_id not in seats:
+                    pulls.setdefault(section['id'], set()).add(seat_id)
+                elif seat_id not in owner:
+                    owner[seat_id] = section['id']
+                elif seats[seat_id] == section['id']:
+                    pulls.setdefault(owner[seat_id], set()).add(seat_id)
+                    owner[seat_id] = section['id']
+                else:
+                    pulls.setdefault(section['id'], set()).add(seat_id)
+        
+        fixes = {}
+        adds = {}
+        for seat_id, section_id in seats.items():
+            if seat_id not in owner and section_id in section_ids:
+                adds.setdefault(section_id, set()).add(seat_id)
+                continue
+            expected = owner.get(seat_id, "")
+            if (section_id or "") != expected:
+                fixes[seat_id] = expected
+        
+        # Leave seats whose membership changed since they were read to the next pass
+        touched = set(fixes).union(*adds.values(), *pulls.values()).intersection(seats)
+        if touched:
+            async for seat in db.seats.find({"id": {"$in": list(touched)}}, {"_id": 0, "id": 1, "sectionId": 1}):
+                if seat.get('sectionId') != seats[seat['id']]:
+                    fixes.pop(seat['id'], None)
+                    for seat_ids in (*adds.values(), *pulls.values()):
+                        seat_ids.discard(seat['id'])
+        
+        writes = []
+        for seat_id, expected in fixes.items():
+            # Guarded on the value we read, so a concurrent move isn't overwritten
+            writes.append(("seats", UpdateOne({"id": seat_id, "sectionId": seats[seat_id]}, {"$set": {"sectionId": expected}})))
+        for section_id, seat_ids in pulls.items():
+            if seat_ids:
+                writes.append(("sections", UpdateOne({"id": section_id}, {"$pull": {"seatIds": {"$in": list(seat_ids)}}})))
+        for section_id, seat_ids in adds.items():
+            if seat_ids:
+                writes.append(("sections", UpdateOne({"id": section_id}, {"$addToSet": {"seatIds": {"$each": list(seat_ids)}}})))
+        
+        for start in range(0, len(writes), SECTION_RECONCILE_BATCH_SIZE):
+            batch = writes[start:start + SECTION_RECONCILE_BATCH_SIZE]
+            for collection in ("seats", "sections"):
+                ops = [op for name, op in batch if name == collection]
+                if ops:
+                    result = await db[collection].bulk_write(ops, ordered=False)
+                    report[f"{collection}Updated"] += result.modified_count
+            await asyncio.sleep(SECTION_RECONCILE_BATCH_PAUSE_SECONDS)
+        
+        if writes:
+            seat_layout_index.reset(pid)
+        report["properties"] += 1
+    return report
+
+async def section_reconcile_loop():
+    """Background task: periodically repair section membership drift"""
+    while True:
+        await asyncio.sleep(SECTION_RECONCILE_INTERVAL_SECONDS)
+        try:
+            report = await reconcile_section_memberships()
+            if report["seatsUpdated"] or report["sectionsUpdated"]:
+                logger.warning(f"Repaired section membership drift: {report}")
+        except Exception as e:
+            logger.error(f"Error reconciling section memberships: {str(e)}")
+
 # Staff CRUD Endpoints
 @api_router.post("/staff")
 async def create_staff(staff: StaffCreate):
@@ -1925,6 +3496,8 @@ async def create_staff(staff: StaffCreate):
         doc['updatedAt'] = doc['updatedAt'].isoformat()
         
         await db.staff.insert_one(doc)
+        await bump_counters(staff_obj.propertyId, {"staff.total": 1, f"staff.byRole.{staff_obj.roleId}": 1})
+        staffing.reset(staff_obj.propertyId)
         
         logger.info(f"Staff created: {staff_obj.id}")
         return {"success": True, "staff": staff_obj}
@@ -1936,16 +3509,18 @@ async def create_staff(staff: StaffCreate):
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @api_router.get("/staff/{property_id}")
-async def get_staff(property_id: str):
+async def get_staff(property_id: str, fields: Optional[str] = None):
     """Get all staff for a property"""
     try:
         staff_list = await db.staff.find(
             {"propertyId": property_id},
-            {"_id": 0, "password": 0}  # Don't return passwords
+            build_list_projection("staff", fields, exclude=["password"])  # Don't return passwords
         ).to_list(1000)
         
         return {"success": True, "staff": staff_list}
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching staff: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
@@ -1970,13 +3545,20 @@ async def update_staff(staff_id: str, update_data: StaffUpdate):
         
         update_dict['updatedAt'] = datetime.now(timezone.utc).isoformat()
         
-        result = await db.staff.update_one(
+        old_staff = await db.staff.find_one_and_update(
             {"id": staff_id},
-            {"$set": update_dict}
+            {"$set": update_dict},
+            projection={"_id": 0, "propertyId": 1, "roleId": 1},
+            return_document=ReturnDocument.BEFORE
         )
         
-        if result.matched_count == 0:
+        if not old_staff:
             raise HTTPException(status_code=404, detail="Staff member not found")
+        if 'roleId' in update_dict and update_dict['roleId'] != old_staff.get('roleId'):
+            await bump_counters(old_staff['propertyId'], {
+                f"staff.byRole.{old_staff.get('roleId')}": -1, f"staff.byRole.{update_dict['roleId']}": 1
+            })
+            staffing.reset(old_staff['propertyId'])
         
         # Get updated staff (without password)
         updated_staff = await db.staff.find_one({"id": staff_id}, {"_id": 0, "password": 0})
@@ -1994,10 +3576,15 @@ async def update_staff(staff_id: str, update_data: StaffUpdate):
 async def delete_staff(staff_id: str):
     """Delete a staff member"""
     try:
-        result = await db.staff.delete_one({"id": staff_id})
+        deleted_staff = await db.staff.find_one_and_delete({"id": staff_id}, projection={"_id": 0, "propertyId": 1, "roleId": 1})
         
-        if result.deleted_count == 0:
+        if not deleted_staff:
             raise HTTPException(status_code=404, detail="Staff member not found")
+        await bump_counters(deleted_staff['propertyId'], {
+            "staff.total": -1, f"staff.byRole.{deleted_staff.get('roleId')}": -1
+        })
+        await presence.check_out(staff_id, deleted_staff['propertyId'], "deleted")
+        staffing.reset(deleted_staff['propertyId'])
         
         logger.info(f"Staff deleted: {staff_id}")
         return {"success": True, "message": "Staff member deleted successfully"}
@@ -2229,15 +3816,17 @@ async def delete_role(role_id: str):
 
 # Menu Category Endpoints
 @api_router.get("/menu-categories/{property_id}")
-async def get_menu_categories(property_id: str):
+async def get_menu_categories(property_id: str, fields: Optional[str] = None):
     """Get all menu categories for a property"""
     try:
         categories = await db.menu_categories.find(
             {"propertyId": property_id},
-            {"_id": 0}
+            build_list_projection("menu_categories", fields)
         ).sort("displayOrder", 1).to_list(1000)
         
         return {"success": True, "categories": categories}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching menu categories: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
@@ -2311,15 +3900,17 @@ async def delete_menu_category(category_id: str):
 
 # Menu Tag Endpoints
 @api_router.get("/menu-tags/{property_id}")
-async def get_menu_tags(property_id: str):
+async def get_menu_tags(property_id: str, fields: Optional[str] = None):
     """Get all menu tags for a property"""
     try:
         tags = await db.menu_tags.find(
             {"propertyId": property_id},
-            {"_id": 0}
+            build_list_projection("menu_tags", fields)
         ).to_list(1000)
         
         return {"success": True, "tags": tags}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching menu tags: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
@@ -2390,15 +3981,17 @@ async def delete_menu_tag(tag_id: str):
 
 # Dietary Restriction Endpoints
 @api_router.get("/dietary-restrictions/{property_id}")
-async def get_dietary_restrictions(property_id: str):
+async def get_dietary_restrictions(property_id: str, fields: Optional[str] = None):
     """Get all dietary restrictions for a property"""
     try:
         restrictions = await db.dietary_restrictions.find(
             {"propertyId": property_id},
-            {"_id": 0}
+            build_list_projection("dietary_restrictions", fields)
         ).to_list(1000)
         
         return {"success": True, "restrictions": restrictions}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching dietary restrictions: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
@@ -2469,15 +4062,17 @@ async def delete_dietary_restriction(restriction_id: str):
 
 # Menu Item Endpoints
 @api_router.get("/menu-items/{property_id}")
-async def get_menu_items(property_id: str):
+async def get_menu_items(property_id: str, fields: Optional[str] = None):
     """Get all menu items for a property"""
     try:
         items = await db.menu_items.find(
             {"propertyId": property_id},
-            {"_id": 0}
+            build_list_projection("menu_items", fields)
         ).to_list(1000)
         
         return {"success": True, "items": items}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching menu items: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
@@ -2538,8 +4133,10 @@ async def delete_menu_item(item_id: str):
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Item not found")
         
+        job_id = await enqueue_cascade("menu_item", item_id)
+        
         logger.info(f"Menu item deleted: {item_id}")
-        return {"success": True, "message": "Menu item deleted successfully"}
+        return {"success": True, "message": "Menu item deleted successfully", "cleanupJobId": job_id}
     except HTTPException:
         raise
     except Exception as e:
@@ -2548,15 +4145,17 @@ async def delete_menu_item(item_id: str):
 
 # Menu Endpoints (Collection of items)
 @api_router.get("/menus/{property_id}")
-async def get_menus(property_id: str):
+async def get_menus(property_id: str, fields: Optional[str] = None):
     """Get all menus for a property"""
     try:
         menus = await db.menus.find(
             {"propertyId": property_id},
-            {"_id": 0}
+            build_list_projection("menus", fields)
         ).to_list(1000)
         
         return {"success": True, "menus": menus}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching menus: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
@@ -2718,12 +4317,14 @@ async def create_or_update_configuration(config: ConfigurationCreate):
 # ============= GUEST ENDPOINTS =============
 
 @api_router.get("/guests/{property_id}")
-async def get_guests_by_property(property_id: str):
+async def get_guests_by_property(property_id: str, fields: Optional[str] = None):
     """Get all guests for a property"""
     try:
-        guests = await db.guests.find({"propertyId": property_id}, {"_id": 0}).to_list(10000)
+        guests = await db.guests.find({"propertyId": property_id}, build_list_projection("guests", fields)).to_list(10000)
         logger.info(f"Fetched {len(guests)} guests for property {property_id}")
         return {"success": True, "guests": guests}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching guests: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
@@ -2861,19 +4462,1538 @@ async def clear_all_guests(property_id: str):
         logger.error(f"Error clearing guests: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+# ============= ALLOCATION AVAILABILITY INDEX =============
+
+class AllocationAvailabilityIndex:
+    """In-process index of the seats and devices held by open allocations, per property and date.
+
+    An entry is loaded from Mongo the first time a property/date is asked for and is then
+    kept current by the allocation write paths, so availability lookups don't rescan
+    allocations. Held seats and devices map to the ids of the open allocations holding
+    them, so releasing one of two double-booked allocations leaves the resource held and
+    writes replayed over a load that already saw them are not counted twice. Each entry
+    also keeps the pool of enabled devices nobody holds, so auto-assignment can take one
+    in O(1). The API runs as a single process; verify() compares an entry against Mongo
+    and can repair it.
+    """
+    RESOURCE_FIELDS = {"seat": "seatIds", "device": "deviceIds"}
+    
+    def __init__(self):
+        self._entries = {}  # (propertyId, date) -> {"seat", "device": {id: allocation ids}, "enabledDevice", "freeDevice": set}
+        self._pending = {}  # keys being loaded -> writes seen meanwhile, replayed after the load
+        self._locks = {}
+    
+    async def _load(self, property_id: str, allocation_date: str) -> dict:
+        entry = {resource: {} for resource in self.RESOURCE_FIELDS}
+        async for allocation in db.allocations.find(
+            {"propertyId": property_id, "allocationDate": allocation_date, "status": {"$ne": "Complete"}},
+            {"_id": 0, "id": 1, "seatIds": 1, "deviceIds": 1}
+        ):
+            for resource, field in self.RESOURCE_FIELDS.items():
+                for resource_id in allocation.get(field) or []:
+                    entry[resource].setdefault(resource_id, set()).add(allocation['id'])
+        
+        entry["enabledDevice"] = {
+            device['id'] async for device in db.devices.find(
+                {"propertyId": property_id, "enabled": True}, {"_id": 0, "id": 1}
+            )
+        }
+        entry["freeDevice"] = entry["enabledDevice"].difference(entry["device"])
+        return entry
+    
+    def _evict_past_dates(self):
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=1)).strftime('%Y-%m-%d')
+        for key in [key for key in self._entries if key[1] < cutoff]:
+            del self._entries[key]
+            self._locks.pop(key, None)
+    
+    async def get(self, property_id: str, allocation_date: str) -> dict:
+        """Return the entry for a date: held "seat"/"device" holders plus the "freeDevice" pool"""
+        key = (property_id, allocation_date)
+        entry = self._entries.get(key)
+        if entry is not None:
+            return entry
+        
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            entry = self._entries.get(key)
+            if entry is None:
+                self._pending[key] = []
+                try:
+                    entry = await self._load(property_id, allocation_date)
+                    for op, allocation in self._pending[key]:
+                        self._apply(entry, op, allocation)
+                    self._evict_past_dates()
+                    self._entries[key] = entry
+                finally:
+                    del self._pending[key]
+        return entry
+    
+    def _apply(self, entry: dict, op: str, allocation: dict):
+        for resource, field in self.RESOURCE_FIELDS.items():
+            held = entry[resource]
+            for resource_id in allocation.get(field) or []:
+                if op == "add":
+                    held.setdefault(resource_id, set()).add(allocation['id'])
+                elif resource_id in held:
+                    held[resource_id].discard(allocation['id'])
+                    if not held[resource_id]:
+                        del held[resource_id]
+        
+        device_ids = allocation.get('deviceIds') or []
+        if op == "add":
+            entry["freeDevice"].difference_update(device_ids)
+        else:
+            entry["freeDevice"].update(
+                device_id for device_id in entry["enabledDevice"].intersection(device_ids) if device_id not in entry["device"]
+            )
+    
+    def _record(self, op: str, allocation: dict):
+        key = (allocation['propertyId'], allocation['allocationDate'])
+        if key in self._pending:
+            self._pending[key].append((op, allocation))
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._apply(entry, op, allocation)
+    
+    def reset(self, property_id: Optional[str] = None):
+        """Forget entries (all, or one property's); they reload from Mongo on next use"""
+        if property_id is None:
+            self._entries.clear()
+            return
+        for key in [key for key in self._entries if key[0] == property_id]:
+            del self._entries[key]
+    
+    async def take_free_device(self, property_id: str, allocation_date: str, preferred: List[str] = ()) -> Optional[str]:
+        """Remove an enabled, unheld device from the pool, trying the preferred ones first"""
+        pool = (await self.get(property_id, allocation_date))["freeDevice"]
+        for device_id in preferred:
+            if device_id in pool:
+                pool.discard(device_id)
+                return device_id
+        return pool.pop() if pool else None
+    
+    def return_device(self, property_id: str, allocation_date: str, device_id: str):
+        """Put back a device taken from the pool whose allocation was not written"""
+        entry = self._entries.get((property_id, allocation_date))
+        if entry is not None and device_id in entry["enabledDevice"] and device_id not in entry["device"]:
+            entry["freeDevice"].add(device_id)
+    
+    def add_allocation(self, allocation: dict):
+        """Mark an allocation's seats and devices as held"""
+        self._record("add", allocation)
+    
+    def release_allocation(self, allocation: dict):
+        """Mark an allocation's seats and devices as free again"""
+        self._record("remove", allocation)
+    
+    async def verify(self, property_id: str, allocation_date: str, repair: bool = False) -> dict:
+        """Compare an entry with Mongo, optionally replacing it with the fresh state"""
+        key = (property_id, allocation_date)
+        fresh = await self._load(property_id, allocation_date)
+        entry = self._entries.get(key)
+        
+        report = {"loaded": entry is not None}
+        consistent = True
+        for resource in fresh:
+            current = entry[resource] if entry is not None else fresh[resource]
+            missing = sorted(set(fresh[resource]) - set(current))
+            stale = sorted(set(current) - set(fresh[resource]))
+            consistent = consistent and not missing and not stale
+            report[resource] = {"missing": missing, "stale": stale}
+        report["consistent"] = consistent
+        
+        if repair and entry is not None and not consistent:
+            self._entries[key] = fresh
+            report["repaired"] = True
+        return report
+
+availability_index = AllocationAvailabilityIndex()
+
+# ============= DEVICE ROUTING =============
+
+DEVICE_PRESS_DEDUPE_SECONDS = 10
+DEVICE_EVENT_BATCH_LIMIT = 1000
+DEVICE_EVENT_CONCURRENCY = 16
+# Call-button actions and the calling flag each one sets
+DEVICE_ACTIONS = {"call": "Calling", "checkout": "Calling for Checkout", "cancel": "Non Calling"}
+
+class DeviceRouteIndex:
+    """Physical device ID -> the open allocation holding that device, per property.
+
+    Built from Mongo the first time a property's devices report each day, then kept
+    current by the allocation write paths (and reset when devices change), so a button
+    press costs no lookups. A device held on several dates rings today's allocation. Each
+    route also caches the allocation's calling flag, so presses that wouldn't change it
+    are answered without a write, and remembers the last accepted press per action for
+    the dedupe window.
+    """
+    
+    def __init__(self):
+        self._properties = {}  # propertyId -> {"devices": {deviceId: Device.id}, "routes": {Device.id: route}}
+        self._stale = set()
+        self._locks = {}
+    
+    async def _load(self, property_id: str) -> dict:
+        entry = {
+            "day": datetime.now(timezone.utc).strftime('%Y-%m-%d'),
+            "devices": {
+                device['deviceId']: device['id'] async for device in db.devices.find(
+                    {"propertyId": property_id, "enabled": {"$ne": False}}, {"_id": 0, "id": 1, "deviceId": 1}
+                )
+            },
+            "routes": {}
+        }
+        async for allocation in db.allocations.find(
+            {"propertyId": property_id, "status": {"$ne": "Complete"}, "deviceIds.0": {"$exists": True}},
+            {"_id": 0, "id": 1, "propertyId": 1, "deviceIds": 1, "allocationDate": 1, "callingFlag": 1}
+        ):
+            self._route(entry, allocation)
+        return entry
+    
+    async def get(self, property_id: str) -> dict:
+        entry = self._properties.get(property_id)
+        if entry is not None and entry["day"] == datetime.now(timezone.utc).strftime('%Y-%m-%d'):
+            return entry
+        async with self._locks.setdefault(property_id, asyncio.Lock()):
+            entry = self._properties.get(property_id)
+            if entry is not None and entry["day"] != datetime.now(timezone.utc).strftime('%Y-%m-%d'):
+                del self._properties[property_id]
+            while property_id not in self._properties:
+                self._stale.discard(property_id)
+                entry = await self._load(property_id)
+                if property_id not in self._stale:
+                    self._properties[property_id] = entry
+        return self._properties[property_id]
+    
+    def _entry_for(self, property_id: str) -> Optional[dict]:
+        entry = self._properties.get(property_id)
+        if entry is None:
+            self._stale.add(property_id)  # Redo a load that may have missed this write
+        return entry
+    
+    @staticmethod
+    def _route(entry: dict, allocation: dict):
+        for device_id in allocation.get('deviceIds') or []:
+            current = entry["routes"].get(device_id)
+            # Today's allocation wins, then the one with the latest date
+            if current and current["allocationId"] != allocation['id'] and (
+                allocation['allocationDate'] != entry["day"] and
+                (current["allocationDate"] == entry["day"] or current["allocationDate"] > allocation['allocationDate'])
+            ):
+                continue
+            entry["routes"][device_id] = {
+                "allocationId": allocation['id'],
+                "allocationDate": allocation['allocationDate'],
+                "callingFlag": allocation.get('callingFlag', "Non Calling"),
+                "pressed": {}
+            }
+    
+    def add_allocation(self, allocation: dict):
+        entry = self._entry_for(allocation['propertyId'])
+        if entry is not None:
+            self._route(entry, allocation)
+    
+    def release_allocation(self, allocation: dict):
+        entry = self._entry_for(allocation['propertyId'])
+        if entry is None:
+            return
+        for device_id in allocation.get('deviceIds') or []:
+            route = entry["routes"].get(device_id)
+            if route and route["allocationId"] == allocation['id']:
+                del entry["routes"][device_id]
+    
+    def flag_changed(self, allocation: dict):
+        entry = self._entry_for(allocation['propertyId'])
+        if entry is None:
+            return
+        for device_id in allocation.get('deviceIds') or []:
+            route = entry["routes"].get(device_id)
+            if route and route["allocationId"] == allocation['id']:
+                route["callingFlag"] = allocation['callingFlag']
+    
+    def reset(self, property_id: Optional[str] = None):
+        """Forget routes (all, or one property's); they reload from Mongo on next press"""
+        if property_id is None:
+            self._stale.update(self._properties)
+            self._properties.clear()
+            return
+        self._stale.add(property_id)
+        self._properties.pop(property_id, None)
+
+device_routes = DeviceRouteIndex()
+
+# ============= DEVICE TELEMETRY =============
+
+TELEMETRY_BATCH_LIMIT = 5000
+TELEMETRY_CLOCK_SKEW_SECONDS = 300  # Readings stamped further ahead than this are rejected
+TELEMETRY_SERIES_LIMIT = 5000
+TELEMETRY_METRICS = ("battery", "signal")
+# Raw readings and their rollups: bucket width in seconds (0 = raw) and how long each is
+# kept. Mongo's TTL monitor does the expiring, which is why expireAt is a real date.
+TELEMETRY_RESOLUTIONS = {
+    "raw": {"collection": "device_telemetry", "seconds": 0,
+            "retentionDays": int(os.environ.get('TELEMETRY_RAW_RETENTION_DAYS', '2'))},
+    "1m": {"collection": "device_telemetry_1m", "seconds": 60, "retentionDays": 14},
+    "1h": {"collection": "device_telemetry_1h", "seconds": 3600, "retentionDays": 400},
+}
+
+def telemetry_bucket(timestamp: datetime, seconds: int) -> datetime:
+    return datetime.fromtimestamp(timestamp.timestamp() // seconds * seconds, tz=timezone.utc)
+
+def telemetry_rollup_writes(property_id: str, readings: List[dict], resolution: str) -> list:
+    """Fold time-ordered readings into one upsert per device and bucket at a rollup resolution"""
+    spec = TELEMETRY_RESOLUTIONS[resolution]
+    buckets = {}
+    for reading in readings:
+        start = telemetry_bucket(reading['at'], spec['seconds'])
+        update = buckets.get((reading['deviceId'], start))
+        if update is None:
+            update = buckets[(reading['deviceId'], start)] = {
+                "$inc": {"count": 0}, "$min": {}, "$max": {"lastSeenAt": ""}, "$set": {},
+                "$setOnInsert": {"expireAt": start + timedelta(days=spec['retentionDays'])}
+            }
+        update["$inc"]["count"] += 1
+        update["$max"]["lastSeenAt"] = max(update["$max"]["lastSeenAt"], reading['at'].isoformat())
+        for metric in TELEMETRY_METRICS:
+            value = reading[metric]
+            if value is None:
+                continue
+            update["$inc"][f"{metric}Count"] = update["$inc"].get(f"{metric}Count", 0) + 1
+            update["$inc"][f"{metric}Sum"] = update["$inc"].get(f"{metric}Sum", 0) + value
+            update["$min"][f"{metric}Min"] = min(update["$min"].get(f"{metric}Min", value), value)
+            update["$max"][f"{metric}Max"] = max(update["$max"].get(f"{metric}Max", value), value)
+            update["$set"][f"{metric}Last"] = value
+    return [
+        UpdateOne(
+            {"propertyId": property_id, "deviceId": device_id, "bucket": start.isoformat()},
+            {op: fields for op, fields in update.items() if fields},
+            upsert=True
+        )
+        for (device_id, start), update in buckets.items()
+    ]
+
+def telemetry_point(bucket: dict) -> dict:
+    """A rollup document as a series point, with per-metric average, min, max and last value"""
+    point = {"bucket": bucket['bucket'], "count": bucket.get('count', 0), "lastSeenAt": bucket.get('lastSeenAt')}
+    for metric in TELEMETRY_METRICS:
+        count = bucket.get(f"{metric}Count", 0)
+        point[metric] = {
+            "avg": round(bucket[f"{metric}Sum"] / count, 2),
+            "min": bucket.get(f"{metric}Min"),
+            "max": bucket.get(f"{metric}Max"),
+            "last": bucket.get(f"{metric}Last")
+        } if count else None
+    return point
+
+class DeviceLastSeen:
+    """Physical device ID -> when it last reported, with its latest battery and signal, per property.
+
+    Seeded from the devices collection and the hourly rollups the first time a property is
+    asked for, then kept current by telemetry ingest, so the silent-devices query never
+    touches Mongo. Devices that have never reported have lastSeenAt None.
+    """
+
+    def __init__(self):
+        self._properties = {}  # propertyId -> {deviceId: {"enabled", "lastSeenAt", "battery", "signal"}}
+        self._stale = set()
+        self._locks = {}
+
+    async def _load(self, property_id: str) -> dict:
+        devices = {
+            device['deviceId']: {"enabled": device.get('enabled', True), "lastSeenAt": None, "battery": None, "signal": None}
+            async for device in db.devices.find({"propertyId": property_id}, {"_id": 0, "deviceId": 1, "enabled": 1})
+        }
+        async for latest in db[TELEMETRY_RESOLUTIONS['1h']['collection']].aggregate([
+            {"$match": {"propertyId": property_id}},
+            {"$sort": {"bucket": -1}},
+            {"$group": {
+                "_id": "$deviceId",
+                "lastSeenAt": {"$max": "$lastSeenAt"},
+                "battery": {"$first": "$batteryLast"},
+                "signal": {"$first": "$signalLast"}
+            }}
+        ]):
+            device = devices.get(latest['_id'])
+            if device is not None:
+                device.update(
+                    lastSeenAt=datetime.fromisoformat(latest['lastSeenAt']),
+                    battery=latest.get('battery'), signal=latest.get('signal')
+                )
+        return devices
+
+    async def get(self, property_id: str) -> dict:
+        devices = self._properties.get(property_id)
+        if devices is not None:
+            return devices
+        async with self._locks.setdefault(property_id, asyncio.Lock()):
+            while property_id not in self._properties:
+                self._stale.discard(property_id)
+                devices = await self._load(property_id)
+                if property_id not in self._stale:
+                    self._properties[property_id] = devices
+        return self._properties[property_id]
+
+    def record(self, property_id: str, readings: List[dict]):
+        devices = self._properties.get(property_id)
+        if devices is None:
+            self._stale.add(property_id)  # Redo a load that may have missed these readings
+            return
+        for reading in readings:
+            device = devices.get(reading['deviceId'])
+            # Readings a device buffered while offline arrive late; they don't move it backwards
+            if device is None or (device['lastSeenAt'] and device['lastSeenAt'] > reading['at']):
+                continue
+            device['lastSeenAt'] = reading['at']
+            for metric in TELEMETRY_METRICS:
+                if reading[metric] is not None:
+                    device[metric] = reading[metric]
+
+    def reset(self, property_id: Optional[str] = None):
+        """Forget last-seen times (all, or one property's); they reload from Mongo on next use"""
+        if property_id is None:
+            self._stale.update(self._properties)
+            self._properties.clear()
+            return
+        self._stale.add(property_id)
+        self._properties.pop(property_id, None)
+
+device_last_seen = DeviceLastSeen()
+
+# ============= STAFFING SCHEDULER =============
+
+class StaffingScheduler:
+    """Picks the attendant and server responsible for each new allocation.
+
+    Load is a staff member's open allocations plus the calls outstanding on them. Each
+    allocation gets the least-loaded Pool And Beach Attendant and Food and Beverages Server
+    for the section holding most of its seats, from a min-heap per property, kind and
+    section; heap entries go stale when a load changes and are skipped when they surface.
+    Staff who are on duty for a section (or for the whole property) are preferred; if
+    nobody of a kind is on duty, all of them are eligible. Someone coming on duty takes
+    over allocations from the busiest colleagues, and someone going off duty hands theirs
+    to the least loaded.
+
+    Loads are built from Mongo per property on first use and kept current by the
+    allocation write paths; on-duty state is fed in by staff presence.
+    """
+    ROLES = {"attendant": "Pool And Beach Attendant", "server": "Food and Beverages Server"}
+    FIELDS = {"attendant": "poolBeachAttendantIds", "server": "fbServerIds"}
+    
+    def __init__(self):
+        self._states = {}   # propertyId -> loads, assignments and heaps
+        self._on_duty = {}  # propertyId -> {staffId: sectionId, or None for the whole property}
+        self._stale = set()  # properties that changed while loading
+        self._locks = {}
+        self._seq = 0
+    
+    async def _load(self, property_id: str) -> dict:
+        roles = await db.roles.find(
+            {"name": {"$in": list(self.ROLES.values())}}, {"_id": 0, "id": 1, "name": 1}
+        ).to_list(100)
+        kind_of_role = {role['id']: kind for role in roles for kind, name in self.ROLES.items() if role['name'] == name}
+        state = {"kind": {}, "load": {}, "allocations": {}, "calling": set(), "queues": {}}
+        seat_sections = {
+            seat['id']: seat.get('sectionId') async for seat in db.seats.find(
+                {"propertyId": property_id}, {"_id": 0, "id": 1, "sectionId": 1}
+            )
+        }
+        async for staff in db.staff.find(
+            {"propertyId": property_id, "roleId": {"$in": list(kind_of_role)}}, {"_id": 0, "id": 1, "roleId": 1}
+        ):
+            state["kind"][staff['id']] = kind_of_role[staff['roleId']]
+            state["load"][staff['id']] = 0
+        
+        async for allocation in db.allocations.find(
+            {"propertyId": property_id, "status": {"$ne": "Complete"}},
+            {"_id": 0, "id": 1, "seatIds": 1, "callingFlag": 1, **{field: 1 for field in self.FIELDS.values()}}
+        ):
+            entry = {kind: list(allocation.get(field) or []) for kind, field in self.FIELDS.items()}
+            entry["section"] = self.main_section([seat_sections.get(s) for s in allocation.get('seatIds') or []])
+            state["allocations"][allocation['id']] = entry
+            self._adjust(state, self._staff_of(entry), 1)
+            if allocation.get('callingFlag', "Non Calling") != "Non Calling":
+                state["calling"].add(allocation['id'])
+                self._adjust(state, self._staff_of(entry), 1)
+        return state
+    
+    async def _get(self, property_id: str) -> dict:
+        state = self._states.get(property_id)
+        if state is not None:
+            return state
+        async with self._locks.setdefault(property_id, asyncio.Lock()):
+            while property_id not in self._states:
+                self._stale.discard(property_id)
+                state = await self._load(property_id)
+                if property_id not in self._stale:
+                    self._states[property_id] = state
+        return self._states[property_id]
+    
+    def _state_for(self, property_id: str) -> Optional[dict]:
+        """The loaded state for a hook to update; a load in progress is redone instead"""
+        state = self._states.get(property_id)
+        if state is None:
+            self._stale.add(property_id)
+        return state
+    
+    @staticmethod
+    def main_section(section_ids: List[Optional[str]]) -> Optional[str]:
+        """The section holding most of an allocation's seats"""
+        counts = {}
+        for section_id in section_ids:
+            if section_id:
+                counts[section_id] = counts.get(section_id, 0) + 1
+        return max(counts, key=counts.get, default=None)
+    
+    @staticmethod
+    def _staff_of(entry: dict) -> List[str]:
+        return entry["attendant"] + entry["server"]
+    
+    def _adjust(self, state: dict, staff_ids: List[str], delta: int):
+        for staff_id in staff_ids:
+            if staff_id not in state["load"]:
+                continue  # Not (or no longer) an attendant or server
+            state["load"][staff_id] += delta
+            for queue in state["queues"].values():
+                if staff_id in queue["members"]:
+                    self._push(queue, state["load"][staff_id], staff_id)
+    
+    def _push(self, queue: dict, load: int, staff_id: str):
+        self._seq += 1
+        heapq.heappush(queue["heap"], (load, self._seq, staff_id))
+    
+    def _eligible(self, property_id: str, state: dict, kind: str, section_id: Optional[str]) -> set:
+        staff = {s for s, k in state["kind"].items() if k == kind}
+        on_duty = self._on_duty.get(property_id, {})
+        return {s for s in staff if s in on_duty and on_duty[s] in (None, section_id)} or staff
+    
+    def _pick(self, property_id: str, state: dict, kind: str, section_id: Optional[str]) -> Optional[str]:
+        """Least-loaded eligible staff member of a kind for a section"""
+        queue = state["queues"].get((kind, section_id))
+        if queue is None or len(queue["heap"]) > 4 * len(queue["members"]) + 16:
+            queue = {"members": self._eligible(property_id, state, kind, section_id), "heap": []}
+            for staff_id in queue["members"]:
+                self._push(queue, state["load"][staff_id], staff_id)
+            state["queues"][(kind, section_id)] = queue
+        while queue["heap"]:
+            load, _, staff_id = queue["heap"][0]
+            if state["load"].get(staff_id) == load and staff_id in queue["members"]:
+                return staff_id
+            heapq.heappop(queue["heap"])
+        return None
+    
+    async def assign(self, property_id: str, allocation_id: str, seat_ids: List[str]) -> tuple:
+        """Choose (attendant IDs, server IDs) for a new allocation and count it against them"""
+        state = await self._get(property_id)
+        section_id = self.main_section([
+            seat.get('sectionId') async for seat in db.seats.find(
+                {"id": {"$in": seat_ids}, "propertyId": property_id}, {"_id": 0, "sectionId": 1}
+            )
+        ])
+        
+        entry = {"section": section_id}
+        for kind in self.FIELDS:
+            staff_id = self._pick(property_id, state, kind, section_id)
+            entry[kind] = [staff_id] if staff_id else []
+        state["allocations"][allocation_id] = entry
+        self._adjust(state, self._staff_of(entry), 1)
+        return entry["attendant"], entry["server"]
+    
+    def release(self, allocation: dict):
+        """An allocation completed, was deleted or was never written"""
+        state = self._state_for(allocation['propertyId'])
+        if state is None:
+            return
+        entry = state["allocations"].pop(allocation['id'], None)
+        if entry is None:
+            return
+        self._adjust(state, self._staff_of(entry), -1)
+        if allocation['id'] in state["calling"]:
+            state["calling"].discard(allocation['id'])
+            self._adjust(state, self._staff_of(entry), -1)
+    
+    def call_raised(self, allocation: dict):
+        state = self._state_for(allocation['propertyId'])
+        if state is None or allocation['id'] in state["calling"] or allocation['id'] not in state["allocations"]:
+            return
+        state["calling"].add(allocation['id'])
+        self._adjust(state, self._staff_of(state["allocations"][allocation['id']]), 1)
+    
+    def call_ended(self, allocation: dict):
+        state = self._state_for(allocation['propertyId'])
+        if state is None or allocation['id'] not in state["calling"]:
+            return
+        state["calling"].discard(allocation['id'])
+        self._adjust(state, self._staff_of(state["allocations"][allocation['id']]), -1)
+    
+    @staticmethod
+    def _weight(state: dict, allocation_id: str) -> int:
+        """Load an allocation puts on its staff: one, plus one while a call is outstanding"""
+        return 2 if allocation_id in state["calling"] else 1
+    
+    async def _move(self, property_id: str, state: dict, moves: List[tuple]) -> int:
+        """Reassign allocations: (allocationId, kind, from staff, to staff). Returns how many moved"""
+        if not moves:
+            return 0
+        now = datetime.now(timezone.utc).isoformat()
+        writes = []
+        for allocation_id, kind, old_staff, new_staff in moves:
+            entry = state["allocations"][allocation_id]
+            before = list(entry[kind])
+            entry[kind] = [new_staff if s == old_staff else s for s in before]
+            writes.append(UpdateOne(
+                {"id": allocation_id, self.FIELDS[kind]: before},
+                {"$set": {self.FIELDS[kind]: entry[kind], "updatedAt": now}}
+            ))
+            weight = self._weight(state, allocation_id)
+            self._adjust(state, [old_staff], -weight)
+            self._adjust(state, [new_staff], weight)
+        result = await db.allocations.bulk_write(writes, ordered=False)
+        if result.modified_count != len(writes):
+            self.reset(property_id)  # Something changed underneath us; reload from Mongo
+        return result.modified_count
+    
+    def mark_on_duty(self, property_id: str, staff_id: str, section_id: Optional[str] = None):
+        """Record a staff member as on duty without moving any work to them"""
+        self._on_duty.setdefault(property_id, {})[staff_id] = section_id
+        state = self._states.get(property_id)
+        if state is not None:
+            state["queues"].clear()
+    
+    async def staff_on_duty(self, property_id: str, staff_id: str, section_id: Optional[str] = None) -> int:
+        """Put a staff member on duty and hand them work from busier colleagues. Returns allocations moved"""
+        self.mark_on_duty(property_id, staff_id, section_id)
+        state = await self._get(property_id)
+        state["queues"].clear()
+        kind = state["kind"].get(staff_id)
+        if kind is None:
+            return 0
+        
+        # Take allocations, lightest first, from whoever is busiest until loads are level
+        projected = dict(state["load"])
+        holdings = {}
+        for allocation_id, entry in state["allocations"].items():
+            if section_id is None or entry["section"] == section_id:
+                for holder in entry[kind]:
+                    if holder != staff_id and holder in projected:
+                        holdings.setdefault(holder, []).append(allocation_id)
+        for allocation_ids in holdings.values():
+            allocation_ids.sort(key=lambda a: self._weight(state, a))
+        
+        moves = []
+        taken = set()
+        while holdings:
+            holder = max(holdings, key=projected.get)
+            allocation_id = holdings[holder].pop(0)
+            weight = self._weight(state, allocation_id)
+            if allocation_id in taken or staff_id in state["allocations"][allocation_id][kind]:
+                pass
+            elif projected[holder] - projected[staff_id] <= weight:
+                del holdings[holder]
+                continue
+            else:
+                moves.append((allocation_id, kind, holder, staff_id))
+                taken.add(allocation_id)
+                projected[holder] -= weight
+                projected[staff_id] += weight
+            if holder in holdings and not holdings[holder]:
+                del holdings[holder]
+        return await self._move(property_id, state, moves)
+    
+    async def staff_off_duty(self, property_id: str, staff_id: str) -> int:
+        """Take a staff member off duty and hand their open allocations to others. Returns allocations moved"""
+        self._on_duty.get(property_id, {}).pop(staff_id, None)
+        state = await self._get(property_id)
+        state["queues"].clear()
+        kind = state["kind"].get(staff_id)
+        if kind is None:
+            return 0
+        
+        projected = dict(state["load"])
+        moves = []
+        for allocation_id, entry in state["allocations"].items():
+            if staff_id not in entry[kind]:
+                continue
+            others = self._eligible(property_id, state, kind, entry["section"]) - set(entry[kind])
+            if not others:
+                continue  # Nobody else to take it over
+            new_staff = min(others, key=projected.get)
+            projected[new_staff] += self._weight(state, allocation_id)
+            moves.append((allocation_id, kind, staff_id, new_staff))
+        return await self._move(property_id, state, moves)
+    
+    def route(self, allocation: dict, staff_ids: List[str]) -> List[str]:
+        """Who should hear about a call: the allocation's staff who are on duty, else the on-duty
+        attendants covering its section, else its staff regardless"""
+        on_duty = self._on_duty.get(allocation['propertyId'], {})
+        present = [s for s in staff_ids if s in on_duty]
+        if present:
+            return present
+        state = self._states.get(allocation['propertyId'])
+        if state is not None:
+            section_id = state["allocations"].get(allocation['id'], {}).get("section")
+            covering = [
+                s for s, section in on_duty.items()
+                if state["kind"].get(s) == "attendant" and section in (None, section_id)
+            ]
+            if covering:
+                return covering
+        return staff_ids
+    
+    def reset(self, property_id: Optional[str] = None):
+        """Forget loads (all, or one property's); they reload from Mongo on next use"""
+        if property_id is None:
+            self._stale.update(self._states)
+            self._states.clear()
+            self._on_duty.clear()
+            return
+        self._stale.add(property_id)
+        self._states.pop(property_id, None)
+    
+    async def snapshot(self, property_id: str) -> List[dict]:
+        state = await self._get(property_id)
+        on_duty = self._on_duty.get(property_id, {})
+        assigned = {}
+        for allocation_id, entry in state["allocations"].items():
+            for staff_id in self._staff_of(entry):
+                assigned.setdefault(staff_id, []).append(allocation_id)
+        return sorted((
+            {
+                "staffId": staff_id,
+                "kind": kind,
+                "load": state["load"][staff_id],
+                "openAllocations": len(assigned.get(staff_id, [])),
+                "outstandingCalls": sum(1 for a in assigned.get(staff_id, []) if a in state["calling"]),
+                "onDuty": staff_id in on_duty,
+                "sectionId": on_duty.get(staff_id)
+            }
+            for staff_id, kind in state["kind"].items()
+        ), key=lambda row: (row['kind'], row['load']))
+
+staffing = StaffingScheduler()
+
+# ============= STAFF PRESENCE =============
+
+PRESENCE_TIMEOUT_SECONDS = 120
+PRESENCE_CHECK_INTERVAL_SECONDS = 30
+# Roles that pick a section after logging in; they go on duty when they check in to it
+SECTION_CHECK_IN_ROLES = {"Pool And Beach Attendant", "Food and Beverages Server"}
+
+class StaffPresence:
+    """Who is on duty, and where: one entry per checked-in staff member.
+
+    Staff check in to a section (or the whole property, as login does for roles that don't
+    pick one) and their client sends a heartbeat while the app is open; anyone silent for
+    PRESENCE_TIMEOUT_SECONDS is checked out. Each check-in opens a shift in staff_shifts,
+    closed with the reason it ended, so shift history survives restarts; open shifts are
+    restored on startup. Every change is passed on to the staffing scheduler, which prefers
+    on-duty staff.
+    """
+    
+    def __init__(self):
+        self._entries = {}  # staffId -> {"propertyId", "sectionId", "shiftId", "checkedInAt", "lastSeenAt"}
+    
+    async def check_in(self, staff_id: str, property_id: str, section_id: Optional[str] = None) -> dict:
+        now = datetime.now(timezone.utc).isoformat()
+        entry = self._entries.get(staff_id)
+        if entry and entry['sectionId'] == section_id:
+            entry['lastSeenAt'] = now
+            return entry
+        if entry:
+            await self._close_shift(entry, "moved", now)
+        
+        shift = {
+            "id": str(uuid.uuid4()),
+            "staffId": staff_id,
+            "propertyId": property_id,
+            "sectionId": section_id,
+            "checkedInAt": now,
+            "checkedOutAt": None,
+            "endReason": None
+        }
+        await db.staff_shifts.insert_one(shift)
+        entry = {"propertyId": property_id, "sectionId": section_id, "shiftId": shift['id'], "checkedInAt": now, "lastSeenAt": now}
+        self._entries[staff_id] = entry
+        await staffing.staff_on_duty(property_id, staff_id, section_id)
+        return entry
+    
+    def heartbeat(self, staff_id: str) -> Optional[dict]:
+        entry = self._entries.get(staff_id)
+        if entry:
+            entry['lastSeenAt'] = datetime.now(timezone.utc).isoformat()
+        return entry
+    
+    async def check_out(self, staff_id: str, property_id: str, reason: str) -> int:
+        """End a staff member's shift; returns how many of their allocations were handed over"""
+        entry = self._entries.pop(staff_id, None)
+        if entry:
+            await self._close_shift(entry, reason, datetime.now(timezone.utc).isoformat())
+        return await staffing.staff_off_duty(property_id, staff_id)
+    
+    async def _close_shift(self, entry: dict, reason: str, now: str):
+        await db.staff_shifts.update_one(
+            {"id": entry['shiftId'], "checkedOutAt": None},
+            {"$set": {"checkedOutAt": now, "endReason": reason}}
+        )
+    
+    async def expire(self) -> int:
+        """Check out everyone whose heartbeat stopped"""
+        cutoff = (datetime.now(timezone.utc) - timedelta(seconds=PRESENCE_TIMEOUT_SECONDS)).isoformat()
+        stale = [(s, e['propertyId']) for s, e in self._entries.items() if e['lastSeenAt'] < cutoff]
+        for staff_id, property_id in stale:
+            await self.check_out(staff_id, property_id, "expired")
+        return len(stale)
+    
+    async def restore(self):
+        """Reload open shifts after a restart; their staff get a full timeout to send a heartbeat"""
+        now = datetime.now(timezone.utc).isoformat()
+        async for shift in db.staff_shifts.find({"checkedOutAt": None}, {"_id": 0}):
+            self._entries[shift['staffId']] = {
+                "propertyId": shift['propertyId'],
+                "sectionId": shift['sectionId'],
+                "shiftId": shift['id'],
+                "checkedInAt": shift['checkedInAt'],
+                "lastSeenAt": now
+            }
+            staffing.mark_on_duty(shift['propertyId'], shift['staffId'], shift['sectionId'])
+    
+    def on_duty(self, property_id: str, section_id: Optional[str] = None) -> List[dict]:
+        return [
+            {"staffId": staff_id, **{k: v for k, v in entry.items() if k != 'shiftId'}}
+            for staff_id, entry in self._entries.items()
+            if entry['propertyId'] == property_id and (section_id is None or entry['sectionId'] in (None, section_id))
+        ]
+    
+    def reset(self, property_id: Optional[str] = None):
+        """Forget entries (all, or one property's) whose data has been deleted"""
+        for staff_id in [s for s, e in self._entries.items() if property_id is None or e['propertyId'] == property_id]:
+            del self._entries[staff_id]
+
+presence = StaffPresence()
+
+async def presence_expiry_loop():
+    """Background task: check out staff whose heartbeats stopped"""
+    while True:
+        await asyncio.sleep(PRESENCE_CHECK_INTERVAL_SECONDS)
+        try:
+            expired = await presence.expire()
+            if expired:
+                logger.info(f"Checked out {expired} staff with no recent heartbeat")
+        except Exception as e:
+            logger.error(f"Error expiring staff presence: {str(e)}")
+
+# ============= CALLING RESPONSE TIMES =============
+
+CALLING_SLA_SECONDS = int(os.environ.get('CALLING_SLA_SECONDS', '300'))
+CALLING_SLA_CHECK_INTERVAL_SECONDS = 30
+CALLING_LATENCY_WINDOW_DAYS = 7
+CALLING_MANAGER_ROLE = "Pool and Beach Manager"
+
+class LatencyHistogram:
+    """Response times in milliseconds, bucketed log-linearly in the style of HdrHistogram.
+
+    Values below 2 * SUB_BUCKETS are counted exactly; above that every power of two is split
+    into SUB_BUCKETS buckets, so a reported value is within 1/SUB_BUCKETS (about 3%) of the
+    recorded one. Memory is fixed however many values go in; anything past MAX_SHIFT
+    doublings (about 18 hours) lands in the last bucket.
+    """
+    SUB_BUCKET_BITS = 5
+    SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+    MAX_SHIFT = 20
+    
+    def __init__(self):
+        self.counts = np.zeros(2 * self.SUB_BUCKETS + self.MAX_SHIFT * self.SUB_BUCKETS, dtype=np.int64)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+    
+    @classmethod
+    def bucket_of(cls, value: int) -> int:
+        if value < 2 * cls.SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - cls.SUB_BUCKET_BITS - 1
+        if shift > cls.MAX_SHIFT:
+            return 2 * cls.SUB_BUCKETS + cls.MAX_SHIFT * cls.SUB_BUCKETS - 1
+        return 2 * cls.SUB_BUCKETS + (shift - 1) * cls.SUB_BUCKETS + (value >> shift) - cls.SUB_BUCKETS
+    
+    @classmethod
+    def highest_in_bucket(cls, index: int) -> int:
+        if index < 2 * cls.SUB_BUCKETS:
+            return index
+        shift, offset = divmod(index - 2 * cls.SUB_BUCKETS, cls.SUB_BUCKETS)
+        return ((cls.SUB_BUCKETS + offset + 1) << (shift + 1)) - 1
+    
+    def record(self, value: int):
+        self.counts[self.bucket_of(value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+    
+    def merge(self, other: "LatencyHistogram"):
+        self.counts += other.counts
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+    
+    def percentile(self, fraction: float) -> Optional[int]:
+        if not self.count:
+            return None
+        rank = max(math.ceil(fraction * self.count), 1)
+        index = int(np.searchsorted(np.cumsum(self.counts), rank, side="left"))
+        return min(self.highest_in_bucket(index), self.max)
+    
+    def summary(self) -> dict:
+        def seconds(ms):
+            return round(ms / 1000, 1) if ms is not None else None
+        return {
+            "calls": self.count,
+            "averageSeconds": seconds(self.total / self.count) if self.count else None,
+            "p50Seconds": seconds(self.percentile(0.50)),
+            "p95Seconds": seconds(self.percentile(0.95)),
+            "p99Seconds": seconds(self.percentile(0.99)),
+            "maxSeconds": seconds(self.max) if self.count else None
+        }
+
+class CallingResponseTracker:
+    """How long guests wait after calling, and which calls are still waiting.
+
+    A call runs from the calling flag going up (Non Calling to Calling or Calling for
+    Checkout) until it is set back to Non Calling; switching between the two calling values
+    doesn't restart it. Response times are histogrammed per property, per section of the
+    allocation's seats and per attendant who answered, in one set per UTC day, keeping the
+    last CALLING_LATENCY_WINDOW_DAYS days; startup reloads them from allocation_events.
+    A call waiting longer than CALLING_SLA_SECONDS alerts the property's managers once.
+    """
+    
+    def __init__(self):
+        self._days = {}  # date -> {(propertyId, dimension, key): LatencyHistogram}
+        self._open = {}  # allocationId -> {"propertyId", "startedAt", "alerted"}
+    
+    @staticmethod
+    def call_started_at(events: List[dict]) -> Optional[str]:
+        """When the call open at the end of an allocation's recent events was raised, if they reach back that far"""
+        started = None
+        for event in reversed(events):
+            if event['eventType'] == "Calling On":
+                started = event['timestamp']
+            elif event['eventType'] == "Calling Off":
+                return started
+        # Without the Calling Off before it, the call may have started before these events
+        return started if len(events) < RECENT_EVENTS_LIMIT else None
+    
+    def _record(self, property_id: str, started_at: str, answered_at: str, section_ids: List[str], staff_id: Optional[str]):
+        answered = datetime.fromisoformat(answered_at)
+        elapsed = max(int((answered - datetime.fromisoformat(started_at)).total_seconds() * 1000), 0)
+        histograms = self._days.setdefault(answered.strftime('%Y-%m-%d'), {})
+        keys = [("property", property_id)] + [("section", section_id) for section_id in dict.fromkeys(section_ids)]
+        if staff_id:
+            keys.append(("attendant", staff_id))
+        for dimension, key in keys:
+            histograms.setdefault((property_id, dimension, key), LatencyHistogram()).record(elapsed)
+        
+        oldest = (answered - timedelta(days=CALLING_LATENCY_WINDOW_DAYS - 1)).strftime('%Y-%m-%d')
+        for day in [day for day in self._days if day < oldest]:
+            del self._days[day]
+    
+    @staticmethod
+    def answered_by(allocation: dict, event: dict) -> Optional[str]:
+        """Staff credited with answering: whoever cleared the flag, else the allocation's only attendant"""
+        attendants = allocation.get('poolBeachAttendantIds') or []
+        return event.get('staffId') or (attendants[0] if len(attendants) == 1 else None)
+    
+    @staticmethod
+    async def sections_of(seat_ids: List[str]) -> List[str]:
+        seats = await db.seats.find({"id": {"$in": seat_ids}}, {"_id": 0, "sectionId": 1}).to_list(None)
+        return [seat.get('sectionId') or "unassigned" for seat in seats]
+    
+    def call_raised(self, allocation: dict):
+        """After-commit hook for the calling flag going up"""
+        if allocation['id'] not in self._open:
+            self._open[allocation['id']] = {
+                "propertyId": allocation['propertyId'],
+                "startedAt": allocation['recentEvents'][-1]['timestamp'],
+                "alerted": False
+            }
+    
+    async def call_answered(self, allocation: dict):
+        """After-commit hook for the calling flag going back to Non Calling"""
+        event = allocation['recentEvents'][-1]
+        call = self._open.pop(allocation['id'], None)
+        started_at = call['startedAt'] if call else self.call_started_at(allocation['recentEvents'][:-1])
+        if started_at is None:
+            return
+        try:
+            section_ids = await self.sections_of(allocation.get('seatIds', []))
+        except Exception as e:
+            logger.error(f"Error looking up sections for call on {allocation['id']}: {str(e)}")
+            section_ids = []
+        self._record(allocation['propertyId'], started_at, event['timestamp'], section_ids, self.answered_by(allocation, event))
+    
+    def call_dropped(self, allocation: dict):
+        """After-commit hook for an allocation completing, which ends any call without an answer"""
+        self._open.pop(allocation['id'], None)
+    
+    async def load(self):
+        """Rebuild the histograms from recent events and the open calls from allocations"""
+        self._days.clear()
+        self._open.clear()
+        since = (datetime.now(timezone.utc) - timedelta(days=CALLING_LATENCY_WINDOW_DAYS)).isoformat()
+        events_by_allocation = {}
+        async for event in db.allocation_events.find(
+            {"eventType": {"$in": ["Calling On", "Calling Off"]}, "timestamp": {"$gte": since}},
+            {"_id": 0, "allocationId": 1, "eventType": 1, "timestamp": 1, "staffId": 1}
+        ):
+            events_by_allocation.setdefault(event['allocationId'], []).append(event)
+        
+        allocations = await db.allocations.find(
+            {"id": {"$in": list(events_by_allocation)}},
+            {"_id": 0, "id": 1, "propertyId": 1, "seatIds": 1, "poolBeachAttendantIds": 1}
+        ).to_list(None)
+        seat_sections = {}
+        for property_id in {a['propertyId'] for a in allocations}:
+            async for seat in db.seats.find({"propertyId": property_id}, {"_id": 0, "id": 1, "sectionId": 1}):
+                seat_sections[seat['id']] = seat.get('sectionId') or "unassigned"
+        
+        for allocation in allocations:
+            section_ids = [seat_sections[s] for s in allocation.get('seatIds', []) if s in seat_sections]
+            started_at = None
+            for event in sorted(events_by_allocation[allocation['id']], key=lambda e: e['timestamp']):
+                if event['eventType'] == "Calling On":
+                    started_at = started_at or event['timestamp']
+                elif started_at:
+                    self._record(allocation['propertyId'], started_at, event['timestamp'], section_ids,
+                                 self.answered_by(allocation, event))
+                    started_at = None
+        
+        async for allocation in db.allocations.find(
+            {"callingFlag": {"$in": ["Calling", "Calling for Checkout"]}, "status": {"$ne": "Complete"}},
+            {"_id": 0, "id": 1, "propertyId": 1, "recentEvents": 1, "updatedAt": 1}
+        ):
+            self._open[allocation['id']] = {
+                "propertyId": allocation['propertyId'],
+                "startedAt": self.call_started_at(allocation.get('recentEvents', [])) or allocation['updatedAt'],
+                "alerted": False
+            }
+    
+    def reset(self, property_id: Optional[str] = None):
+        """Forget response times and open calls (all, or one property's) once their data is deleted"""
+        if property_id is None:
+            self._days.clear()
+            self._open.clear()
+            return
+        for histograms in self._days.values():
+            for key in [key for key in histograms if key[0] == property_id]:
+                del histograms[key]
+        for allocation_id in [aid for aid, call in self._open.items() if call['propertyId'] == property_id]:
+            del self._open[allocation_id]
+    
+    def report(self, property_id: str, dimension: str, days: int) -> dict:
+        """Merged histograms for one property over the last `days` days, keyed by dimension value"""
+        oldest = (datetime.now(timezone.utc) - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+        merged = {}
+        for day, histograms in self._days.items():
+            if day < oldest:
+                continue
+            for (pid, dim, key), histogram in histograms.items():
+                if pid == property_id and dim == dimension:
+                    merged.setdefault(key, LatencyHistogram()).merge(histogram)
+        return merged
+    
+    def open_calls(self, property_id: str) -> List[dict]:
+        now = datetime.now(timezone.utc)
+        return sorted((
+            {
+                "allocationId": allocation_id,
+                "startedAt": call['startedAt'],
+                "waitingSeconds": round((now - datetime.fromisoformat(call['startedAt'])).total_seconds(), 1),
+                "alerted": call['alerted']
+            }
+            for allocation_id, call in self._open.items() if call['propertyId'] == property_id
+        ), key=lambda call: call['startedAt'])
+    
+    async def alert_overdue(self) -> int:
+        """Notify managers about calls waiting past the SLA, once per call"""
+        deadline = (datetime.now(timezone.utc) - timedelta(seconds=CALLING_SLA_SECONDS)).isoformat()
+        overdue = [aid for aid, call in self._open.items() if not call['alerted'] and call['startedAt'] <= deadline]
+        if not overdue:
+            return 0
+        allocations = await db.allocations.find(
+            {"id": {"$in": overdue}, "callingFlag": {"$ne": "Non Calling"}},
+            {"_id": 0, "id": 1, "propertyId": 1, "guestName": 1, "roomNumber": 1, "fbManagerId": 1}
+        ).to_list(None)
+        role_ids = await db.roles.distinct("id", {"name": CALLING_MANAGER_ROLE})
+        
+        for allocation_id in set(overdue) - {a['id'] for a in allocations}:
+            self._open.pop(allocation_id, None)  # Deleted, or answered while we looked
+        
+        now = datetime.now(timezone.utc).isoformat()
+        writes = []
+        for allocation in allocations:
+            call = self._open.get(allocation['id'])
+            if call is None:
+                continue
+            managers = await db.staff.distinct("id", {"propertyId": allocation['propertyId'], "roleId": {"$in": role_ids}})
+            minutes = (datetime.now(timezone.utc) - datetime.fromisoformat(call['startedAt'])).total_seconds() / 60
+            event = {"newValue": "Calling Overdue", "timestamp": now,
+                     "description": f"Call unanswered for {minutes:.0f} minutes"}
+            writes.extend(op for _, op in build_staff_notifications(allocation, event, [allocation.get('fbManagerId')] + managers))
+            call['alerted'] = True
+        if writes:
+            await db.notifications.bulk_write(writes, ordered=False)
+        return len(allocations)
+
+calling_tracker = CallingResponseTracker()
+
+async def calling_sla_loop():
+    """Background task: alert managers about calls nobody has answered in time"""
+    while True:
+        await asyncio.sleep(CALLING_SLA_CHECK_INTERVAL_SECONDS)
+        try:
+            alerted = await calling_tracker.alert_overdue()
+            if alerted:
+                logger.warning(f"Alerted managers about {alerted} overdue calls")
+        except Exception as e:
+            logger.error(f"Error checking overdue calls: {str(e)}")
+
+# ============= ALLOCATION STATE MACHINE =============
+
+# Side-effect hooks return (collection, write) pairs; all writes produced by one
+# transition are grouped per collection and sent as bulk_write calls in its transaction
+def release_allocation_seats(allocation: dict, event: dict) -> list:
+    seat_ids = allocation.get('seatIds', [])
+    if not seat_ids:
+        return []
+    return [("seats", UpdateMany(
+        {"id": {"$in": seat_ids}},
+        {"$set": {"status": "Free", "updatedAt": event['timestamp']}}
+    ))]
+
+def release_allocation_reservations(allocation: dict, event: dict) -> list:
+    return [("allocation_reservations", DeleteMany({"allocationId": allocation['id']}))]
+
+def build_staff_notifications(allocation: dict, event: dict, staff_ids: List[str]) -> list:
+    return [
+        ("notifications", InsertOne({
+            "id": str(uuid.uuid4()),
+            "propertyId": allocation['propertyId'],
+            "staffId": staff_id,
+            "allocationId": allocation['id'],
+            "type": event['newValue'],
+            "message": f"{allocation['guestName']} (Room {allocation['roomNumber']}): {event['description']}",
+            "read": False,
+            "createdAt": event['timestamp']
+        }))
+        for staff_id in dict.fromkeys(staff_ids) if staff_id
+    ]
+
+async def count_allocation_release(allocation: dict, session) -> dict:
+    deltas = {"allocations.active": -1}
+    for changes in (await seat_status_deltas(allocation.get('seatIds', []), "Free", session=session)).values():
+        add_deltas(deltas, changes)
+    return deltas
+
+def notify_fb_manager(allocation: dict, event: dict) -> list:
+    return build_staff_notifications(allocation, event, [allocation.get('fbManagerId')])
+
+def notify_service_staff(allocation: dict, event: dict) -> list:
+    return build_staff_notifications(
+        allocation, event,
+        staffing.route(allocation, allocation.get('poolBeachAttendantIds', []) + allocation.get('fbServerIds', []))
+    )
+
+def notify_checkout_staff(allocation: dict, event: dict) -> list:
+    return build_staff_notifications(
+        allocation, event,
+        [allocation.get('fbManagerId')] + staffing.route(allocation, allocation.get('poolBeachAttendantIds', []))
+    )
+
+# Declarative allocation state machine. For each field: the allowed transitions,
+# a guard (extra filter that must match for any transition of that field), how
+# the timeline event is described, the side-effect hooks per target value, the
+# dashboard counter changes per target value (worked out before the hooks write),
+# and in-memory updates (plain or async functions) to run once the transition has committed.
+ALLOCATION_STATE_MACHINE = {
+    "status": {
+        "default": "Allocated",
+        "transitions": {
+            "Allocated": ["Active", "Billing", "Complete"],
+            "Active": ["Billing", "Complete"],
+            "Billing": ["Active", "Clear", "Complete"],
+            "Clear": ["Complete"],
+            "Complete": [],
+        },
+        "guard": {},
+        "event": lambda old, new: ("Status Change", f"Status changed from {old} to {new}"),
+        "hooks": {
+            "Billing": [notify_fb_manager],
+            "Complete": [release_allocation_seats, release_allocation_reservations],
+        },
+        "counters": {
+            "Complete": [count_allocation_release],
+        },
+        "after_commit": {
+            "Complete": [availability_index.release_allocation, device_routes.release_allocation,
+                         calling_tracker.call_dropped, staffing.release],
+        },
+    },
+    "callingFlag": {
+        "default": "Non Calling",
+        "transitions": {
+            "Non Calling": ["Calling", "Calling for Checkout"],
+            "Calling": ["Non Calling", "Calling for Checkout"],
+            "Calling for Checkout": ["Non Calling", "Calling"],
+        },
+        "guard": {"status": {"$ne": "Complete"}},
+        "event": lambda old, new: (
+            "Calling On" if new != "Non Calling" else "Calling Off",
+            f"Calling flag changed from {old} to {new}"
+        ),
+        "hooks": {
+            "Calling": [notify_service_staff],
+            "Calling for Checkout": [notify_checkout_staff],
+        },
+        "after_commit": {
+            "Calling": [calling_tracker.call_raised, staffing.call_raised, device_routes.flag_changed],
+            "Calling for Checkout": [calling_tracker.call_raised, staffing.call_raised, device_routes.flag_changed],
+            "Non Calling": [calling_tracker.call_answered, staffing.call_ended, device_routes.flag_changed],
+        },
+    },
+}
+
+async def raise_transition_conflict(allocation_id: str, field: str, expected: str):
+    """Raise why a guarded transition matched nothing: the allocation is gone, stale, or blocked by the guard"""
+    current = await db.allocations.find_one({"id": allocation_id}, {"_id": 0, field: 1, "status": 1})
+    if current is None:
+        raise HTTPException(status_code=404, detail="Allocation not found")
+    if current.get(field, ALLOCATION_STATE_MACHINE[field]["default"]) != expected:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Allocation {field} is {current.get(field)}, expected {expected}. Refresh and try again."
+        )
+    raise HTTPException(
+        status_code=409,
+        detail=f"Cannot change {field} while allocation status is {current.get('status')}"
+    )
+
+async def apply_allocation_transition(allocation_id: str, field: str, target: str, expected: Optional[str] = None,
+                                      staff_id: Optional[str] = None) -> dict:
+    """Validate and apply a state machine transition, returning the updated allocation.
+
+    The allocation update, timeline event and all hook writes run in one transaction
+    (where supported). The update is guarded on the expected prior value and the
+    field's guard, so concurrent transitions are rejected with 409 rather than lost.
+    Asking for the value the field already has is a no-op returning the allocation.
+    staff_id, if given, is recorded on the event as the staff member who made the change.
+    """
+    machine = ALLOCATION_STATE_MACHINE[field]
+    transitions = machine["transitions"]
+    if target not in transitions:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid {field}. Must be one of: {', '.join(transitions)}"
+        )
+    
+    # Clients that don't send the value they saw get a projected read so the update is still guarded
+    if expected is None:
+        current = await db.allocations.find_one({"id": allocation_id}, {"_id": 0, field: 1})
+        if current is None:
+            raise HTTPException(status_code=404, detail="Allocation not found")
+        expected = current.get(field, machine["default"])
+    
+    # Legacy allocations may not have the field at all; they hold its default value
+    match = {
+        "id": allocation_id,
+        field: {"$in": [expected, None]} if expected == machine["default"] else expected,
+        **machine["guard"]
+    }
+    if target == expected:
+        unchanged = await db.allocations.find_one(match, {"_id": 0})
+        if not unchanged:
+            await raise_transition_conflict(allocation_id, field, expected)
+        return unchanged
+    elif target not in transitions.get(expected, []):
+        allowed = transitions.get(expected, [])
+        raise HTTPException(
+            status_code=400,
+            detail=f"Cannot change {field} from {expected} to {target}. Allowed: {', '.join(allowed) or 'none'}"
+        )
+    
+    now = datetime.now(timezone.utc).isoformat()
+    event_type, description = machine["event"](expected, target)
+    event = {
+        "eventType": event_type,
+        "oldValue": expected,
+        "newValue": target,
+        "timestamp": now,
+        "description": description
+    }
+    if staff_id:
+        event["staffId"] = staff_id
+    
+    async def transition(session):
+        updated = await db.allocations.find_one_and_update(
+            match,
+            {
+                "$set": {field: target, "updatedAt": now},
+                "$push": push_recent_event(event)
+            },
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+        if not updated:
+            return None
+        
+        await record_allocation_event(allocation_id, updated['propertyId'], event, session=session)
+        
+        deltas = {}
+        for counter in machine.get("counters", {}).get(target, []):
+            add_deltas(deltas, await counter(updated, session))
+        
+        writes = {}
+        for hook in machine["hooks"].get(target, []):
+            for collection, write in hook(updated, event):
+                writes.setdefault(collection, []).append(write)
+        for collection, ops in writes.items():
+            await db[collection].bulk_write(ops, ordered=False, session=session)
+        await bump_counters(updated['propertyId'], deltas, session=session)
+        
+        return updated
+    
+    updated_allocation = await run_in_transaction(transition)
+    if updated_allocation:
+        for callback in machine.get("after_commit", {}).get(target, []):
+            result = callback(updated_allocation)
+            if asyncio.iscoroutine(result):
+                await result
+        return updated_allocation
+    
+    await raise_transition_conflict(allocation_id, field, expected)
+
+# ============= ALLOCATION WRITE HELPERS =============
+
+def check_guest_eligibility(guest: dict, configuration: Optional[dict], now: datetime) -> Optional[str]:
+    """Return why a guest can't be allocated right now, or None if they are eligible"""
+    if not (guest.get('checkInDate') and guest.get('checkOutDate')) or not configuration:
+        return None
+    
+    current_date = now.strftime('%Y-%m-%d')  # YYYY-MM-DD
+    current_time = now.strftime('%H:%M')  # HH:MM
+    
+    check_in_date = guest['checkInDate']
+    check_out_date = guest['checkOutDate']
+    check_in_time = configuration.get('checkInTime', '14:00')
+    check_out_time = configuration.get('checkOutTime', '11:00')
+    
+    if current_date < check_in_date:
+        return f"Guest is not eligible. Check-in is on {check_in_date}"
+    if current_date == check_in_date and current_time < check_in_time:
+        return f"Guest is not eligible. Check-in time is {check_in_time}"
+    if current_date > check_out_date:
+        return f"Guest is not eligible. Already checked out on {check_out_date}"
+    if current_date == check_out_date and current_time >= check_out_time:
+        return f"Guest is not eligible. Check-out time was {check_out_time}"
+    return None
+
+def find_repeated_ids(ids: List[str]) -> List[str]:
+    """IDs listed more than once, in first-seen order"""
+    seen = set()
+    repeated = {}
+    for item in ids:
+        if item in seen:
+            repeated[item] = True
+        seen.add(item)
+    return list(repeated)
+
+def check_repeated_resources(seat_ids: List[str], device_ids: List[str]) -> Optional[str]:
+    """Return why a request lists the same seat or device twice, or None if it doesn't"""
+    repeated_seats = find_repeated_ids(seat_ids)
+    if repeated_seats:
+        return f"Seats requested more than once: {', '.join(repeated_seats)}"
+    repeated_devices = find_repeated_ids(device_ids)
+    if repeated_devices:
+        return f"Devices requested more than once: {', '.join(repeated_devices)}"
+    return None
+
+def check_device_availability(device_ids: List[str], devices_by_id: dict, held: set) -> Optional[str]:
+    """Return why requested devices can't be assigned, or None if they all can"""
+    missing = [d for d in device_ids if d not in devices_by_id]
+    if missing:
+        return f"Devices not found: {', '.join(missing)}"
+    disabled = [devices_by_id[d]['deviceId'] for d in device_ids if not devices_by_id[d].get('enabled', True)]
+    if disabled:
+        return f"The following devices are disabled: {', '.join(disabled)}"
+    taken = [devices_by_id[d]['deviceId'] for d in device_ids if d in held]
+    if taken:
+        return f"The following devices are already assigned to another allocation: {', '.join(taken)}"
+    return None
+
+def build_new_allocation(allocation_id: str, property_id: str, guest: dict, fb_manager_id: str, seat_ids: List[str],
+                         device_ids: List[str], allocation_date: str, staff_ids: tuple) -> tuple:
+    """Build a new Allocation and its Mongo document; staff_ids comes from staffing.assign"""
+    attendant_ids, server_ids = staff_ids
+    initial_event = {
+        "eventType": "Created",
+        "oldValue": None,
+        "newValue": "Allocated",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "description": f"Allocation created for {guest['guestName']} (Room {guest['roomNumber']})"
+    }
+    
+    new_allocation = Allocation(
+        id=allocation_id,
+        propertyId=property_id,
+        guestId=guest['id'],
+        roomNumber=guest['roomNumber'],
+        guestName=guest['guestName'],
+        guestCategory=guest.get('category'),
+        fbManagerId=fb_manager_id,
+        poolBeachAttendantIds=attendant_ids,
+        fbServerIds=server_ids,
+        seatIds=seat_ids,
+        deviceIds=device_ids,
+        allocationDate=allocation_date,
+        status="Allocated",
+        recentEvents=[initial_event]
+    )
+    
+    allocation_dict = new_allocation.model_dump()
+    allocation_dict['createdAt'] = allocation_dict['createdAt'].isoformat()
+    allocation_dict['updatedAt'] = allocation_dict['updatedAt'].isoformat()
+    return new_allocation, allocation_dict
+
+def build_allocation_reservations(allocation_id: str, property_id: str, allocation_date: str, seat_ids: List[str], device_ids: List[str] = ()) -> List[dict]:
+    """Reservation documents claiming seats and devices for an allocation on a date"""
+    resources = [("seat", seat_id) for seat_id in seat_ids] + [("device", device_id) for device_id in device_ids]
+    return [
+        {
+            "propertyId": property_id,
+            "allocationDate": allocation_date,
+            "resourceType": resource_type,
+            "resourceId": resource_id,
+            "allocationId": allocation_id
+        }
+        for resource_type, resource_id in resources
+    ]
+
+def reservation_conflicts(error: BulkWriteError) -> List[str]:
+    """Resources ("seat <id>" / "device <id>") whose reservation insert hit the unique index"""
+    return [
+        f"{err['op']['resourceType']} {err['op']['resourceId']}"
+        for err in error.details.get('writeErrors', [])
+        if err.get('code') == 11000
+    ]
+
+async def insert_allocations(allocation_docs: List[dict]):
+    """Reserve seats and devices and write allocations, their Created events and seat statuses together.
+
+    allocation_reservations has a unique (propertyId, allocationDate, resourceType, resourceId)
+    index, so a seat or device claimed concurrently fails the whole batch with 409. Without
+    transactions, any failure removes what the batch had written before it is re-raised.
+    """
+    now = datetime.now(timezone.utc).isoformat()
+    reservations = []
+    events = []
+    seat_ids = []
+    active = {}
+    for doc in allocation_docs:
+        reservations.extend(build_allocation_reservations(
+            doc['id'], doc['propertyId'], doc['allocationDate'], doc['seatIds'], doc.get('deviceIds') or []
+        ))
+        events.append({
+            "id": str(uuid.uuid4()),
+            "allocationId": doc['id'],
+            "propertyId": doc['propertyId'],
+            **doc['recentEvents'][0]
+        })
+        seat_ids.extend(doc['seatIds'])
+        active[doc['propertyId']] = active.get(doc['propertyId'], 0) + 1
+    
+    reserved = []
+    
+    async def write(session):
+        if reservations:
+            await db.allocation_reservations.insert_many(reservations, ordered=False, session=session)
+        reserved.append(True)
+        await db.allocations.bulk_write([InsertOne(doc) for doc in allocation_docs], ordered=False, session=session)
+        await db.allocation_events.insert_many(events, session=session)
+        if seat_ids:
+            await set_seat_statuses(seat_ids, "Allocated", now, session=session)
+        for property_id, opened in active.items():
+            await bump_counters(property_id, {"allocations.active": opened}, session=session)
+    
+    async def undo():
+        # No transaction to roll back, so remove whatever this batch did write. The
+        # allocation ids are new, and once every reservation went in the seats were ours
+        allocation_ids = [doc['id'] for doc in allocation_docs]
+        await db.allocation_reservations.delete_many({"allocationId": {"$in": allocation_ids}})
+        await db.allocation_events.delete_many({"allocationId": {"$in": allocation_ids}})
+        await db.allocations.delete_many({"id": {"$in": allocation_ids}})
+        if reserved and seat_ids:
+            await set_seat_statuses(seat_ids, "Free", datetime.now(timezone.utc).isoformat())
+    
+    try:
+        await run_in_transaction(write)
+    except Exception as e:
+        if _transactions_supported is False:
+            try:
+                await undo()
+            except Exception as undo_error:
+                logger.error(f"Error undoing a failed allocation write: {str(undo_error)}")
+        conflicts = reservation_conflicts(e) if isinstance(e, BulkWriteError) else []
+        if not conflicts:
+            raise
+        raise HTTPException(
+            status_code=409,
+            detail=f"Seats or devices were just allocated by another request: {', '.join(conflicts)}. Refresh and try again."
+        )
+    for doc in allocation_docs:
+        availability_index.add_allocation(doc)
+        device_routes.add_allocation(doc)
+
+async def backfill_allocation_reservations():
+    """Create seat/device reservations for open allocations written before they were reserved"""
+    missing_types = [
+        resource_type for resource_type in ("seat", "device")
+        if not await db.allocation_reservations.find_one({"resourceType": resource_type}, {"_id": 1})
+    ]
+    if not missing_types:
+        return
+    
+    reservations = []
+    async for allocation in db.allocations.find(
+        {"status": {"$ne": "Complete"}},
+        {"_id": 0, "id": 1, "propertyId": 1, "allocationDate": 1, "seatIds": 1, "deviceIds": 1}
+    ):
+        reservations.extend(build_allocation_reservations(
+            allocation['id'],
+            allocation['propertyId'],
+            allocation['allocationDate'],
+            allocation.get('seatIds', []) if "seat" in missing_types else [],
+            allocation.get('deviceIds') or [] if "device" in missing_types else []
+        ))
+    
+    if reservations:
+        try:
+            await db.allocation_reservations.insert_many(reservations, ordered=False)
+        except BulkWriteError:
+            pass  # Already double-booked before reservations existed; keep the first
+        logger.info(f"Backfilled {len(reservations)} {'/'.join(missing_types)} reservations")
+
 # ============= ALLOCATION ENDPOINTS =============
 
 @api_router.get("/allocations/{property_id}")
-async def get_allocations_by_property(property_id: str, date: Optional[str] = None):
+async def get_allocations_by_property(property_id: str, date: Optional[str] = None, fields: Optional[str] = None):
     """Get all allocations for a property, optionally filtered by date"""
     try:
         query = {"propertyId": property_id}
         if date:
             query["allocationDate"] = date
         
-        allocations = await db.allocations.find(query, {"_id": 0}).to_list(10000)
+        allocations = await db.allocations.find(query, build_list_projection("allocations", fields)).to_list(10000)
         logger.info(f"Fetched {len(allocations)} allocations for property {property_id}")
         return {"success": True, "allocations": allocations}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching allocations: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
@@ -2884,25 +6004,12 @@ async def get_allocated_seats(property_id: str, date: Optional[str] = None):
     try:
         allocation_date = date or datetime.now(timezone.utc).strftime('%Y-%m-%d')
         
-        # Only get seats from non-complete allocations
-        allocations = await db.allocations.find(
-            {
-                "propertyId": property_id, 
-                "allocationDate": allocation_date,
-                "status": {"$nin": ["Complete"]}  # Exclude completed allocations
-            },
-            {"_id": 0, "seatIds": 1}
-        ).to_list(10000)
-        
-        # Collect all allocated seat IDs (only from active allocations)
-        allocated_seat_ids = set()
-        for allocation in allocations:
-            allocated_seat_ids.update(allocation.get('seatIds', []))
+        # Served from the availability index (non-complete allocations only)
+        held = await availability_index.get(property_id, allocation_date)
         
-        logger.info(f"Found {len(allocated_seat_ids)} allocated seats (non-complete) for property {property_id} on {allocation_date}")
         return {
             "success": True, 
-            "allocatedSeatIds": list(allocated_seat_ids),
+            "allocatedSeatIds": list(held["seat"]),
             "date": allocation_date
         }
     except Exception as e:
@@ -2915,35 +6022,40 @@ async def get_allocated_devices(property_id: str, date: Optional[str] = None):
     try:
         allocation_date = date or datetime.now(timezone.utc).strftime('%Y-%m-%d')
         
-        # Only get devices from non-complete allocations
-        allocations = await db.allocations.find(
-            {
-                "propertyId": property_id, 
-                "allocationDate": allocation_date,
-                "status": {"$nin": ["Complete"]}  # Exclude completed allocations
-            },
-            {"_id": 0, "deviceIds": 1}
-        ).to_list(10000)
-        
-        # Collect all allocated device IDs (only from active allocations)
-        allocated_device_ids = set()
-        for allocation in allocations:
-            allocated_device_ids.update(allocation.get('deviceIds', []))
+        # Served from the availability index (non-complete allocations only)
+        held = await availability_index.get(property_id, allocation_date)
         
-        logger.info(f"Found {len(allocated_device_ids)} allocated devices (non-complete) for property {property_id} on {allocation_date}")
         return {
             "success": True, 
-            "allocatedDeviceIds": list(allocated_device_ids),
+            "allocatedDeviceIds": list(held["device"]),
             "date": allocation_date
         }
     except Exception as e:
         logger.error(f"Error fetching allocated devices: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+@api_router.get("/allocations/{property_id}/availability-check")
+async def check_availability_index(property_id: str, date: Optional[str] = None, repair: bool = False):
+    """Compare the seat/device availability index with the allocations in the database"""
+    try:
+        allocation_date = date or datetime.now(timezone.utc).strftime('%Y-%m-%d')
+        report = await availability_index.verify(property_id, allocation_date, repair=repair)
+        
+        if not report["consistent"]:
+            logger.warning(f"Availability index drift for property {property_id} on {allocation_date}: {report}")
+        return {"success": True, "date": allocation_date, **report}
+    except Exception as e:
+        logger.error(f"Error checking availability index: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
 @api_router.post("/allocations")
 async def create_allocation(allocation: AllocationCreate):
     """Create a new seat allocation"""
     try:
+        repeated = check_repeated_resources(allocation.seatIds, allocation.deviceIds or [])
+        if repeated:
+            raise HTTPException(status_code=400, detail=repeated)
+        
         # Verify guest exists with the room number
         guest = await db.guests.find_one(
             {"propertyId": allocation.propertyId, "roomNumber": allocation.roomNumber},
@@ -2958,49 +6070,13 @@ async def create_allocation(allocation: AllocationCreate):
         
         # Check guest eligibility based on check-in/check-out times
         if guest.get('checkInDate') and guest.get('checkOutDate'):
-            # Fetch property configuration for check-in/check-out times
             configuration = await db.configurations.find_one(
                 {"propertyId": allocation.propertyId},
                 {"_id": 0}
             )
-            
-            if configuration:
-                now = datetime.now(timezone.utc)
-                current_date = now.strftime('%Y-%m-%d')  # YYYY-MM-DD
-                current_time = now.strftime('%H:%M')  # HH:MM
-                
-                check_in_date = guest['checkInDate']
-                check_out_date = guest['checkOutDate']
-                check_in_time = configuration.get('checkInTime', '14:00')
-                check_out_time = configuration.get('checkOutTime', '11:00')
-                
-                # Check if current date is before check-in date
-                if current_date < check_in_date:
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"Guest is not eligible. Check-in is on {check_in_date}"
-                    )
-                
-                # Check if current date is the check-in date but before check-in time
-                if current_date == check_in_date and current_time < check_in_time:
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"Guest is not eligible. Check-in time is {check_in_time}"
-                    )
-                
-                # Check if current date is after check-out date
-                if current_date > check_out_date:
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"Guest is not eligible. Already checked out on {check_out_date}"
-                    )
-                
-                # Check if current date is the check-out date and past check-out time
-                if current_date == check_out_date and current_time >= check_out_time:
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"Guest is not eligible. Check-out time was {check_out_time}"
-                    )
+            ineligible = check_guest_eligibility(guest, configuration, datetime.now(timezone.utc))
+            if ineligible:
+                raise HTTPException(status_code=400, detail=ineligible)
         
         # Verify F&B Manager exists
         fb_manager = await db.staff.find_one(
@@ -3014,12 +6090,16 @@ async def create_allocation(allocation: AllocationCreate):
         # Set allocation date to today if not provided
         allocation_date = allocation.allocationDate or datetime.now(timezone.utc).strftime('%Y-%m-%d')
         
-        # Check if any of the requested seats are blocked
-        blocked_seats = []
-        for seat_id in allocation.seatIds:
-            seat = await db.seats.find_one({"id": seat_id}, {"_id": 0})
-            if seat and seat.get('status') == 'Blocked':
-                blocked_seats.append(seat.get('seatNumber', seat_id))
+        # Check that the requested seats belong to the property and none are blocked
+        requested_seats = await db.seats.find(
+            {"id": {"$in": allocation.seatIds}, "propertyId": allocation.propertyId},
+            {"_id": 0, "id": 1, "seatNumber": 1, "status": 1, "staticDeviceId": 1}
+        ).to_list(len(allocation.seatIds) or 1)
+        seat_numbers = {seat['id']: seat.get('seatNumber', seat['id']) for seat in requested_seats}
+        missing_seats = [seat_id for seat_id in allocation.seatIds if seat_id not in seat_numbers]
+        if missing_seats:
+            raise HTTPException(status_code=400, detail=f"Seats not found: {', '.join(missing_seats)}")
+        blocked_seats = [seat_numbers[seat['id']] for seat in requested_seats if seat.get('status') == 'Blocked']
         
         if blocked_seats:
             raise HTTPException(
@@ -3032,134 +6112,232 @@ async def create_allocation(allocation: AllocationCreate):
             {
                 "propertyId": allocation.propertyId,
                 "allocationDate": allocation_date,
-                "status": {"$nin": ["Complete"]}  # Exclude completed allocations
+                "status": {"$nin": ["Complete"]},  # Exclude completed allocations
+                "seatIds": {"$in": allocation.seatIds}
             },
-            {"_id": 0}
+            {"_id": 0, "seatIds": 1, "guestName": 1, "roomNumber": 1}
         ).to_list(10000)
         
-        # Collect all already allocated seat IDs
-        already_allocated_seats = set()
-        conflicting_allocations = []
-        
-        for existing in existing_allocations:
-            existing_seat_ids = existing.get('seatIds', [])
-            for seat_id in allocation.seatIds:
-                if seat_id in existing_seat_ids:
-                    already_allocated_seats.add(seat_id)
-                    conflicting_allocations.append({
-                        'guestName': existing.get('guestName'),
-                        'roomNumber': existing.get('roomNumber')
-                    })
-        
         # If any seats are already allocated, return error with details
-        if already_allocated_seats:
-            # Get seat numbers for better error message
-            seat_numbers = []
-            for seat_id in already_allocated_seats:
-                seat = await db.seats.find_one({"id": seat_id}, {"_id": 0})
-                if seat:
-                    seat_numbers.append(seat.get('seatNumber', seat_id))
-            
-            # Get unique conflicting guests
+        if existing_allocations:
+            requested = set(allocation.seatIds)
+            already_allocated_seats = set()
             unique_conflicts = []
             seen = set()
-            for conflict in conflicting_allocations:
-                key = f"{conflict['roomNumber']}-{conflict['guestName']}"
+            for existing in existing_allocations:
+                already_allocated_seats.update(requested.intersection(existing.get('seatIds', [])))
+                key = f"{existing.get('roomNumber')}-{existing.get('guestName')}"
                 if key not in seen:
                     seen.add(key)
-                    unique_conflicts.append(conflict)
+                    unique_conflicts.append(existing)
             
-            conflict_details = ", ".join([f"{c['guestName']} (Room {c['roomNumber']})" for c in unique_conflicts[:3]])
+            conflict_details = ", ".join([f"{c.get('guestName')} (Room {c.get('roomNumber')})" for c in unique_conflicts[:3]])
             
             raise HTTPException(
                 status_code=400,
-                detail=f"The following seats are already allocated: {', '.join(seat_numbers)}. Currently allocated to: {conflict_details}"
+                detail=f"The following seats are already allocated: {', '.join(seat_numbers.get(s, s) for s in already_allocated_seats)}. Currently allocated to: {conflict_details}"
             )
         
-        # Determine which sections the allocated seats belong to
-        seat_groups = set()
-        for seat_id in allocation.seatIds:
-            seat = await db.seats.find_one({"id": seat_id}, {"_id": 0})
-            if seat and seat.get('sectionId'):
-                seat_groups.add(seat.get('sectionId'))
-        
-        # Find Pool And Beach Attendants and Food and Beverages Servers for these sections
-        # Get role IDs for the roles we need
-        pool_beach_attendant_role = await db.roles.find_one({"name": "Pool And Beach Attendant"}, {"_id": 0})
-        fb_server_role = await db.roles.find_one({"name": "Food and Beverages Server"}, {"_id": 0})
-        
-        pool_beach_attendant_ids = []
-        fb_server_ids = []
-        
-        # Note: We're checking all staff with these roles
-        # In a real system, you might want to track which staff are currently "on duty" for each section
-        if pool_beach_attendant_role:
-            attendants = await db.staff.find(
-                {
-                    "propertyId": allocation.propertyId,
-                    "roleId": pool_beach_attendant_role['id']
-                },
-                {"_id": 0}
-            ).to_list(1000)
-            pool_beach_attendant_ids = [s['id'] for s in attendants]
+        # Check the requested devices exist, are enabled and aren't held by another open allocation
+        device_ids = list(dict.fromkeys(allocation.deviceIds or []))
+        if device_ids:
+            devices = await db.devices.find(
+                {"id": {"$in": device_ids}, "propertyId": allocation.propertyId},
+                {"_id": 0, "id": 1, "deviceId": 1, "enabled": 1}
+            ).to_list(len(device_ids))
+            held = await availability_index.get(allocation.propertyId, allocation_date)
+            unavailable = check_device_availability(device_ids, {d['id']: d for d in devices}, held["device"])
+            if unavailable:
+                raise HTTPException(status_code=400, detail=unavailable)
+        
+        auto_device_id = None
+        if allocation.autoAssignDevice and not device_ids:
+            auto_device_id = await availability_index.take_free_device(
+                allocation.propertyId,
+                allocation_date,
+                [seat['staticDeviceId'] for seat in requested_seats if seat.get('staticDeviceId')]
+            )
+            if not auto_device_id:
+                raise HTTPException(status_code=409, detail="No free devices available to assign")
+            device_ids = [auto_device_id]
+        
+        # The least-loaded attendant and server for the seats' section
+        allocation_id = str(uuid.uuid4())
+        staff_ids = await staffing.assign(allocation.propertyId, allocation_id, allocation.seatIds)
+        new_allocation, allocation_dict = build_new_allocation(
+            allocation_id,
+            allocation.propertyId,
+            guest,
+            allocation.fbManagerId,
+            allocation.seatIds,
+            device_ids,
+            allocation_date,
+            staff_ids
+        )
         
-        if fb_server_role:
-            servers = await db.staff.find(
-                {
-                    "propertyId": allocation.propertyId,
-                    "roleId": fb_server_role['id']
-                },
-                {"_id": 0}
-            ).to_list(1000)
-            fb_server_ids = [s['id'] for s in servers]
-        
-        # Create initial event
-        initial_event = {
-            "eventType": "Created",
-            "oldValue": None,
-            "newValue": "Allocated",
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "description": f"Allocation created for {guest['guestName']} (Room {allocation.roomNumber})"
-        }
+        # Reserves the seats and devices, so a concurrent allocation of the same ones is rejected here
+        try:
+            await insert_allocations([allocation_dict])
+        except Exception:
+            if auto_device_id:
+                availability_index.return_device(allocation.propertyId, allocation_date, auto_device_id)
+            staffing.release(allocation_dict)
+            raise
         
-        new_allocation = Allocation(
-            propertyId=allocation.propertyId,
-            guestId=guest['id'],
-            roomNumber=allocation.roomNumber,
-            guestName=guest['guestName'],
-            guestCategory=guest.get('category'),
-            fbManagerId=allocation.fbManagerId,
-            poolBeachAttendantIds=pool_beach_attendant_ids,
-            fbServerIds=fb_server_ids,
-            seatIds=allocation.seatIds,
-            deviceIds=allocation.deviceIds or [],
-            allocationDate=allocation_date,
-            status="Allocated",
-            events=[initial_event]
-        )
+        logger.info(f"Allocation created: {new_allocation.id} with {len(allocation.seatIds)} seats")
+        return {"success": True, "allocation": new_allocation}
         
-        allocation_dict = new_allocation.model_dump()
-        allocation_dict['createdAt'] = allocation_dict['createdAt'].isoformat()
-        allocation_dict['updatedAt'] = allocation_dict['updatedAt'].isoformat()
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error creating allocation: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@api_router.post("/allocations/bulk")
+async def create_allocations_bulk(data: AllocationBulkCreate):
+    """Create allocations for a group of rooms in one request"""
+    try:
+        if not data.members:
+            raise HTTPException(status_code=400, detail="No group members provided")
         
-        await db.allocations.insert_one(allocation_dict)
+        allocation_date = data.allocationDate or datetime.now(timezone.utc).strftime('%Y-%m-%d')
+        rooms = [member.roomNumber for member in data.members]
+        all_seat_ids = list({seat_id for member in data.members for seat_id in member.seatIds})
+        all_device_ids = list({device_id for member in data.members for device_id in member.deviceIds or []})
         
-        # Update seat status to "Allocated"
-        await db.seats.update_many(
-            {"id": {"$in": allocation.seatIds}},
-            {"$set": {
-                "status": "Allocated",
-                "updatedAt": datetime.now(timezone.utc).isoformat()
-            }}
+        # One shared snapshot for the whole group
+        guests = await db.guests.find(
+            {"propertyId": data.propertyId, "roomNumber": {"$in": rooms}},
+            {"_id": 0}
+        ).to_list(10000)
+        configuration = await db.configurations.find_one({"propertyId": data.propertyId}, {"_id": 0})
+        fb_manager = await db.staff.find_one(
+            {"id": data.fbManagerId, "propertyId": data.propertyId},
+            {"_id": 0, "id": 1}
         )
+        if not fb_manager:
+            raise HTTPException(status_code=404, detail="F&B Manager not found")
+        seats = await db.seats.find(
+            {"id": {"$in": all_seat_ids}, "propertyId": data.propertyId},
+            {"_id": 0, "id": 1, "seatNumber": 1, "status": 1}
+        ).to_list(len(all_seat_ids) or 1)
+        existing_allocations = await db.allocations.find(
+            {
+                "propertyId": data.propertyId,
+                "allocationDate": allocation_date,
+                "status": {"$nin": ["Complete"]},
+                "seatIds": {"$in": all_seat_ids}
+            },
+            {"_id": 0, "seatIds": 1, "guestName": 1, "roomNumber": 1}
+        ).to_list(10000)
+        devices = await db.devices.find(
+            {"id": {"$in": all_device_ids}, "propertyId": data.propertyId},
+            {"_id": 0, "id": 1, "deviceId": 1, "enabled": 1}
+        ).to_list(len(all_device_ids) or 1)
+        held_devices = (await availability_index.get(data.propertyId, allocation_date))["device"]
+        
+        guests_by_room = {}
+        for guest in guests:
+            guests_by_room.setdefault(guest['roomNumber'], guest)
+        seats_by_id = {seat['id']: seat for seat in seats}
+        devices_by_id = {device['id']: device for device in devices}
+        taken_by = {}
+        for existing in existing_allocations:
+            for seat_id in existing.get('seatIds', []):
+                taken_by[seat_id] = f"{existing.get('guestName')} (Room {existing.get('roomNumber')})"
+        
+        now = datetime.now(timezone.utc)
+        failures = []
+        new_allocations = []
+        allocation_docs = []
+        claimed = {}  # seat/device ID -> room number, for seats or devices requested twice within the group
+        
+        for index, member in enumerate(data.members):
+            guest = guests_by_room.get(member.roomNumber)
+            error = None
+            if not guest:
+                error = f"No guest found in room number {member.roomNumber}"
+            elif not member.seatIds:
+                error = "No seats requested"
+            else:
+                error = check_repeated_resources(member.seatIds, member.deviceIds or [])
+            
+            if not error:
+                error = check_guest_eligibility(guest, configuration, now)
+            
+            if not error:
+                missing = [s for s in member.seatIds if s not in seats_by_id]
+                blocked = [seats_by_id[s].get('seatNumber', s) for s in member.seatIds if s in seats_by_id and seats_by_id[s].get('status') == 'Blocked']
+                taken = [f"{seats_by_id[s].get('seatNumber', s)} ({taken_by[s]})" for s in member.seatIds if s in taken_by]
+                duplicated = [f"{seats_by_id[s].get('seatNumber', s)} (Room {claimed[s]})" for s in member.seatIds if s in claimed]
+                if missing:
+                    error = f"Seats not found: {', '.join(missing)}"
+                elif blocked:
+                    error = f"The following seats are blocked and cannot be allocated: {', '.join(blocked)}"
+                elif taken:
+                    error = f"The following seats are already allocated: {', '.join(taken)}"
+                elif duplicated:
+                    error = f"The following seats are requested by another group member: {', '.join(duplicated)}"
+            
+            if not error and member.deviceIds:
+                error = check_device_availability(member.deviceIds, devices_by_id, held_devices)
+                duplicated = [f"{devices_by_id[d]['deviceId']} (Room {claimed[d]})" for d in member.deviceIds if d in claimed]
+                if not error and duplicated:
+                    error = f"The following devices are requested by another group member: {', '.join(duplicated)}"
+            
+            if error:
+                failures.append({"index": index, "roomNumber": member.roomNumber, "detail": error})
+                continue
+            
+            for resource_id in member.seatIds + (member.deviceIds or []):
+                claimed[resource_id] = member.roomNumber
+            allocation_id = str(uuid.uuid4())
+            staff_ids = await staffing.assign(data.propertyId, allocation_id, member.seatIds)
+            new_allocation, allocation_dict = build_new_allocation(
+                allocation_id,
+                data.propertyId,
+                guest,
+                data.fbManagerId,
+                member.seatIds,
+                member.deviceIds or [],
+                allocation_date,
+                staff_ids
+            )
+            new_allocations.append(new_allocation)
+            allocation_docs.append(allocation_dict)
         
-        logger.info(f"Allocation created: {new_allocation.id} with {len(allocation.seatIds)} seats")
-        return {"success": True, "allocation": new_allocation}
+        if failures and data.allOrNothing:
+            for doc in allocation_docs:
+                staffing.release(doc)
+            raise HTTPException(
+                status_code=400,
+                detail={
+                    "message": f"{len(failures)} of {len(data.members)} group members cannot be allocated; nothing was created",
+                    "failures": failures
+                }
+            )
+        
+        if allocation_docs:
+            try:
+                await insert_allocations(allocation_docs)
+            except Exception:
+                for doc in allocation_docs:
+                    staffing.release(doc)
+                raise
+        
+        logger.info(f"Bulk allocation for property {data.propertyId}: {len(allocation_docs)} created, {len(failures)} failed")
+        return {
+            "success": True,
+            "message": f"Created {len(allocation_docs)} allocations",
+            "count": len(allocation_docs),
+            "allocations": new_allocations,
+            "failures": failures
+        }
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error creating allocation: {str(e)}")
+        logger.error(f"Error creating bulk allocations: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @api_router.put("/allocations/{allocation_id}")
@@ -3171,17 +6349,75 @@ async def update_allocation(allocation_id: str, allocation: AllocationUpdate):
         if not update_data:
             raise HTTPException(status_code=400, detail="No fields to update")
         
-        update_data['updatedAt'] = datetime.now(timezone.utc).isoformat()
+        existing = await db.allocations.find_one({"id": allocation_id}, {"_id": 0})
+        if not existing:
+            raise HTTPException(status_code=404, detail="Allocation not found")
         
-        result = await db.allocations.update_one(
-            {"id": allocation_id},
-            {"$set": update_data}
+        repeated = check_repeated_resources(update_data.get('seatIds', []), [])
+        if repeated:
+            raise HTTPException(status_code=400, detail=repeated)
+        
+        now = datetime.now(timezone.utc).isoformat()
+        update_data['updatedAt'] = now
+        
+        old_seat_ids = set(existing.get('seatIds', []))
+        new_seat_ids = update_data.get('seatIds', existing.get('seatIds', []))
+        new_date = update_data.get('allocationDate', existing['allocationDate'])
+        rebook = existing.get('status') != "Complete" and (
+            set(new_seat_ids) != old_seat_ids or new_date != existing['allocationDate']
         )
         
-        if result.matched_count == 0:
-            raise HTTPException(status_code=404, detail="Allocation not found")
+        async def write(session):
+            if rebook:
+                # Swap the reservations; the unique index rejects seats or devices held by someone else
+                await db.allocation_reservations.delete_many({"allocationId": allocation_id}, session=session)
+                reservations = build_allocation_reservations(
+                    allocation_id, existing['propertyId'], new_date, new_seat_ids, existing.get('deviceIds') or []
+                )
+                if reservations:
+                    await db.allocation_reservations.insert_many(reservations, ordered=False, session=session)
+                
+                released = list(old_seat_ids - set(new_seat_ids))
+                if released:
+                    await set_seat_statuses(released, "Free", now, session=session)
+                if new_seat_ids:
+                    await set_seat_statuses(new_seat_ids, "Allocated", now, session=session)
+            
+            return await db.allocations.find_one_and_update(
+                {"id": allocation_id},
+                {"$set": update_data},
+                projection={"_id": 0},
+                return_document=ReturnDocument.AFTER,
+                session=session
+            )
         
-        updated_allocation = await db.allocations.find_one({"id": allocation_id}, {"_id": 0})
+        try:
+            updated_allocation = await run_in_transaction(write)
+            if rebook:
+                availability_index.release_allocation(existing)
+                availability_index.add_allocation(updated_allocation)
+                device_routes.release_allocation(existing)
+                device_routes.add_allocation(updated_allocation)
+        except BulkWriteError as e:
+            conflicts = reservation_conflicts(e)
+            if not conflicts:
+                raise
+            if not _transactions_supported:
+                # No transaction to roll back: restore the original reservations
+                await db.allocation_reservations.delete_many({"allocationId": allocation_id})
+                original = build_allocation_reservations(
+                    allocation_id,
+                    existing['propertyId'],
+                    existing['allocationDate'],
+                    existing.get('seatIds', []),
+                    existing.get('deviceIds') or []
+                )
+                if original:
+                    await db.allocation_reservations.insert_many(original, ordered=False)
+            raise HTTPException(
+                status_code=409,
+                detail=f"The following are already allocated on {new_date}: {', '.join(conflicts)}"
+            )
         
         logger.info(f"Allocation updated: {allocation_id}")
         return {"success": True, "allocation": updated_allocation}
@@ -3196,55 +6432,10 @@ async def update_allocation(allocation_id: str, allocation: AllocationUpdate):
 async def update_allocation_status(allocation_id: str, status_update: AllocationStatusUpdate):
     """Update allocation status (Allocated, Active, Billing, Clear, Complete)"""
     try:
-        valid_statuses = ["Allocated", "Active", "Billing", "Clear", "Complete"]
-        if status_update.status not in valid_statuses:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Invalid status. Must be one of: {', '.join(valid_statuses)}"
-            )
-        
-        # Get allocation first
-        allocation = await db.allocations.find_one({"id": allocation_id}, {"_id": 0})
-        if not allocation:
-            raise HTTPException(status_code=404, detail="Allocation not found")
-        
-        old_status = allocation.get('status', 'Allocated')
-        
-        # Create event for status change
-        status_event = {
-            "eventType": "Status Change",
-            "oldValue": old_status,
-            "newValue": status_update.status,
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "description": f"Status changed from {old_status} to {status_update.status}"
-        }
-        
-        # Update allocation status and add event
-        result = await db.allocations.update_one(
-            {"id": allocation_id},
-            {
-                "$set": {
-                    "status": status_update.status,
-                    "updatedAt": datetime.now(timezone.utc).isoformat()
-                },
-                "$push": {"events": status_event}
-            }
+        updated_allocation = await apply_allocation_transition(
+            allocation_id, "status", status_update.status, status_update.expectedStatus
         )
         
-        # If status changed to "Complete", set seat status back to "Free"
-        if status_update.status == "Complete":
-            seat_ids = allocation.get('seatIds', [])
-            await db.seats.update_many(
-                {"id": {"$in": seat_ids}},
-                {"$set": {
-                    "status": "Free",
-                    "updatedAt": datetime.now(timezone.utc).isoformat()
-                }}
-            )
-            logger.info(f"Released {len(seat_ids)} seats from allocation {allocation_id}")
-        
-        updated_allocation = await db.allocations.find_one({"id": allocation_id}, {"_id": 0})
-        
         logger.info(f"Allocation status updated: {allocation_id} -> {status_update.status}")
         return {"success": True, "allocation": updated_allocation}
         
@@ -3258,51 +6449,295 @@ async def update_allocation_status(allocation_id: str, status_update: Allocation
 async def update_allocation_calling_flag(allocation_id: str, flag_update: AllocationCallingFlagUpdate):
     """Update allocation calling flag (Non Calling, Calling, Calling for Checkout)"""
     try:
-        valid_flags = ["Non Calling", "Calling", "Calling for Checkout"]
-        if flag_update.callingFlag not in valid_flags:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Invalid calling flag. Must be one of: {', '.join(valid_flags)}"
-            )
+        updated_allocation = await apply_allocation_transition(
+            allocation_id, "callingFlag", flag_update.callingFlag, flag_update.expectedCallingFlag, flag_update.staffId
+        )
         
-        # Get allocation first
-        allocation = await db.allocations.find_one({"id": allocation_id}, {"_id": 0})
-        if not allocation:
-            raise HTTPException(status_code=404, detail="Allocation not found")
+        logger.info(f"Allocation calling flag updated: {allocation_id} -> {flag_update.callingFlag}")
+        return {"success": True, "allocation": updated_allocation}
         
-        old_flag = allocation.get('callingFlag', 'Non Calling')
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error updating allocation calling flag: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@api_router.post("/devices/events")
+async def ingest_device_events(batch: DeviceEventBatch):
+    """Call-button presses from physical devices, in batches.
+
+    Each press sets the calling flag on the open allocation holding the device. Repeats of
+    the same action within DEVICE_PRESS_DEDUPE_SECONDS are dropped, only the last press per
+    allocation in a batch is applied, and presses that wouldn't change the flag cost no write.
+    Results are per event, in order: applied, unchanged, duplicate, superseded, unknownDevice,
+    noAllocation, invalidAction or rejected.
+    """
+    try:
+        if len(batch.events) > DEVICE_EVENT_BATCH_LIMIT:
+            raise HTTPException(status_code=400, detail=f"At most {DEVICE_EVENT_BATCH_LIMIT} events per batch")
+        
+        entry = await device_routes.get(batch.propertyId)
+        now = time.monotonic()
+        results = [None] * len(batch.events)
+        latest = {}  # allocationId -> (event index, target flag, route)
+        for index, event in enumerate(batch.events):
+            target = DEVICE_ACTIONS.get(event.action)
+            device_id = entry["devices"].get(event.deviceId)
+            route = entry["routes"].get(device_id)
+            if target is None:
+                results[index] = "invalidAction"
+            elif device_id is None:
+                results[index] = "unknownDevice"
+            elif route is None:
+                results[index] = "noAllocation"
+            elif now - route["pressed"].get(event.action, -math.inf) < DEVICE_PRESS_DEDUPE_SECONDS:
+                results[index] = "duplicate"
+            else:
+                route["pressed"][event.action] = now
+                if route["allocationId"] in latest:
+                    results[latest[route["allocationId"]][0]] = "superseded"
+                latest[route["allocationId"]] = (index, target, route)
+        
+        semaphore = asyncio.Semaphore(DEVICE_EVENT_CONCURRENCY)
+        
+        async def apply(index: int, target: str, route: dict):
+            async with semaphore:
+                for attempt in range(2):
+                    if route["callingFlag"] == target:
+                        results[index] = "unchanged"
+                        return
+                    try:
+                        await apply_allocation_transition(route["allocationId"], "callingFlag", target, route["callingFlag"])
+                        results[index] = "applied"
+                        return
+                    except HTTPException as e:
+                        if e.status_code != 409 or attempt:
+                            results[index] = "rejected"
+                            return
+                    # The cached flag was stale (staff changed it); refresh it and try once more
+                    current = await db.allocations.find_one(
+                        {"id": route["allocationId"]}, {"_id": 0, "callingFlag": 1, "status": 1}
+                    )
+                    if not current or current.get('status') == "Complete":
+                        results[index] = "noAllocation"
+                        return
+                    route["callingFlag"] = current.get('callingFlag', "Non Calling")
         
-        # Create event for calling flag change
-        event_type = "Calling On" if flag_update.callingFlag != "Non Calling" else "Calling Off"
-        calling_event = {
-            "eventType": event_type,
-            "oldValue": old_flag,
-            "newValue": flag_update.callingFlag,
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "description": f"Calling flag changed from {old_flag} to {flag_update.callingFlag}"
-        }
+        await asyncio.gather(*(apply(*item) for item in latest.values()))
         
-        # Update allocation calling flag and add event
-        result = await db.allocations.update_one(
-            {"id": allocation_id},
+        counts = {}
+        for result in results:
+            counts[result] = counts.get(result, 0) + 1
+        return {"success": True, "received": len(batch.events), "counts": counts, "results": results}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error ingesting device events: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@api_router.post("/devices/telemetry")
+async def ingest_device_telemetry(batch: DeviceTelemetryBatch):
+    """Heartbeats, battery levels and signal strength from physical devices, in batches.
+
+    Raw readings are stored as they are and folded into the 1-minute and 1-hour rollups in
+    the same request, so every resolution is current once the batch is acknowledged. Results
+    are per reading, in order: accepted, unknownDevice or invalid.
+    """
+    try:
+        if len(batch.readings) > TELEMETRY_BATCH_LIMIT:
+            raise HTTPException(status_code=400, detail=f"At most {TELEMETRY_BATCH_LIMIT} readings per batch")
+
+        devices = await device_last_seen.get(batch.propertyId)
+        now = datetime.now(timezone.utc)
+        results = []
+        accepted = []
+        for reading in batch.readings:
+            at = reading.timestamp or now
+            if at.tzinfo is None:
+                at = at.replace(tzinfo=timezone.utc)
+            if reading.deviceId not in devices:
+                results.append("unknownDevice")
+            elif (
+                (at - now).total_seconds() > TELEMETRY_CLOCK_SKEW_SECONDS or
+                (reading.battery is not None and not 0 <= reading.battery <= 100) or
+                (reading.signal is not None and not math.isfinite(reading.signal))
+            ):
+                results.append("invalid")
+            else:
+                results.append("accepted")
+                accepted.append({"deviceId": reading.deviceId, "at": at.astimezone(timezone.utc),
+                                 "battery": reading.battery, "signal": reading.signal})
+
+        if accepted:
+            accepted.sort(key=lambda reading: reading['at'])
+            raw = TELEMETRY_RESOLUTIONS['raw']
+            await asyncio.gather(
+                db[raw['collection']].insert_many([
+                    {
+                        "propertyId": batch.propertyId,
+                        "deviceId": reading['deviceId'],
+                        "timestamp": reading['at'].isoformat(),
+                        "battery": reading['battery'],
+                        "signal": reading['signal'],
+                        "expireAt": reading['at'] + timedelta(days=raw['retentionDays'])
+                    }
+                    for reading in accepted
+                ], ordered=False),
+                *(
+                    db[spec['collection']].bulk_write(
+                        telemetry_rollup_writes(batch.propertyId, accepted, resolution), ordered=False
+                    )
+                    for resolution, spec in TELEMETRY_RESOLUTIONS.items() if spec['seconds']
+                )
+            )
+            device_last_seen.record(batch.propertyId, accepted)
+
+        counts = {}
+        for result in results:
+            counts[result] = counts.get(result, 0) + 1
+        return {"success": True, "received": len(batch.readings), "counts": counts, "results": results}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error ingesting device telemetry: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@api_router.get("/devices/{property_id}/silent")
+async def get_silent_devices(property_id: str, minutes: int = 15, includeDisabled: bool = False):
+    """Devices that haven't reported for N minutes, longest-silent first, from the last-seen table"""
+    try:
+        if minutes < 1:
+            raise HTTPException(status_code=400, detail="minutes must be at least 1")
+
+        devices = await device_last_seen.get(property_id)
+        now = datetime.now(timezone.utc)
+        cutoff = now - timedelta(minutes=minutes)
+        silent = [
             {
-                "$set": {
-                    "callingFlag": flag_update.callingFlag,
-                    "updatedAt": datetime.now(timezone.utc).isoformat()
-                },
-                "$push": {"events": calling_event}
+                "deviceId": device_id,
+                "enabled": device['enabled'],
+                "lastSeenAt": device['lastSeenAt'].isoformat() if device['lastSeenAt'] else None,
+                "silentMinutes": round((now - device['lastSeenAt']).total_seconds() / 60, 1) if device['lastSeenAt'] else None,
+                "battery": device['battery'],
+                "signal": device['signal']
             }
-        )
+            for device_id, device in devices.items()
+            if (includeDisabled or device['enabled']) and (device['lastSeenAt'] is None or device['lastSeenAt'] < cutoff)
+        ]
+        # Never heard from sorts first, then oldest last-seen
+        silent.sort(key=lambda device: device['lastSeenAt'] or "")
+
+        return {
+            "success": True,
+            "propertyId": property_id,
+            "minutes": minutes,
+            "tracked": sum(1 for device in devices.values() if includeDisabled or device['enabled']),
+            "devices": silent
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching silent devices: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@api_router.get("/devices/{property_id}/telemetry/{device_id}")
+async def get_device_telemetry(property_id: str, device_id: str, resolution: str = "1m", hours: float = 24):
+    """One device's raw readings or rollups (1m, 1h) over the last N hours, oldest first"""
+    try:
+        spec = TELEMETRY_RESOLUTIONS.get(resolution)
+        if spec is None:
+            raise HTTPException(status_code=400, detail=f"resolution must be one of {', '.join(TELEMETRY_RESOLUTIONS)}")
+        if hours <= 0 or hours > spec['retentionDays'] * 24:
+            raise HTTPException(status_code=400, detail=f"hours must be between 0 and {spec['retentionDays'] * 24} at {resolution}")
+
+        since = datetime.now(timezone.utc) - timedelta(hours=hours)
+        field = "bucket" if spec['seconds'] else "timestamp"
+        if spec['seconds']:
+            since = telemetry_bucket(since, spec['seconds'])
+        # Newest first so the limit keeps the most recent points, then back into time order
+        docs = await db[spec['collection']].find(
+            {"propertyId": property_id, "deviceId": device_id, field: {"$gte": since.isoformat()}},
+            {"_id": 0, "propertyId": 0, "deviceId": 0, "expireAt": 0}
+        ).sort(field, -1).limit(TELEMETRY_SERIES_LIMIT).to_list(TELEMETRY_SERIES_LIMIT)
+        docs.reverse()
+
+        return {
+            "success": True,
+            "propertyId": property_id,
+            "deviceId": device_id,
+            "resolution": resolution,
+            "points": [telemetry_point(doc) for doc in docs] if spec['seconds'] else docs
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching device telemetry: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@api_router.get("/calling-response-times/{property_id}")
+async def get_calling_response_times(property_id: str, groupBy: str = "section", days: int = 1):
+    """Response time percentiles to guest calls, per section or attendant, plus calls still waiting"""
+    try:
+        if groupBy not in ("section", "attendant"):
+            raise HTTPException(status_code=400, detail="groupBy must be section or attendant")
+        if days < 1 or days > CALLING_LATENCY_WINDOW_DAYS:
+            raise HTTPException(status_code=400, detail=f"days must be between 1 and {CALLING_LATENCY_WINDOW_DAYS}")
+        
+        overall = calling_tracker.report(property_id, "property", days).get(property_id, LatencyHistogram())
+        groups = calling_tracker.report(property_id, groupBy, days)
+        collection = db.sections if groupBy == "section" else db.staff
+        names = {
+            doc['id']: doc['name'] async for doc in collection.find(
+                {"id": {"$in": list(groups)}}, {"_id": 0, "id": 1, "name": 1}
+            )
+        }
         
-        updated_allocation = await db.allocations.find_one({"id": allocation_id}, {"_id": 0})
+        return {
+            "success": True,
+            "propertyId": property_id,
+            "days": days,
+            "slaSeconds": CALLING_SLA_SECONDS,
+            "overall": overall.summary(),
+            "groups": sorted((
+                {"id": key, "name": names.get(key), **histogram.summary()}
+                for key, histogram in groups.items()
+            ), key=lambda group: group['p95Seconds'], reverse=True),
+            "openCalls": calling_tracker.open_calls(property_id)
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching calling response times: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@api_router.get("/allocations/{allocation_id}/events")
+async def get_allocation_events(allocation_id: str, skip: int = 0, limit: int = 100):
+    """Get a page of the allocation event timeline, oldest first"""
+    try:
+        if skip < 0 or limit < 1 or limit > 500:
+            raise HTTPException(status_code=400, detail="skip must be >= 0 and limit between 1 and 500")
+        
+        # Archived allocations keep their timeline in allocation_events_archive
+        archived = await db.allocations_archive.find_one({"id": allocation_id}, {"_id": 1})
+        collection = db.allocation_events_archive if archived else db.allocation_events
+        events = await collection.find(
+            {"allocationId": allocation_id},
+            {"_id": 0}
+        ).sort([("timestamp", 1), ("_id", 1)]).skip(skip).limit(limit + 1).to_list(limit + 1)
         
-        logger.info(f"Allocation calling flag updated: {allocation_id} -> {flag_update.callingFlag}")
-        return {"success": True, "allocation": updated_allocation}
+        has_more = len(events) > limit
+        return {
+            "success": True,
+            "events": events[:limit],
+            "skip": skip,
+            "limit": limit,
+            "hasMore": has_more
+        }
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error updating allocation calling flag: {str(e)}")
+        logger.error(f"Error fetching allocation events: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @api_router.delete("/allocations/{allocation_id}")
@@ -3315,19 +6750,20 @@ async def delete_allocation(allocation_id: str):
         if not allocation:
             raise HTTPException(status_code=404, detail="Allocation not found")
         
-        # Delete allocation
+        # Delete allocation and its timeline
         await db.allocations.delete_one({"id": allocation_id})
+        await db.allocation_events.delete_many({"allocationId": allocation_id})
+        await db.allocation_reservations.delete_many({"allocationId": allocation_id})
+        if allocation.get('status') != "Complete":
+            availability_index.release_allocation(allocation)
+            device_routes.release_allocation(allocation)
+            staffing.release(allocation)
+            await bump_counters(allocation['propertyId'], {"allocations.active": -1})
         
         # Free up seats
         seat_ids = allocation.get('seatIds', [])
         if seat_ids:
-            await db.seats.update_many(
-                {"id": {"$in": seat_ids}},
-                {"$set": {
-                    "status": "Free",
-                    "updatedAt": datetime.now(timezone.utc).isoformat()
-                }}
-            )
+            await set_seat_statuses(seat_ids, "Free", datetime.now(timezone.utc).isoformat())
         
         logger.info(f"Allocation deleted: {allocation_id}, freed {len(seat_ids)} seats")
         return {"success": True, "message": "Allocation deleted successfully"}
@@ -3339,6 +6775,46 @@ async def delete_allocation(allocation_id: str):
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 
+# ============= NOTIFICATION ENDPOINTS =============
+
+@api_router.get("/notifications/staff/{staff_id}")
+async def get_staff_notifications(staff_id: str, unread_only: bool = False, limit: int = 50):
+    """Get the most recent notifications for a staff member"""
+    try:
+        query = {"staffId": staff_id}
+        if unread_only:
+            query["read"] = False
+        
+        notifications = await db.notifications.find(
+            query,
+            {"_id": 0}
+        ).sort("createdAt", -1).limit(min(max(limit, 1), 500)).to_list(500)
+        
+        return {"success": True, "notifications": notifications}
+    except Exception as e:
+        logger.error(f"Error fetching notifications: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@api_router.patch("/notifications/{notification_id}/read")
+async def mark_notification_read(notification_id: str):
+    """Mark a notification as read"""
+    try:
+        result = await db.notifications.update_one(
+            {"id": notification_id},
+            {"$set": {"read": True}}
+        )
+        
+        if result.matched_count == 0:
+            raise HTTPException(status_code=404, detail="Notification not found")
+        
+        return {"success": True, "message": "Notification marked as read"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error updating notification: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+
 # Staff Login Endpoint
 @api_router.post("/staff/login", response_model=StaffLoginResponse)
 async def staff_login(request: StaffLoginRequest):
@@ -3373,6 +6849,9 @@ async def staff_login(request: StaffLoginRequest):
             "propertyId": staff['propertyId']
         }
         
+        role = await db.roles.find_one({"id": staff['roleId']}, {"_id": 0, "name": 1})
+        if not role or role.get('name') not in SECTION_CHECK_IN_ROLES:
+            await presence.check_in(staff['id'], staff['propertyId'])
         logger.info(f"Staff login successful: {staff['username']} ({staff['name']})")
         
         return StaffLoginResponse(
@@ -3389,6 +6868,99 @@ async def staff_login(request: StaffLoginRequest):
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 
+@api_router.post("/staff/{staff_id}/logout")
+async def staff_logout(staff_id: str):
+    """Take a staff member off duty, handing their open allocations to colleagues"""
+    try:
+        staff = await db.staff.find_one({"id": staff_id}, {"_id": 0, "propertyId": 1})
+        if not staff:
+            raise HTTPException(status_code=404, detail="Staff member not found")
+        
+        moved = await presence.check_out(staff_id, staff['propertyId'], "logout")
+        logger.info(f"Staff logout: {staff_id}, {moved} allocations handed over")
+        return {"success": True, "message": "Logged out", "allocationsReassigned": moved}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error during staff logout: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@api_router.post("/staff/{staff_id}/check-in")
+async def staff_check_in(staff_id: str, request: StaffCheckIn):
+    """Go on duty for a section, or the whole property without one; switches section if already on duty"""
+    try:
+        staff = await db.staff.find_one({"id": staff_id}, {"_id": 0, "propertyId": 1})
+        if not staff:
+            raise HTTPException(status_code=404, detail="Staff member not found")
+        if request.sectionId and not await db.sections.find_one(
+            {"id": request.sectionId, "propertyId": staff['propertyId']}, {"_id": 1}
+        ):
+            raise HTTPException(status_code=404, detail="Section not found")
+        
+        entry = await presence.check_in(staff_id, staff['propertyId'], request.sectionId)
+        logger.info(f"Staff checked in: {staff_id} to section {request.sectionId or 'all'}")
+        return {"success": True, "presence": {"staffId": staff_id, **entry}}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error checking staff in: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@api_router.post("/staff/{staff_id}/heartbeat")
+async def staff_heartbeat(staff_id: str):
+    """Keep an on-duty staff member checked in; 404 means the shift expired and they must check in again"""
+    entry = presence.heartbeat(staff_id)
+    if not entry:
+        raise HTTPException(status_code=404, detail="Not checked in")
+    return {"success": True, "expiresInSeconds": PRESENCE_TIMEOUT_SECONDS}
+
+@api_router.post("/staff/{staff_id}/check-out")
+async def staff_check_out(staff_id: str):
+    """Go off duty, handing open allocations to colleagues"""
+    try:
+        staff = await db.staff.find_one({"id": staff_id}, {"_id": 0, "propertyId": 1})
+        if not staff:
+            raise HTTPException(status_code=404, detail="Staff member not found")
+        
+        moved = await presence.check_out(staff_id, staff['propertyId'], "checkout")
+        logger.info(f"Staff checked out: {staff_id}, {moved} allocations handed over")
+        return {"success": True, "message": "Checked out", "allocationsReassigned": moved}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error checking staff out: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@api_router.get("/presence/{property_id}")
+async def get_presence(property_id: str, sectionId: Optional[str] = None):
+    """Staff on duty at a property, optionally only those covering one section"""
+    try:
+        entries = presence.on_duty(property_id, sectionId)
+        names = {
+            s['id']: s['name'] async for s in db.staff.find(
+                {"id": {"$in": [e['staffId'] for e in entries]}}, {"_id": 0, "id": 1, "name": 1}
+            )
+        }
+        return {"success": True, "staff": [{**entry, "name": names.get(entry['staffId'])} for entry in entries]}
+    except Exception as e:
+        logger.error(f"Error fetching presence: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@api_router.get("/staffing/{property_id}")
+async def get_staffing(property_id: str):
+    """Current workload of each attendant and server: open allocations, outstanding calls, duty status"""
+    try:
+        rows = await staffing.snapshot(property_id)
+        names = {
+            s['id']: s['name'] async for s in db.staff.find(
+                {"id": {"$in": [row['staffId'] for row in rows]}}, {"_id": 0, "id": 1, "name": 1}
+            )
+        }
+        return {"success": True, "staff": [{**row, "name": names.get(row['staffId'])} for row in rows]}
+    except Exception as e:
+        logger.error(f"Error fetching staffing: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
 @api_router.post("/user/login", response_model=VerifyOTPResponse)
 async def verify_otp_login(request: VerifyOTPRequest):
     """
@@ -3457,51 +7029,880 @@ async def verify_otp_login(request: VerifyOTPRequest):
         logger.error(f"Error verifying OTP: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+# ============= ANALYTICS =============
+
+# Each property day is summarised once into analytics_daily, and reports add up the
+# summaries. The day is the allocation's allocationDate and hours are UTC, like every
+# timestamp we store. Days from the last ANALYTICS_OPEN_DAYS may still change (late
+# status events), so they are computed live and not stored.
+ANALYTICS_OPEN_DAYS = 2
+# Stored summaries with an older version are recomputed when next read
+ANALYTICS_SUMMARY_VERSION = 2
+ANALYTICS_MAX_RANGE_DAYS = 366
+# Upper edges, in seconds, of the calling latency histogram buckets; the last bucket is open-ended
+CALLING_LATENCY_BUCKETS = [30, 60, 120, 300, 600, 900, 1800, 3600]
+
+def empty_day_analytics() -> dict:
+    return {
+        "allocations": 0,
+        "allocationsByStatus": {},
+        "seatHours": 0.0,
+        "callingEvents": 0,
+        "seatHoursByHour": [0.0] * 24,
+        "seatHoursBySection": {},
+        "seatHoursBySeatType": {},
+        "statusSeconds": {},
+        "callingLatency": {"count": 0, "totalSeconds": 0.0, "maxSeconds": 0.0,
+                           "buckets": [0] * (len(CALLING_LATENCY_BUCKETS) + 1)}
+    }
+
+def compute_day_analytics(day: str, allocations: List[dict], events: List[dict], seats: List[dict], now: datetime) -> dict:
+    """Summarise one property day: seat-hours per UTC hour, section and seat type, time spent
+    in each status, and how long calls waited before the calling flag was turned off"""
+    summary = empty_day_analytics()
+    if not allocations:
+        return summary
+    summary["allocations"] = len(allocations)
+    for allocation in allocations:
+        status = allocation.get('status', "Allocated")
+        summary["allocationsByStatus"][status] = summary["allocationsByStatus"].get(status, 0) + 1
+    day_start = pd.Timestamp(day, tz="UTC")
+    horizon = min(day_start + pd.Timedelta(days=1), pd.Timestamp(now))
+    
+    ev = pd.DataFrame(events, columns=["allocationId", "eventType", "newValue", "timestamp"])
+    ev["timestamp"] = pd.to_datetime(ev["timestamp"], utc=True, format="ISO8601")
+    ev = ev.sort_values(["allocationId", "timestamp"], kind="stable")
+    
+    # A status lasts from its event to the allocation's next status event
+    status_ev = ev[ev["eventType"].isin(["Created", "Status Change"])].copy()
+    status_ev["end"] = status_ev.groupby("allocationId")["timestamp"].shift(-1)
+    closed = status_ev.dropna(subset=["end"])
+    durations = (closed["end"] - closed["timestamp"]).dt.total_seconds()
+    for status, row in durations.groupby(closed["newValue"]).agg(["sum", "count"]).iterrows():
+        summary["statusSeconds"][status] = {"total": float(row["sum"]), "count": int(row["count"])}
+    
+    # Seats are occupied from creation until Complete, or to the end of the day (or now)
+    alloc = pd.DataFrame(
+        {"seats": [len(a.get('seatIds') or []) for a in allocations]},
+        index=pd.Index([a['id'] for a in allocations], name="allocationId")
+    )
+    created = status_ev.groupby("allocationId")["timestamp"].min()
+    completed = status_ev[status_ev["newValue"] == "Complete"].groupby("allocationId")["timestamp"].min()
+    start = created.reindex(alloc.index).fillna(day_start).clip(lower=day_start, upper=horizon)
+    end = completed.reindex(alloc.index).fillna(horizon).clip(lower=day_start, upper=horizon)
+    start_s = (start - day_start).dt.total_seconds().to_numpy()
+    end_s = np.maximum((end - day_start).dt.total_seconds().to_numpy(), start_s)
+    
+    edges = np.arange(25) * 3600.0
+    overlap = np.clip(np.minimum(end_s[:, None], edges[1:]) - np.maximum(start_s[:, None], edges[:-1]), 0, None)
+    seat_hours_by_hour = (overlap * alloc["seats"].to_numpy()[:, None]).sum(axis=0) / 3600
+    summary["seatHoursByHour"] = seat_hours_by_hour.round(3).tolist()
+    summary["seatHours"] = round(float(seat_hours_by_hour.sum()), 3)
+    
+    occupied_hours = pd.Series((end_s - start_s) / 3600, index=alloc.index)
+    pairs = pd.DataFrame(
+        [(a['id'], seat_id) for a in allocations for seat_id in a.get('seatIds') or []],
+        columns=["allocationId", "seatId"]
+    )
+    if not pairs.empty:
+        seat_df = pd.DataFrame(seats, columns=["id", "sectionId", "seatTypeId"]).set_index("id")
+        pairs = pairs.join(seat_df, on="seatId")
+        pairs["hours"] = pairs["allocationId"].map(occupied_hours)
+        for column, key in (("sectionId", "seatHoursBySection"), ("seatTypeId", "seatHoursBySeatType")):
+            grouped = pairs["hours"].groupby(pairs[column].replace("", None).fillna("unassigned")).sum()
+            summary[key] = {name: round(float(hours), 3) for name, hours in grouped.items()}
+    
+    # A call starts at a Calling On that follows no other Calling On and ends at the next Calling Off
+    calls = ev[ev["eventType"].isin(["Calling On", "Calling Off"])].copy()
+    if not calls.empty:
+        summary["callingEvents"] = int((calls["eventType"] == "Calling On").sum())
+        is_on = calls["eventType"] == "Calling On"
+        follows_on = is_on.groupby(calls["allocationId"]).shift(1, fill_value=False).astype(bool)
+        calls["offAt"] = calls["timestamp"].where(~is_on)
+        calls["nextOff"] = calls.groupby("allocationId")["offAt"].bfill()
+        started = calls[is_on & ~follows_on]
+        latency = (started["nextOff"] - started["timestamp"]).dt.total_seconds().dropna().to_numpy()
+        if latency.size:
+            buckets = np.searchsorted(CALLING_LATENCY_BUCKETS, latency, side="left")
+            summary["callingLatency"] = {
+                "count": int(latency.size),
+                "totalSeconds": float(latency.sum()),
+                "maxSeconds": float(latency.max()),
+                "buckets": np.bincount(buckets, minlength=len(CALLING_LATENCY_BUCKETS) + 1).tolist()
+            }
+    return summary
+
+async def compute_property_analytics(property_id: str, days: List[str], now: datetime) -> dict:
+    """Summaries for several days of a property, including archived allocations"""
+    allocations = []
+    events = []
+    for allocation_collection, event_collection in (
+        ("allocations", "allocation_events"), ("allocations_archive", "allocation_events_archive")
+    ):
+        found = await db[allocation_collection].find(
+            {"propertyId": property_id, "allocationDate": {"$in": days}},
+            {"_id": 0, "id": 1, "allocationDate": 1, "seatIds": 1, "status": 1}
+        ).to_list(None)
+        allocations.extend(found)
+        events.extend(await db[event_collection].find(
+            {"allocationId": {"$in": [a['id'] for a in found]}},
+            {"_id": 0, "allocationId": 1, "eventType": 1, "newValue": 1, "timestamp": 1}
+        ).to_list(None))
+    seats = await db.seats.find(
+        {"propertyId": property_id}, {"_id": 0, "id": 1, "sectionId": 1, "seatTypeId": 1}
+    ).to_list(None)
+    
+    allocations_by_day = {}
+    for allocation in allocations:
+        allocations_by_day.setdefault(allocation['allocationDate'], []).append(allocation)
+    day_of = {a['id']: a['allocationDate'] for a in allocations}
+    events_by_day = {}
+    for event in events:
+        events_by_day.setdefault(day_of[event['allocationId']], []).append(event)
+    
+    # pandas work runs off the event loop
+    return await asyncio.to_thread(lambda: {
+        day: compute_day_analytics(day, allocations_by_day.get(day, []), events_by_day.get(day, []), seats, now)
+        for day in days
+    })
+
+async def load_property_analytics(property_id: str, days: List[str], refresh: bool = False) -> dict:
+    """Day summaries for a property: stored ones as they are, missing closed days computed and
+    stored, open days computed live"""
+    now = datetime.now(timezone.utc)
+    first_open_day = (now - timedelta(days=ANALYTICS_OPEN_DAYS - 1)).strftime('%Y-%m-%d')
+    summaries = {}
+    if not refresh:
+        async for doc in db.analytics_daily.find(
+            {"propertyId": property_id, "date": {"$in": days}, "version": ANALYTICS_SUMMARY_VERSION},
+            {"_id": 0, "id": 0, "propertyId": 0}
+        ):
+            summaries[doc.pop('date')] = doc
+    
+    missing = [day for day in days if day not in summaries]
+    if missing:
+        computed = await compute_property_analytics(property_id, missing, now)
+        for day, summary in computed.items():
+            summaries[day] = summary
+            if day < first_open_day:
+                await db.analytics_daily.update_one(
+                    {"propertyId": property_id, "date": day},
+                    {"$set": {**summary, "version": ANALYTICS_SUMMARY_VERSION, "materializedAt": now.isoformat()},
+                     "$setOnInsert": {"id": str(uuid.uuid4())}},
+                    upsert=True
+                )
+    return summaries
+
+def latency_percentile(buckets: List[int], count: int, fraction: float, max_seconds: float) -> Optional[float]:
+    """Upper edge of the histogram bucket holding the given fraction of calls"""
+    if not count:
+        return None
+    cumulative = np.cumsum(buckets)
+    index = int(np.searchsorted(cumulative, fraction * count, side="left"))
+    return float(CALLING_LATENCY_BUCKETS[index]) if index < len(CALLING_LATENCY_BUCKETS) else max_seconds
+
+@api_router.get("/analytics/{property_id}")
+async def get_property_analytics(property_id: str, startDate: str, endDate: str, refresh: bool = False):
+    """Occupancy, time in status and calling latency for a property over a date range"""
+    try:
+        try:
+            start = datetime.strptime(startDate, '%Y-%m-%d')
+            end = datetime.strptime(endDate, '%Y-%m-%d')
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Dates must be in YYYY-MM-DD format")
+        if end < start or (end - start).days >= ANALYTICS_MAX_RANGE_DAYS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"endDate must be on or after startDate and at most {ANALYTICS_MAX_RANGE_DAYS} days later"
+            )
+        
+        days = [(start + timedelta(days=i)).strftime('%Y-%m-%d') for i in range((end - start).days + 1)]
+        summaries = list((await load_property_analytics(property_id, days, refresh)).values())
+        
+        seat_hours_by_hour = np.sum([s['seatHoursByHour'] for s in summaries], axis=0)
+        by_section = pd.DataFrame([s['seatHoursBySection'] for s in summaries]).sum()
+        by_seat_type = pd.DataFrame([s['seatHoursBySeatType'] for s in summaries]).sum()
+        status_totals = {}
+        for summary in summaries:
+            for status, totals in summary['statusSeconds'].items():
+                add_deltas(status_totals.setdefault(status, {}), totals)
+        latency_buckets = np.sum([s['callingLatency']['buckets'] for s in summaries], axis=0).tolist()
+        latency_count = sum(s['callingLatency']['count'] for s in summaries)
+        latency_total = sum(s['callingLatency']['totalSeconds'] for s in summaries)
+        latency_max = max(s['callingLatency']['maxSeconds'] for s in summaries)
+        
+        section_names = {
+            s['id']: s['name'] async for s in db.sections.find({"propertyId": property_id}, {"_id": 0, "id": 1, "name": 1})
+        }
+        seat_type_names = {
+            t['id']: t['name'] async for t in db.seat_types.find({"propertyId": property_id}, {"_id": 0, "id": 1, "name": 1})
+        }
+        
+        return {
+            "success": True,
+            "propertyId": property_id,
+            "startDate": startDate,
+            "endDate": endDate,
+            "days": len(days),
+            "allocations": sum(s['allocations'] for s in summaries),
+            "occupancyByHour": [
+                {"hour": hour, "averageSeatsOccupied": round(float(seat_hours) / len(days), 3)}
+                for hour, seat_hours in enumerate(seat_hours_by_hour)
+            ],
+            "occupancyBySection": [
+                {"sectionId": section_id, "name": section_names.get(section_id), "seatHours": round(float(hours), 3)}
+                for section_id, hours in by_section.sort_values(ascending=False).items()
+            ],
+            "occupancyBySeatType": [
+                {"seatTypeId": seat_type_id, "name": seat_type_names.get(seat_type_id), "seatHours": round(float(hours), 3)}
+                for seat_type_id, hours in by_seat_type.sort_values(ascending=False).items()
+            ],
+            "timeInStatus": [
+                {"status": status, "periods": totals['count'],
+                 "averageMinutes": round(totals['total'] / totals['count'] / 60, 2)}
+                for status, totals in status_totals.items() if totals.get('count')
+            ],
+            "callingLatency": {
+                "calls": latency_count,
+                "averageSeconds": round(latency_total / latency_count, 1) if latency_count else None,
+                "p50Seconds": latency_percentile(latency_buckets, latency_count, 0.5, latency_max),
+                "p95Seconds": latency_percentile(latency_buckets, latency_count, 0.95, latency_max),
+                "maxSeconds": latency_max if latency_count else None,
+                "bucketUpperSeconds": CALLING_LATENCY_BUCKETS + [None],
+                "buckets": latency_buckets
+            }
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error computing analytics: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+# ============= DAILY ROLLUP =============
+
+# Complete allocations older than this many days move to allocations_archive, with their
+# events in allocation_events_archive, once their day has been summarised
+ALLOCATION_RETENTION_DAYS = max(int(os.environ.get('ALLOCATION_RETENTION_DAYS', '90')), ANALYTICS_OPEN_DAYS)
+ROLLUP_HOUR_UTC = 2
+ARCHIVE_BATCH_SIZE = 500
+
+async def materialize_closed_days(property_id: str) -> int:
+    """Store summaries for every closed day of a property that has allocations but no summary yet"""
+    first_open_day = (datetime.now(timezone.utc) - timedelta(days=ANALYTICS_OPEN_DAYS - 1)).strftime('%Y-%m-%d')
+    days = set(await db.allocations.distinct(
+        "allocationDate", {"propertyId": property_id, "allocationDate": {"$lt": first_open_day}}
+    ))
+    days.difference_update(await db.analytics_daily.distinct(
+        "date", {"propertyId": property_id, "version": ANALYTICS_SUMMARY_VERSION}
+    ))
+    if days:
+        await load_property_analytics(property_id, sorted(days))
+    return len(days)
+
+async def archive_allocations(property_id: str, before_date: str) -> dict:
+    """Move a property's Complete allocations dated before before_date, and their events, to the archive.
+
+    Archive writes are upserts by id, so a pass interrupted between copying and deleting
+    is finished by the next one.
+    """
+    report = {"allocationsArchived": 0, "eventsArchived": 0}
+    while True:
+        allocations = await db.allocations.find(
+            {"propertyId": property_id, "status": "Complete", "allocationDate": {"$lt": before_date}}, {"_id": 0}
+        ).limit(ARCHIVE_BATCH_SIZE).to_list(ARCHIVE_BATCH_SIZE)
+        if not allocations:
+            return report
+        allocation_ids = [a['id'] for a in allocations]
+        events = await db.allocation_events.find({"allocationId": {"$in": allocation_ids}}, {"_id": 0}).to_list(None)
+        
+        await db.allocations_archive.bulk_write(
+            [ReplaceOne({"id": a['id']}, a, upsert=True) for a in allocations], ordered=False
+        )
+        if events:
+            await db.allocation_events_archive.bulk_write(
+                [ReplaceOne({"id": e['id']}, e, upsert=True) for e in events], ordered=False
+            )
+        await db.allocation_events.delete_many({"allocationId": {"$in": allocation_ids}})
+        await db.allocations.delete_many({"id": {"$in": allocation_ids}, "status": "Complete"})
+        
+        report["allocationsArchived"] += len(allocations)
+        report["eventsArchived"] += len(events)
+
+async def run_daily_rollup(property_id: Optional[str] = None) -> dict:
+    """Summarise closed days, then archive Complete allocations past the retention window"""
+    property_ids = [property_id] if property_id else await db.allocations.distinct("propertyId")
+    before_date = (datetime.now(timezone.utc) - timedelta(days=ALLOCATION_RETENTION_DAYS)).strftime('%Y-%m-%d')
+    
+    report = {"properties": 0, "daysMaterialized": 0, "allocationsArchived": 0, "eventsArchived": 0}
+    for pid in property_ids:
+        report["daysMaterialized"] += await materialize_closed_days(pid)
+        add_deltas(report, await archive_allocations(pid, before_date))
+        report["properties"] += 1
+    return report
+
+async def daily_rollup_loop():
+    """Background task: run the rollup once a night at ROLLUP_HOUR_UTC"""
+    while True:
+        now = datetime.now(timezone.utc)
+        next_run = now.replace(hour=ROLLUP_HOUR_UTC, minute=0, second=0, microsecond=0)
+        if next_run <= now:
+            next_run += timedelta(days=1)
+        await asyncio.sleep((next_run - now).total_seconds())
+        try:
+            report = await run_daily_rollup()
+            logger.info(f"Daily rollup finished: {report}")
+        except Exception as e:
+            logger.error(f"Error running daily rollup: {str(e)}")
+
+# ============= CASCADE CLEANUP =============
+
+# Collections holding a property's data, deleted when the property is
+PROPERTY_SCOPED_COLLECTIONS = [
+    'seats', 'sections', 'seat_types', 'staff', 'devices', 'guests', 'configurations',
+    'allocations', 'allocation_events', 'allocation_reservations', 'notifications',
+    'menu_categories', 'menu_tags', 'dietary_restrictions', 'menu_items', 'menus', 'analytics_daily',
+    'allocations_archive', 'allocation_events_archive', 'staff_shifts'
+]
+# Logins and sessions point at an organisation or property through entityId
+ENTITY_LOGIN_COLLECTIONS = ['admins', 'admin_otps', 'admin_sessions']
+# Device telemetry also goes with its property, but it expires on its own and is too bulky to export
+PROPERTY_TELEMETRY_COLLECTIONS = [spec['collection'] for spec in TELEMETRY_RESOLUTIONS.values()]
+
+# What to clean up after a document of each kind is deleted. Each rule matches documents
+# in a collection whose field references the deleted ID and either deletes them, sets
+# the field to a value, pulls the ID from an array field, or queues a cascade of their own.
+CASCADE_RULES = {
+    "organisation": [
+        {"collection": "properties", "field": "organisationId", "action": "cascade", "kind": "property"},
+        *({"collection": c, "field": "entityId", "action": "delete"} for c in ENTITY_LOGIN_COLLECTIONS),
+    ],
+    "property": [
+        *({"collection": c, "field": "propertyId", "action": "delete"} for c in PROPERTY_SCOPED_COLLECTIONS),
+        *({"collection": c, "field": "propertyId", "action": "delete"} for c in PROPERTY_TELEMETRY_COLLECTIONS),
+        *({"collection": c, "field": "entityId", "action": "delete"} for c in ENTITY_LOGIN_COLLECTIONS),
+    ],
+    "section": [
+        {"collection": "seats", "field": "sectionId", "action": "set", "value": ""},
+    ],
+    "seat": [
+        {"collection": "sections", "field": "seatIds", "action": "pull"},
+    ],
+    "seat_type": [
+        {"collection": "seats", "field": "seatTypeId", "action": "set", "value": ""},
+    ],
+    "menu_item": [
+        {"collection": "menus", "field": "itemIds", "action": "pull"},
+    ],
+}
+
+CASCADE_BATCH_SIZE = 500
+CASCADE_BATCH_PAUSE_SECONDS = 0.1  # Between batches, so cleanup doesn't crowd out requests
+CASCADE_POLL_SECONDS = 30
+
+cascade_wakeup = asyncio.Event()
+
+async def enqueue_cascade(kind: str, target_id: str) -> str:
+    """Queue background cleanup of whatever referenced a deleted document"""
+    now = datetime.now(timezone.utc).isoformat()
+    job = {
+        "id": str(uuid.uuid4()),
+        "kind": kind,
+        "targetId": target_id,
+        "status": "pending",
+        "processed": {},
+        "createdAt": now,
+        "updatedAt": now
+    }
+    await db.cascade_jobs.insert_one(job)
+    cascade_wakeup.set()
+    return job['id']
+
+async def apply_cascade_rule(rule: dict, target_id: str) -> int:
+    """Apply one rule in rate-limited batches until nothing references the target"""
+    collection = db[rule['collection']]
+    query = {rule['field']: target_id}
+    processed = 0
+    while True:
+        batch = await collection.find(query, {"_id": 1, "id": 1}).limit(CASCADE_BATCH_SIZE).to_list(CASCADE_BATCH_SIZE)
+        if not batch:
+            return processed
+        
+        batch_filter = {"_id": {"$in": [doc['_id'] for doc in batch]}, **query}
+        if rule['action'] == "delete":
+            await collection.delete_many(batch_filter)
+        elif rule['action'] == "set":
+            await collection.update_many(batch_filter, {"$set": {rule['field']: rule['value']}})
+        elif rule['action'] == "pull":
+            await collection.update_many(batch_filter, {"$pull": {rule['field']: target_id}})
+        elif rule['action'] == "cascade":
+            for doc in batch:
+                await enqueue_cascade(rule['kind'], doc['id'])
+            await collection.delete_many(batch_filter)
+        
+        processed += len(batch)
+        await asyncio.sleep(CASCADE_BATCH_PAUSE_SECONDS)
+
+async def run_cascade_job(job: dict):
+    for rule in CASCADE_RULES[job['kind']]:
+        processed = await apply_cascade_rule(rule, job['targetId'])
+        if processed:
+            await db.cascade_jobs.update_one(
+                {"id": job['id']},
+                {"$inc": {f"processed.{rule['collection']}": processed},
+                 "$set": {"updatedAt": datetime.now(timezone.utc).isoformat()}}
+            )
+    
+    if job['kind'] == "property":
+        availability_index.reset(job['targetId'])
+        device_routes.reset(job['targetId'])
+        device_last_seen.reset(job['targetId'])
+        seat_layout_index.reset(job['targetId'])
+        staffing.reset(job['targetId'])
+        presence.reset(job['targetId'])
+        calling_tracker.reset(job['targetId'])
+    elif job['kind'] in ("section", "seat", "seat_type"):
+        seat_layout_index.reset()
+
+async def cascade_worker():
+    """Background task: run queued cascade jobs one at a time, oldest first"""
+    # Jobs left running by a previous process are picked up again; every rule is idempotent
+    await db.cascade_jobs.update_many({"status": "running"}, {"$set": {"status": "pending"}})
+    while True:
+        job = await db.cascade_jobs.find_one_and_update(
+            {"status": "pending"},
+            {"$set": {"status": "running", "updatedAt": datetime.now(timezone.utc).isoformat()}},
+            projection={"_id": 0},
+            sort=[("createdAt", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+        if not job:
+            cascade_wakeup.clear()
+            try:
+                await asyncio.wait_for(cascade_wakeup.wait(), timeout=CASCADE_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        
+        try:
+            await run_cascade_job(job)
+            status, error = "done", None
+            logger.info(f"Cascade cleanup done for {job['kind']} {job['targetId']}")
+        except Exception as e:
+            status, error = "failed", str(e)
+            logger.error(f"Cascade cleanup failed for {job['kind']} {job['targetId']}: {str(e)}")
+        await db.cascade_jobs.update_one(
+            {"id": job['id']},
+            {"$set": {"status": status, "error": error, "updatedAt": datetime.now(timezone.utc).isoformat()}}
+        )
+
+# ============= PROPERTY EXPORT / IMPORT =============
+
+EXPORT_FORMAT = "smartflags-property-export"
+EXPORT_VERSION = 1
+EXPORT_BATCH_SIZE = 1000
+IMPORT_CONCURRENCY = 4
+
+# Fields holding IDs of documents inside the same property export, remapped on import.
+# roleId is absent on purpose: roles are global master data shared by every property.
+EXPORT_REFERENCE_FIELDS = {
+    "id", "propertyId", "sectionId", "seatTypeId", "staticDeviceId", "seatIds", "deviceIds",
+    "categoryId", "tagIds", "dietaryRestrictionIds", "itemIds", "guestId", "fbManagerId",
+    "poolBeachAttendantIds", "fbServerIds", "allocationId", "staffId", "resourceId"
+}
+
+async def export_property_lines(property_doc: dict):
+    """Yield gzip-compressed NDJSON: a header line, then one {"collection", "doc"} line per document"""
+    compressor = zlib.compressobj(3, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    
+    def encode(record: dict) -> bytes:
+        return compressor.compress((json.dumps(record, default=str) + "\n").encode())
+    
+    yield encode({
+        "format": EXPORT_FORMAT,
+        "version": EXPORT_VERSION,
+        "propertyId": property_doc['id'],
+        "exportedAt": datetime.now(timezone.utc).isoformat(),
+        "collections": PROPERTY_SCOPED_COLLECTIONS
+    })
+    yield encode({"collection": "properties", "doc": property_doc})
+    
+    for collection in PROPERTY_SCOPED_COLLECTIONS:
+        chunk = []
+        async for doc in db[collection].find({"propertyId": property_doc['id']}, {"_id": 0}, batch_size=EXPORT_BATCH_SIZE):
+            chunk.append(encode({"collection": collection, "doc": doc}))
+            if len(chunk) >= EXPORT_BATCH_SIZE:
+                yield b"".join(chunk)
+                chunk = []
+        if chunk:
+            yield b"".join(chunk)
+    yield compressor.flush()
+
+def remap_export_doc(doc: dict, id_map: dict) -> dict:
+    """Give every exported ID a new one, consistently, wherever it is referenced"""
+    def new_id(old):
+        if not isinstance(old, str) or not old:
+            return old
+        return id_map.setdefault(old, str(uuid.uuid4()))
+    
+    for field in EXPORT_REFERENCE_FIELDS.intersection(doc):
+        value = doc[field]
+        doc[field] = [new_id(v) for v in value] if isinstance(value, list) else new_id(value)
+    return doc
+
+@api_router.get("/properties/{property_id}/export")
+async def export_property(property_id: str):
+    """Download everything belonging to a property as a gzip-compressed NDJSON snapshot"""
+    try:
+        property_doc = await db.properties.find_one({"id": property_id}, {"_id": 0})
+        if not property_doc:
+            raise HTTPException(status_code=404, detail="Property not found")
+        
+        filename = f"property-{property_id}-{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')}.ndjson.gz"
+        logger.info(f"Exporting property {property_id}")
+        return StreamingResponse(
+            export_property_lines(property_doc),
+            media_type="application/gzip",
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error exporting property: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@api_router.post("/properties/import")
+async def import_property(file: UploadFile = File(...), organisationId: Optional[str] = None, name: Optional[str] = None):
+    """Create a new property from an export snapshot, with fresh IDs throughout"""
+    try:
+        if organisationId and not await db.organisations.find_one({"id": organisationId}, {"_id": 1}):
+            raise HTTPException(status_code=404, detail="Organisation not found")
+        
+        decompressor = zlib.decompressobj(47)  # Accepts gzip or zlib
+        id_map = {}
+        header = None
+        new_property = None
+        pending = {}
+        counts = {}
+        inserts = []  # Every batch, finished or not, so a failed one still fails the import
+        running = set()
+        semaphore = asyncio.Semaphore(IMPORT_CONCURRENCY)
+        
+        async def insert_batch(collection: str, docs: List[dict]):
+            async with semaphore:
+                await db[collection].insert_many(docs, ordered=False)
+        
+        def flush(collection: str):
+            docs = pending.pop(collection, [])
+            if docs:
+                task = asyncio.create_task(insert_batch(collection, docs))
+                inserts.append(task)
+                running.add(task)
+                task.add_done_callback(running.discard)
+        
+        def handle(line: bytes):
+            nonlocal header, new_property
+            if not line.strip():
+                return
+            record = json.loads(line)
+            if header is None:
+                if record.get('format') != EXPORT_FORMAT or record.get('version') != EXPORT_VERSION:
+                    raise HTTPException(status_code=400, detail="Not a property export file")
+                header = record
+                return
+            
+            collection = record.get('collection')
+            doc = remap_export_doc(record['doc'], id_map)
+            if collection == "properties":
+                doc['name'] = name or f"{doc['name']} (copy)"
+                if organisationId:
+                    doc['organisationId'] = organisationId
+                new_property = doc
+                return
+            if collection not in PROPERTY_SCOPED_COLLECTIONS:
+                raise HTTPException(status_code=400, detail=f"Unexpected collection in export: {collection}")
+            
+            pending.setdefault(collection, []).append(doc)
+            counts[collection] = counts.get(collection, 0) + 1
+            if len(pending[collection]) >= EXPORT_BATCH_SIZE:
+                flush(collection)
+        
+        try:
+            buffer = b""
+            while True:
+                chunk = await file.read(1 << 20)
+                data = decompressor.decompress(chunk) if chunk else decompressor.flush()
+                lines = (buffer + data).split(b"\n")
+                buffer = lines.pop()
+                for line in lines:
+                    handle(line)
+                if len(running) > IMPORT_CONCURRENCY * 2:
+                    done, _ = await asyncio.wait(set(running), return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        task.result()  # Stop at the first batch that failed
+                if not chunk:
+                    break
+            handle(buffer)
+            for collection in list(pending):
+                flush(collection)
+            if inserts:
+                await asyncio.gather(*inserts)
+            
+            if new_property is None:
+                raise HTTPException(status_code=400, detail="Export file has no property")
+            await db.properties.insert_one(new_property)
+            await recount_property_counters(new_property['id'])
+        except Exception as e:
+            # Drop whatever was already written for the half-imported property
+            await asyncio.gather(*inserts, return_exceptions=True)
+            if header and header['propertyId'] in id_map:
+                for collection in counts:
+                    await db[collection].delete_many({"propertyId": id_map[header['propertyId']]})
+            if isinstance(e, (zlib.error, json.JSONDecodeError, KeyError)):
+                raise HTTPException(status_code=400, detail=f"Invalid export file: {str(e)}")
+            raise
+        
+        total = sum(counts.values())
+        logger.info(f"Imported property {header['propertyId']} as {new_property['id']}: {total} documents")
+        return {
+            "success": True,
+            "message": f"Imported {total} documents",
+            "propertyId": new_property['id'],
+            "sourcePropertyId": header['propertyId'],
+            "counts": counts
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error importing property: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
 # ============= ADMIN UTILITIES =============
 
+# Everything a full wipe removes; admin accounts in `admins` are kept
+WIPE_COLLECTIONS = [
+    'organisations',
+    'properties',
+    'seats',
+    'sections',
+    'seat_types',
+    'staff',
+    'roles',
+    'allocations',
+    'allocation_events',
+    'allocation_reservations',
+    'notifications',
+    'cascade_jobs',
+    'counters',
+    'analytics_daily',
+    'allocations_archive',
+    'allocation_events_archive',
+    'staff_shifts',
+    'devices',
+    'device_telemetry',
+    'device_telemetry_1m',
+    'device_telemetry_1h',
+    'menu_categories',
+    'menu_tags',
+    'dietary_restrictions',
+    'menu_items',
+    'menus',
+    'guests',
+    'configurations',
+    'countries',
+    'states',
+    'cities',
+    'admin_otps',
+    'admin_sessions'
+]
+WIPE_CONCURRENCY = 4
+
+WIPE_JOB_RETENTION_SECONDS = 3600  # How long a finished job stays pollable
+WIPE_JOBS_KEPT = 20
+
+# Wipe jobs by ID; progress is kept in memory for the admin dashboard to poll
+wipe_jobs = {}
+
+def prune_wipe_jobs():
+    """Forget finished jobs past their retention, and all but the newest WIPE_JOBS_KEPT"""
+    cutoff = (datetime.now(timezone.utc) - timedelta(seconds=WIPE_JOB_RETENTION_SECONDS)).isoformat()
+    finished = sorted((job for job in wipe_jobs.values() if job['finishedAt']), key=lambda job: job['finishedAt'], reverse=True)
+    for index, job in enumerate(finished):
+        if index >= WIPE_JOBS_KEPT or job['finishedAt'] < cutoff:
+            del wipe_jobs[job['id']]
+
+async def wipe_collection(job: dict, collection: str, query: Optional[dict], semaphore: asyncio.Semaphore):
+    progress = job['collections'][collection]
+    async with semaphore:
+        progress['status'] = "running"
+        if query is None:
+            # Whole collection: dropping avoids a delete per document (and its oplog entry)
+            progress['deleted'] = await db[collection].estimated_document_count()
+            await db[collection].drop()
+            await ensure_indexes([collection])
+        else:
+            result = await db[collection].delete_many(query)
+            progress['deleted'] = result.deleted_count
+        progress['status'] = "done"
+
+async def run_wipe_job(job: dict):
+    try:
+        scope = job['scope']
+        if scope.get('propertyId') or scope.get('organisationId'):
+            if scope.get('propertyId'):
+                property_ids = [scope['propertyId']]
+                entity_ids = property_ids
+            else:
+                property_ids = await db.properties.distinct("id", {"organisationId": scope['organisationId']})
+                entity_ids = [scope['organisationId'], *property_ids]
+            
+            queries = {c: {"propertyId": {"$in": property_ids}} for c in PROPERTY_SCOPED_COLLECTIONS + PROPERTY_TELEMETRY_COLLECTIONS}
+            queries.update({c: {"entityId": {"$in": entity_ids}} for c in ENTITY_LOGIN_COLLECTIONS})
+            queries['properties'] = {"id": {"$in": property_ids}}
+            if scope.get('organisationId'):
+                queries['organisations'] = {"id": scope['organisationId']}
+        else:
+            queries = {c: None for c in WIPE_COLLECTIONS}
+        
+        job['collections'] = {c: {"status": "pending", "deleted": 0} for c in queries}
+        semaphore = asyncio.Semaphore(WIPE_CONCURRENCY)
+        await asyncio.gather(*(wipe_collection(job, c, q, semaphore) for c, q in queries.items()))
+        
+        if scope.get('propertyId') or scope.get('organisationId'):
+            for property_id in property_ids:
+                availability_index.reset(property_id)
+                device_routes.reset(property_id)
+                device_last_seen.reset(property_id)
+                seat_layout_index.reset(property_id)
+                staffing.reset(property_id)
+                presence.reset(property_id)
+                calling_tracker.reset(property_id)
+                await drop_property_counters(property_id)
+            if scope.get('organisationId'):
+                await drop_organisation_counters(scope['organisationId'])
+        else:
+            availability_index.reset()
+            device_routes.reset()
+            device_last_seen.reset()
+            seat_layout_index.reset()
+            staffing.reset()
+            presence.reset()
+            calling_tracker.reset()
+            geo_cache.invalidate()
+            geo_search_index.reset()
+            property_organisations.clear()
+        
+        job['status'] = "done"
+        logger.warning(f"Data cleared by admin (scope: {scope or 'all'})")
+    except Exception as e:
+        job['status'] = "failed"
+        job['error'] = str(e)
+        logger.error(f"Error clearing data: {str(e)}")
+    finally:
+        job['finishedAt'] = datetime.now(timezone.utc).isoformat()
+
+def wipe_job_summary(job: dict) -> dict:
+    done = sum(1 for progress in job['collections'].values() if progress['status'] == "done")
+    return {
+        **{k: v for k, v in job.items() if k != 'task'},
+        "progress": {"done": done, "total": len(job['collections'])},
+        "deleted": {c: progress['deleted'] for c, progress in job['collections'].items()}
+    }
+
 @api_router.post("/admin/clear-all-data")
-async def clear_all_data():
-    """Clear all data from the database - USE WITH CAUTION"""
-    try:
-        collections = [
-            'organisations',
-            'properties',
-            'seats',
-            'sections',
-            'seat_types',
-            'staff',
-            'roles',
-            'allocations',
-            'devices',
-            'menu_categories',
-            'menu_tags',
-            'dietary_restrictions',
-            'menu_items',
-            'menus',
-            'guests',
-            'configurations',
-            'countries',
-            'states',
-            'cities',
-            'admin_otps',
-            'admin_sessions'
-        ]
-        
-        deleted_counts = {}
-        for collection in collections:
-            result = await db[collection].delete_many({})
-            deleted_counts[collection] = result.deleted_count
+async def clear_all_data(organisationId: Optional[str] = None, propertyId: Optional[str] = None):
+    """Start clearing data - everything, or one organisation or property - USE WITH CAUTION"""
+    try:
+        if organisationId and propertyId:
+            raise HTTPException(status_code=400, detail="Scope to an organisation or a property, not both")
+        if any(job['status'] == "running" for job in wipe_jobs.values()):
+            raise HTTPException(status_code=409, detail="A data clear is already running")
+        prune_wipe_jobs()
+        
+        scope = {k: v for k, v in {"organisationId": organisationId, "propertyId": propertyId}.items() if v}
+        job = {
+            "id": str(uuid.uuid4()),
+            "scope": scope,
+            "status": "running",
+            "collections": {},
+            "error": None,
+            "startedAt": datetime.now(timezone.utc).isoformat(),
+            "finishedAt": None
+        }
+        wipe_jobs[job['id']] = job
+        job['task'] = asyncio.create_task(run_wipe_job(job))
         
-        logger.warning("All data cleared from database by admin")
         return {
             "success": True,
-            "message": "All data has been cleared successfully",
-            "deleted": deleted_counts
+            "message": "Data clear started",
+            "jobId": job['id']
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error clearing data: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+@api_router.get("/admin/clear-all-data/{job_id}")
+async def get_clear_data_job(job_id: str):
+    """Get progress of a data clear"""
+    job = wipe_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"success": True, "job": wipe_job_summary(job)}
+
+@api_router.get("/admin/cascade-jobs")
+async def get_cascade_jobs(status: Optional[str] = None, limit: int = 100):
+    """List background cleanup jobs queued by deletes, newest first"""
+    try:
+        query = {"status": status} if status else {}
+        jobs = await db.cascade_jobs.find(query, {"_id": 0}).sort("createdAt", -1).limit(min(limit, 1000)).to_list(1000)
+        return {"success": True, "jobs": jobs}
+    except Exception as e:
+        logger.error(f"Error fetching cascade jobs: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@api_router.post("/admin/rollup")
+async def rollup_now(propertyId: Optional[str] = None):
+    """Run the nightly summary and archive pass now, for one property or all of them"""
+    try:
+        report = await run_daily_rollup(propertyId)
+        logger.info(f"Rollup run on demand: {report}")
+        return {"success": True, **report}
+    except Exception as e:
+        logger.error(f"Error running rollup: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@api_router.post("/admin/reconcile-sections")
+async def reconcile_sections(propertyId: Optional[str] = None):
+    """Repair Section.seatIds / Seat.sectionId drift now instead of waiting for the background pass"""
+    try:
+        report = await reconcile_section_memberships(propertyId)
+        logger.info(f"Section memberships reconciled: {report}")
+        return {"success": True, **report}
+    except Exception as e:
+        logger.error(f"Error reconciling sections: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@api_router.post("/admin/recount-counters")
+async def recount_counters(propertyId: Optional[str] = None):
+    """Recount dashboard counters from the source collections, for one property or everything"""
+    try:
+        if propertyId:
+            if not await db.properties.find_one({"id": propertyId}, {"_id": 1}):
+                raise HTTPException(status_code=404, detail="Property not found")
+            corrections = await recount_property_counters(propertyId)
+            logger.info(f"Counters recounted for property {propertyId}: {corrections}")
+            return {"success": True, "corrections": corrections}
+        
+        counted = await rebuild_counters()
+        logger.info(f"Counters rebuilt for {counted} properties")
+        return {"success": True, "properties": counted}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error recounting counters: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
 @api_router.get("/admin/users")
 async def get_all_users():
     """Get all users (Organisation Admins, Property Admins, and Staff) for admin dashboard"""
@@ -3585,6 +7986,93 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+background_tasks = []
+
+# Secondary indexes per collection, created at startup and rebuilt after a collection is dropped
+INDEX_SPECS = {
+    "allocations": [([("propertyId", 1), ("allocationDate", 1)], {})],
+    "devices": [([("propertyId", 1), ("deviceId", 1)], {"unique": True})],
+    "allocation_events": [([("allocationId", 1), ("timestamp", 1)], {})],
+    "notifications": [([("staffId", 1), ("createdAt", -1)], {})],
+    "cascade_jobs": [([("status", 1), ("createdAt", 1)], {})],
+    "counters": [([("id", 1)], {"unique": True}), ([("organisationId", 1)], {})],
+    "analytics_daily": [([("propertyId", 1), ("date", 1)], {"unique": True})],
+    "allocations_archive": [([("id", 1)], {"unique": True}), ([("propertyId", 1), ("allocationDate", 1)], {})],
+    "allocation_events_archive": [([("id", 1)], {"unique": True}), ([("allocationId", 1), ("timestamp", 1)], {})],
+    "staff_shifts": [([("staffId", 1), ("checkedInAt", -1)], {}), ([("checkedOutAt", 1)], {})],
+    "device_telemetry": [
+        ([("propertyId", 1), ("deviceId", 1), ("timestamp", 1)], {}),
+        ([("expireAt", 1)], {"expireAfterSeconds": 0}),
+    ],
+    "device_telemetry_1m": [
+        ([("propertyId", 1), ("deviceId", 1), ("bucket", 1)], {"unique": True}),
+        ([("expireAt", 1)], {"expireAfterSeconds": 0}),
+    ],
+    "device_telemetry_1h": [
+        ([("propertyId", 1), ("deviceId", 1), ("bucket", 1)], {"unique": True}),
+        ([("expireAt", 1)], {"expireAfterSeconds": 0}),
+    ],
+    "countries": [([("code", 1)], {"unique": True})],
+    "states": [([("countryId", 1), ("name", 1)], {"unique": True})],
+    "cities": [([("stateId", 1), ("name", 1)], {"unique": True})],
+    "allocation_reservations": [
+        ([("propertyId", 1), ("allocationDate", 1), ("resourceType", 1), ("resourceId", 1)], {"unique": True}),
+        ([("allocationId", 1)], {}),
+    ],
+}
+
+# What each unique index is the only protection for. Nothing else checks them in code,
+# so a unique index that can't be built (legacy duplicates) turns the protection off
+UNIQUE_INDEX_GUARANTEES = {
+    "devices": "concurrent device creates can register the same device ID twice",
+    "counters": "counter documents can be duplicated",
+    "analytics_daily": "a day can be materialized twice",
+    "allocations_archive": "the rollover can archive an allocation twice",
+    "allocation_events_archive": "the rollover can archive an event twice",
+    "device_telemetry_1m": "telemetry rollups can split a minute across documents",
+    "device_telemetry_1h": "telemetry rollups can split an hour across documents",
+    "countries": "the geo loader can insert duplicate countries",
+    "states": "the geo loader can insert duplicate states",
+    "cities": "the geo loader can insert duplicate cities",
+    "allocation_reservations": "concurrent allocations can double-book seats and devices",
+}
+# Unique indexes the API refuses to start without
+REQUIRED_UNIQUE_INDEXES = {"allocation_reservations"}
+
+async def ensure_indexes(collections: Optional[List[str]] = None):
+    for collection in collections or INDEX_SPECS:
+        for keys, options in INDEX_SPECS.get(collection, []):
+            try:
+                await db[collection].create_index(keys, **options)
+            except OperationFailure as e:
+                if not options.get("unique"):
+                    logger.warning(f"Could not create index {keys} on {collection}: {str(e)}")
+                    continue
+                logger.error(
+                    f"Could not create unique index {keys} on {collection}, so "
+                    f"{UNIQUE_INDEX_GUARANTEES.get(collection, 'duplicates are not rejected')}: {str(e)}"
+                )
+                if collection in REQUIRED_UNIQUE_INDEXES:
+                    raise
+
+@app.on_event("startup")
+async def startup_db_client():
+    await ensure_indexes()
+    await migrate_embedded_allocation_events()
+    await backfill_allocation_reservations()
+    await geo_search_index.ensure_loaded()
+    await calling_tracker.load()
+    await presence.restore()
+    if not await db.counters.find_one({"id": "global"}, {"_id": 1}):
+        logger.info(f"Counted {await rebuild_counters()} properties for dashboard counters")
+    background_tasks.append(asyncio.create_task(section_reconcile_loop()))
+    background_tasks.append(asyncio.create_task(cascade_worker()))
+    background_tasks.append(asyncio.create_task(daily_rollup_loop()))
+    background_tasks.append(asyncio.create_task(calling_sla_loop()))
+    background_tasks.append(asyncio.create_task(presence_expiry_loop()))
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    for task in background_tasks:
+        task.cancel()
     client.close()
\ No newline at end of file
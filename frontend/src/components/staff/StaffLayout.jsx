@@ -3,6 +3,9 @@ import { useNavigate } from 'react-router-dom';
 import { Building2, LogOut, Eye, Menu, X } from 'lucide-react';
 import { Button } from '../ui/button';
 import { useAuth } from '../../context/AuthContext';
+import axios from 'axios';
+
+const BACKEND_URL = process.env.REACT_APP_BACKEND_URL || window.location.origin;
 
 export const StaffLayout = ({ children }) => {
   const [sidebarOpen, setSidebarOpen] = useState(false);
@@ -10,6 +13,14 @@ export const StaffLayout = ({ children }) => {
   const { user, logout } = useAuth();
 
   const handleLogout = () => {
+    // Staff sessions live in localStorage, not the auth context
+    const userData = JSON.parse(localStorage.getItem('userData') || '{}');
+    if (userData.id) {
+      // Go off duty; open allocations are handed to colleagues
+      axios.post(`${BACKEND_URL}/api/staff/${userData.id}/logout`).catch((error) => {
+        console.error('Error logging out:', error);
+      });
+    }
     logout();
     navigate('/staff/login');
   };
@@ -27,10 +27,22 @@ const STATUS_OPTIONS = [
   { value: 'Complete', label: 'Complete', color: 'bg-[#006400]', description: 'Fully completed' }
 ];
 
+// Mirrors the status transitions in the backend's ALLOCATION_STATE_MACHINE; anything else is rejected
+export const STATUS_TRANSITIONS = {
+  Allocated: ['Active', 'Billing', 'Complete'],
+  Active: ['Billing', 'Complete'],
+  Billing: ['Active', 'Clear', 'Complete'],
+  Clear: ['Complete'],
+  Complete: []
+};
+
 export const AllocationStatusDialog = ({ open, onOpenChange, allocation, onSave }) => {
   const [selectedStatus, setSelectedStatus] = useState(allocation?.status || 'Allocated');
   const [loading, setLoading] = useState(false);
   const { toast } = useToast();
+  const statusOptions = STATUS_OPTIONS.filter(option =>
+    option.value === allocation?.status || (STATUS_TRANSITIONS[allocation?.status] || []).includes(option.value)
+  );
 
   React.useEffect(() => {
     if (allocation) {
@@ -95,7 +107,7 @@ export const AllocationStatusDialog = ({ open, onOpenChange, allocation, onSave
                   <SelectValue />
                 </SelectTrigger>
                 <SelectContent>
-                  {STATUS_OPTIONS.map((option) => (
+                  {statusOptions.map((option) => (
                     <SelectItem key={option.value} value={option.value}>
                       <div className="flex items-center gap-3">
                         <div className={`w-3 h-3 rounded-full ${option.color}`}></div>
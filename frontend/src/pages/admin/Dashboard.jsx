@@ -32,14 +32,10 @@ export const Dashboard = () => {
     try {
       setLoading(true);
       
-      const orgsResponse = await axios.get(`${BACKEND_URL}/api/organisations`);
-      if (orgsResponse.data.success) {
-        setOrgCount(orgsResponse.data.organisations.length);
-      }
-      
-      const propsResponse = await axios.get(`${BACKEND_URL}/api/properties`);
-      if (propsResponse.data.success) {
-        setPropCount(propsResponse.data.properties.length);
+      const rollupResponse = await axios.get(`${BACKEND_URL}/api/rollup`);
+      if (rollupResponse.data.success) {
+        setOrgCount(rollupResponse.data.counters.organisations);
+        setPropCount(rollupResponse.data.counters.properties);
       }
     } catch (error) {
       console.error('Error fetching stats:', error);
@@ -54,6 +50,18 @@ export const Dashboard = () => {
       const response = await axios.post(`${BACKEND_URL}/api/admin/clear-all-data`);
       
       if (response.data.success) {
+        // The clear runs as a background job; wait for it to finish
+        let job = null;
+        do {
+          await new Promise(resolve => setTimeout(resolve, 1000));
+          const jobResponse = await axios.get(`${BACKEND_URL}/api/admin/clear-all-data/${response.data.jobId}`);
+          job = jobResponse.data.job;
+        } while (job.status === 'running');
+        
+        if (job.status === 'failed') {
+          throw new Error(job.error || 'Failed to clear data');
+        }
+        
         toast({
           title: "Success",
           description: "All data has been cleared successfully",
@@ -68,7 +76,7 @@ export const Dashboard = () => {
       console.error('Error clearing data:', error);
       toast({
         title: "Error",
-        description: error.response?.data?.detail || "Failed to clear data",
+        description: error.response?.data?.detail || error.message || "Failed to clear data",
         variant: "destructive",
       });
     } finally {
@@ -51,7 +51,7 @@ export const StaffSectionSelection = () => {
     }
   };
 
-  const handleSubmit = (e) => {
+  const handleSubmit = async (e) => {
     e.preventDefault();
     
     if (!selectedSection) {
@@ -59,6 +59,15 @@ export const StaffSectionSelection = () => {
       return;
     }
 
+    // Go on duty for the section so calls and new allocations are routed here
+    try {
+      await axios.post(`${BACKEND_URL}/api/staff/${staffData.id}/check-in`, { sectionId: selectedSection });
+    } catch (error) {
+      console.error('Error checking in:', error);
+      setError(error.response?.data?.detail || 'Failed to check in. Please try again.');
+      return;
+    }
+
     // Add selected section to staff data
     const updatedStaffData = {
       ...staffData,
@@ -21,9 +21,28 @@ export const StaffSmartView = () => {
     const interval = setInterval(() => {
       setCurrentTime(Date.now());
     }, 1000);
-    return () => clearInterval(interval);
+    // Stay checked in while the view is open; check in again if the shift expired
+    const heartbeat = setInterval(sendHeartbeat, 30000);
+    return () => {
+      clearInterval(interval);
+      clearInterval(heartbeat);
+    };
   }, []);
 
+  const sendHeartbeat = async () => {
+    const userData = JSON.parse(localStorage.getItem('userData') || '{}');
+    if (!userData.id) return;
+    try {
+      await axios.post(`${BACKEND_URL}/api/staff/${userData.id}/heartbeat`);
+    } catch (error) {
+      if (error.response?.status === 404) {
+        await axios.post(`${BACKEND_URL}/api/staff/${userData.id}/check-in`, {
+          sectionId: userData.selectedSectionId || null
+        }).catch((checkInError) => console.error('Error checking in:', checkInError));
+      }
+    }
+  };
+
   const fetchData = async () => {
     try {
       setLoading(true);
@@ -38,7 +57,9 @@ export const StaffSmartView = () => {
         axios.get(`${BACKEND_URL}/api/seats/${propertyId}`),
         axios.get(`${BACKEND_URL}/api/sections/${propertyId}`),
         axios.get(`${BACKEND_URL}/api/seat-types/${propertyId}`),
-        axios.get(`${BACKEND_URL}/api/allocations/${propertyId}`)
+        axios.get(`${BACKEND_URL}/api/allocations/${propertyId}`, {
+          params: { fields: 'id,seatIds,status,callingFlag,guestName,guestCategory,roomNumber,createdAt,updatedAt' }
+        })
       ]);
 
       // Filter seats to only show those from the selected section
@@ -4,7 +4,7 @@ import { Button } from '../../components/ui/button';
 import { Plus, MapPin, Search, Trash2, Calendar, Activity, Armchair, Eye } from 'lucide-react';
 import { Input } from '../../components/ui/input';
 import { AllocationDialog } from '../../components/user/AllocationDialog';
-import { AllocationStatusDialog } from '../../components/user/AllocationStatusDialog';
+import { AllocationStatusDialog, STATUS_TRANSITIONS } from '../../components/user/AllocationStatusDialog';
 import axios from 'axios';
 import { useToast } from '../../hooks/use-toast';
 import { useNavigate } from 'react-router-dom';
@@ -159,7 +159,7 @@ export const Allocation = () => {
     try {
       const response = await axios.patch(
         `${BACKEND_URL}/api/allocations/${selectedAllocation.id}/status`,
-        { status: newStatus }
+        { status: newStatus, expectedStatus: selectedAllocation.status }
       );
       
       if (response.data.success) {
@@ -180,11 +180,11 @@ export const Allocation = () => {
     }
   };
 
-  const handleSetCalling = async (allocationId) => {
+  const handleSetCalling = async (allocation) => {
     try {
       const response = await axios.patch(
-        `${BACKEND_URL}/api/allocations/${allocationId}/calling-flag`,
-        { callingFlag: "Calling" }
+        `${BACKEND_URL}/api/allocations/${allocation.id}/calling-flag`,
+        { callingFlag: "Calling", expectedCallingFlag: allocation.callingFlag }
       );
       
       if (response.data.success) {
@@ -204,24 +204,27 @@ export const Allocation = () => {
     }
   };
 
-  const handleSetCallingForCheckout = async (allocationId) => {
+  const handleSetCallingForCheckout = async (allocation) => {
     try {
       // First, set the calling flag
       const flagResponse = await axios.patch(
-        `${BACKEND_URL}/api/allocations/${allocationId}/calling-flag`,
-        { callingFlag: "Calling for Checkout" }
+        `${BACKEND_URL}/api/allocations/${allocation.id}/calling-flag`,
+        { callingFlag: "Calling for Checkout", expectedCallingFlag: allocation.callingFlag }
       );
       
       if (flagResponse.data.success) {
-        // Then, automatically update status to Billing
-        await axios.patch(
-          `${BACKEND_URL}/api/allocations/${allocationId}/status`,
-          { status: "Billing" }
-        );
+        // Then move the status to Billing, where that's still a forward move
+        const toBilling = (STATUS_TRANSITIONS[allocation.status] || []).includes("Billing");
+        if (toBilling) {
+          await axios.patch(
+            `${BACKEND_URL}/api/allocations/${allocation.id}/status`,
+            { status: "Billing", expectedStatus: allocation.status }
+          );
+        }
         
         toast({
           title: "Success",
-          description: "Calling for Checkout set - Status changed to Billing"
+          description: toBilling ? "Calling for Checkout set - Status changed to Billing" : "Calling for Checkout set"
         });
         fetchAllData(user.entityId);
       }
@@ -235,11 +238,11 @@ export const Allocation = () => {
     }
   };
 
-  const handleClearCalling = async (allocationId) => {
+  const handleClearCalling = async (allocation) => {
     try {
       const response = await axios.patch(
-        `${BACKEND_URL}/api/allocations/${allocationId}/calling-flag`,
-        { callingFlag: "Non Calling" }
+        `${BACKEND_URL}/api/allocations/${allocation.id}/calling-flag`,
+        { callingFlag: "Non Calling", expectedCallingFlag: allocation.callingFlag }
       );
       
       if (response.data.success) {
@@ -485,14 +488,14 @@ export const Allocation = () => {
                       <Button
                         size="sm"
                         className="w-full bg-orange-500 hover:bg-orange-600 text-white"
-                        onClick={() => handleSetCalling(allocation.id)}
+                        onClick={() => handleSetCalling(allocation)}
                       >
                         🔔 Set Calling
                       </Button>
                       <Button
                         size="sm"
                         className="w-full bg-purple-500 hover:bg-purple-600 text-white"
-                        onClick={() => handleSetCallingForCheckout(allocation.id)}
+                        onClick={() => handleSetCallingForCheckout(allocation)}
                       >
                         💳 Set Calling for Checkout
                       </Button>
@@ -512,7 +515,7 @@ export const Allocation = () => {
                         size="sm"
                         variant="outline"
                         className="w-full"
-                        onClick={() => handleClearCalling(allocation.id)}
+                        onClick={() => handleClearCalling(allocation)}
                       >
                         Clear Calling
                       </Button>
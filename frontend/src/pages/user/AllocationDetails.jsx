@@ -39,8 +39,10 @@ export const AllocationDetails = () => {
       if (allocResponse.data.success) {
         const foundAllocation = allocResponse.data.allocations.find(a => a.id === allocationId);
         if (foundAllocation) {
-          setAllocation(foundAllocation);
-          calculateAnalytics(foundAllocation);
+          const events = await fetchAllocationEvents(foundAllocation.id);
+          const allocationWithEvents = { ...foundAllocation, events };
+          setAllocation(allocationWithEvents);
+          calculateAnalytics(allocationWithEvents);
         } else {
           toast({
             title: "Error",
@@ -74,6 +76,23 @@ export const AllocationDetails = () => {
     }
   };
 
+  // Page through the full event timeline (stored separately from the allocation)
+  const fetchAllocationEvents = async (id) => {
+    const events = [];
+    let skip = 0;
+    let hasMore = true;
+    while (hasMore) {
+      const response = await axios.get(`${BACKEND_URL}/api/allocations/${id}/events`, {
+        params: { skip, limit: 500 }
+      });
+      if (!response.data.success) break;
+      events.push(...response.data.events);
+      skip += response.data.events.length;
+      hasMore = response.data.hasMore;
+    }
+    return events;
+  };
+
   const calculateAnalytics = (alloc) => {
     const events = alloc.events || [];
     const createdAt = new Date(alloc.createdAt);
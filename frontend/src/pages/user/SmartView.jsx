@@ -63,7 +63,9 @@ export const SmartView = () => {
       }
 
       // Fetch all non-complete allocations (regardless of date)
-      const allocationsResponse = await axios.get(`${BACKEND_URL}/api/allocations/${propertyId}`);
+      const allocationsResponse = await axios.get(`${BACKEND_URL}/api/allocations/${propertyId}`, {
+        params: { fields: 'id,seatIds,status,callingFlag,guestName,guestCategory,roomNumber,createdAt,updatedAt' }
+      });
       if (allocationsResponse.data.success) {
         // Filter for non-complete allocations only (show active allocations regardless of date)
         const activeAllocations = allocationsResponse.data.allocations.filter(
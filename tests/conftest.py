@@ -0,0 +1,74 @@
+import os
+import sys
+from pathlib import Path
+
+import mongomock.collection
+import pytest
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "smartflags_test")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+
+import server  # noqa: E402
+
+# mongomock re-reads a find_one_and_* result with the projection applied to the
+# filter when _id is projected away, which loses the document; strip it afterwards
+_find_and_modify = mongomock.collection.Collection._find_and_modify
+
+
+def _find_and_modify_without_id(self, query, projection=None, *args, **kwargs):
+    strip = isinstance(projection, dict) and projection.get("_id") == 0
+    if strip:
+        projection = {k: v for k, v in projection.items() if k != "_id"} or None
+    doc = _find_and_modify(self, query, projection, *args, **kwargs)
+    if strip and doc:
+        doc.pop("_id", None)
+    return doc
+
+
+mongomock.collection.Collection._find_and_modify = _find_and_modify_without_id
+
+
+@pytest.fixture
+def client():
+    """API client over a fresh in-memory database; startup hooks and background loops don't run"""
+    mongo = AsyncMongoMockClient()
+    server.client = mongo
+    server.db = mongo[os.environ["DB_NAME"]]
+    server._transactions_supported = False
+    for index in (
+        server.availability_index, server.seat_layout_index, server.device_routes, server.device_last_seen,
+        server.staffing, server.presence, server.calling_tracker, server.geo_search_index,
+    ):
+        index.reset()
+    server.geo_cache.invalidate()
+    return TestClient(server.app)
+
+
+@pytest.fixture
+def property_setup(client):
+    """A property with an F&B manager, ten free seats and guests in rooms 101-105"""
+    org = client.post("/api/organisations", json={
+        "name": "Org", "email": "org@example.com", "phone": "1", "address": "Street"
+    }).json()["organisation"]
+    prop = client.post("/api/properties", json={
+        "organisationId": org["id"], "name": "Resort", "email": "resort@example.com", "phone": "1", "address": "Beach"
+    }).json()["property"]
+    manager = client.post("/api/staff", json={
+        "propertyId": prop["id"], "roleId": "role-fb", "name": "Manager", "email": "manager@example.com",
+        "username": "manager", "pin": "1234"
+    }).json()["staff"]
+    client.post("/api/seats/bulk", json={
+        "propertyId": prop["id"], "seatTypeId": "lounger", "startNumber": 1, "endNumber": 10
+    })
+    seats = client.get(f"/api/seats/{prop['id']}").json()["seats"]
+    for room in range(101, 106):
+        client.post("/api/guests", json={"propertyId": prop["id"], "roomNumber": str(room), "guestName": f"Guest {room}"})
+    return {
+        "organisationId": org["id"],
+        "propertyId": prop["id"],
+        "managerId": manager["id"],
+        "seatIds": [seat["id"] for seat in sorted(seats, key=lambda seat: seat["seatNumber"])],
+    }
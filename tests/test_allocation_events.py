@@ -0,0 +1,53 @@
+import asyncio
+
+import server
+
+
+def create_allocation(client, setup):
+    response = client.post("/api/allocations", json={
+        "propertyId": setup["propertyId"], "roomNumber": "101", "fbManagerId": setup["managerId"], "seatIds": setup["seatIds"][0:1],
+    })
+    assert response.status_code == 200, response.json()
+    return response.json()["allocation"]
+
+
+def events(client, allocation_id, **params):
+    response = client.get(f"/api/allocations/{allocation_id}/events", params=params)
+    assert response.status_code == 200, response.json()
+    return response.json()
+
+
+def test_the_timeline_is_paged_and_the_allocation_keeps_only_recent_events(client, property_setup):
+    allocation = create_allocation(client, property_setup)
+    for flag in ["Calling", "Non Calling"] * 6:
+        client.patch(f"/api/allocations/{allocation['id']}/calling-flag", json={"callingFlag": flag})
+
+    first = events(client, allocation["id"], limit=10)
+    rest = events(client, allocation["id"], skip=10, limit=10)
+
+    assert first["hasMore"] and not rest["hasMore"]
+    timeline = first["events"] + rest["events"]
+    assert len(timeline) == 13
+    assert timeline[0]["eventType"] == "Created"
+    stored = asyncio.run(server.db.allocations.find_one({"id": allocation["id"]}))
+    assert "events" not in stored
+    assert [event["newValue"] for event in stored["recentEvents"]] == [event["newValue"] for event in timeline[-server.RECENT_EVENTS_LIMIT:]]
+
+
+def test_a_page_outside_the_limits_is_refused(client, property_setup):
+    allocation = create_allocation(client, property_setup)
+
+    assert client.get(f"/api/allocations/{allocation['id']}/events", params={"limit": 501}).status_code == 400
+    assert client.get(f"/api/allocations/{allocation['id']}/events", params={"skip": -1}).status_code == 400
+
+
+def test_embedded_timelines_are_moved_out_at_startup(client, property_setup):
+    old_events = [{"eventType": "Status Change", "newValue": str(n), "description": "Old"} for n in range(12)]
+    asyncio.run(server.db.allocations.insert_one({"id": "old", "propertyId": property_setup["propertyId"], "events": old_events}))
+
+    asyncio.run(server.migrate_embedded_allocation_events())
+
+    assert [event["newValue"] for event in events(client, "old", limit=20)["events"]] == [str(n) for n in range(12)]
+    stored = asyncio.run(server.db.allocations.find_one({"id": "old"}))
+    assert "events" not in stored
+    assert [event["newValue"] for event in stored["recentEvents"]] == [str(n) for n in range(2, 12)]
@@ -0,0 +1,134 @@
+import asyncio
+
+import pytest
+
+import server
+
+
+def create_allocation(client, setup, room="101", seat_ids=None):
+    response = client.post("/api/allocations", json={
+        "propertyId": setup["propertyId"],
+        "roomNumber": room,
+        "fbManagerId": setup["managerId"],
+        "seatIds": seat_ids or setup["seatIds"][:2],
+    })
+    assert response.status_code == 200, response.json()
+    return response.json()["allocation"]
+
+
+def set_status(client, allocation_id, status, expected=None):
+    body = {"status": status}
+    if expected:
+        body["expectedStatus"] = expected
+    return client.patch(f"/api/allocations/{allocation_id}/status", json=body)
+
+
+def set_calling_flag(client, allocation_id, flag, expected=None):
+    body = {"callingFlag": flag}
+    if expected:
+        body["expectedCallingFlag"] = expected
+    return client.patch(f"/api/allocations/{allocation_id}/calling-flag", json=body)
+
+
+def test_status_follows_the_lifecycle_and_complete_frees_seats(client, property_setup):
+    allocation = create_allocation(client, property_setup)
+    assert allocation["status"] == "Allocated"
+
+    for status in ("Active", "Billing", "Clear", "Complete"):
+        response = set_status(client, allocation["id"], status)
+        assert response.status_code == 200, response.json()
+        assert response.json()["allocation"]["status"] == status
+
+    seats = {seat["id"]: seat for seat in client.get(f"/api/seats/{property_setup['propertyId']}").json()["seats"]}
+    assert all(seats[seat_id]["status"] == "Free" for seat_id in allocation["seatIds"])
+
+
+@pytest.mark.parametrize("path, target", [
+    ([], "Clear"),
+    (["Active", "Billing", "Clear"], "Billing"),
+    (["Active", "Billing", "Clear"], "Active"),
+    (["Complete"], "Active"),
+    ([], "Bogus"),
+])
+def test_status_rejects_moves_outside_the_transitions_table(client, property_setup, path, target):
+    allocation = create_allocation(client, property_setup)
+    for status in path:
+        assert set_status(client, allocation["id"], status).status_code == 200
+
+    response = set_status(client, allocation["id"], target)
+    assert response.status_code == 400
+    current = client.get(f"/api/allocations/{property_setup['propertyId']}").json()["allocations"][0]
+    assert current["status"] == (path[-1] if path else "Allocated")
+
+
+def test_stale_expected_status_is_rejected_with_409(client, property_setup):
+    allocation = create_allocation(client, property_setup)
+    assert set_status(client, allocation["id"], "Active", expected="Allocated").status_code == 200
+
+    response = set_status(client, allocation["id"], "Billing", expected="Allocated")
+    assert response.status_code == 409
+    assert set_status(client, allocation["id"], "Billing", expected="Active").status_code == 200
+
+
+def test_stale_expected_calling_flag_is_rejected_with_409(client, property_setup):
+    allocation = create_allocation(client, property_setup)
+    assert set_calling_flag(client, allocation["id"], "Calling", expected="Non Calling").status_code == 200
+
+    response = set_calling_flag(client, allocation["id"], "Calling for Checkout", expected="Non Calling")
+    assert response.status_code == 409
+
+
+def test_calling_flag_is_guarded_once_complete(client, property_setup):
+    allocation = create_allocation(client, property_setup)
+    assert set_calling_flag(client, allocation["id"], "Calling").status_code == 200
+    assert set_status(client, allocation["id"], "Complete").status_code == 200
+
+    response = set_calling_flag(client, allocation["id"], "Non Calling")
+    assert response.status_code == 409
+
+
+@pytest.mark.parametrize("field, value", [("status", "Allocated"), ("callingFlag", "Non Calling")])
+def test_asking_for_the_current_value_is_a_no_op(client, property_setup, field, value):
+    allocation = create_allocation(client, property_setup)
+    update = set_status if field == "status" else set_calling_flag
+
+    response = update(client, allocation["id"], value, expected=value)
+
+    assert response.status_code == 200
+    assert response.json()["allocation"][field] == value
+    events = client.get(f"/api/allocations/{allocation['id']}/events").json()["events"]
+    assert [event["eventType"] for event in events] == ["Created"]
+
+
+def test_repeating_a_value_that_has_since_changed_is_rejected_with_409(client, property_setup):
+    allocation = create_allocation(client, property_setup)
+    assert set_status(client, allocation["id"], "Active").status_code == 200
+
+    assert set_status(client, allocation["id"], "Allocated", expected="Allocated").status_code == 409
+
+
+def test_transitions_are_recorded_as_events(client, property_setup):
+    allocation = create_allocation(client, property_setup)
+    set_calling_flag(client, allocation["id"], "Calling")
+    set_calling_flag(client, allocation["id"], "Non Calling")
+    set_status(client, allocation["id"], "Active")
+
+    events = client.get(f"/api/allocations/{allocation['id']}/events").json()["events"]
+    assert [(event["eventType"], event["newValue"]) for event in events] == [
+        ("Created", "Allocated"),
+        ("Calling On", "Calling"),
+        ("Calling Off", "Non Calling"),
+        ("Status Change", "Active"),
+    ]
+
+
+@pytest.mark.parametrize("field, target", [("status", "Active"), ("callingFlag", "Calling")])
+def test_legacy_allocations_without_the_field_transition_from_the_default(client, property_setup, field, target):
+    allocation = create_allocation(client, property_setup)
+    asyncio.run(server.db.allocations.update_one({"id": allocation["id"]}, {"$unset": {field: ""}}))
+
+    update = set_status if field == "status" else set_calling_flag
+    response = update(client, allocation["id"], target)
+
+    assert response.status_code == 200, response.json()
+    assert response.json()["allocation"][field] == target
@@ -0,0 +1,77 @@
+from datetime import datetime, timezone
+
+import server
+
+DAY = "2026-10-18"
+NOW = datetime(2026, 10, 20, tzinfo=timezone.utc)
+SEATS = [
+    {"id": "seat-1", "sectionId": "pool", "seatTypeId": "lounger"},
+    {"id": "seat-2", "sectionId": "pool", "seatTypeId": "lounger"},
+    {"id": "seat-3", "sectionId": "", "seatTypeId": "cabana"},
+]
+
+
+def event(allocation_id, event_type, new_value, time):
+    return {"allocationId": allocation_id, "eventType": event_type, "newValue": new_value, "timestamp": f"{DAY}T{time}+00:00"}
+
+
+def test_a_day_without_allocations_is_empty():
+    assert server.compute_day_analytics(DAY, [], [], SEATS, NOW) == server.empty_day_analytics()
+
+
+def test_seat_hours_are_split_by_hour_section_and_seat_type():
+    allocations = [
+        {"id": "a1", "seatIds": ["seat-1", "seat-2"], "status": "Complete"},
+        {"id": "a2", "seatIds": ["seat-3"], "status": "Allocated"},
+    ]
+    events = [
+        event("a1", "Created", "Allocated", "10:00:00"),
+        event("a1", "Status Change", "Complete", "12:00:00"),
+        event("a2", "Created", "Allocated", "23:30:00"),
+    ]
+
+    summary = server.compute_day_analytics(DAY, allocations, events, SEATS, NOW)
+
+    assert summary["allocations"] == 2
+    assert summary["allocationsByStatus"] == {"Complete": 1, "Allocated": 1}
+    assert summary["seatHoursByHour"][10] == 2.0
+    assert summary["seatHoursByHour"][11] == 2.0
+    assert summary["seatHoursByHour"][23] == 0.5
+    assert summary["seatHours"] == 4.5
+    assert summary["seatHoursBySection"] == {"pool": 4.0, "unassigned": 0.5}
+    assert summary["seatHoursBySeatType"] == {"lounger": 4.0, "cabana": 0.5}
+    assert summary["statusSeconds"] == {"Allocated": {"total": 7200.0, "count": 1}}
+
+
+def test_an_open_allocation_is_counted_only_until_now():
+    allocations = [{"id": "a1", "seatIds": ["seat-1"], "status": "Active"}]
+    events = [event("a1", "Created", "Allocated", "10:00:00")]
+    now = datetime.fromisoformat(f"{DAY}T11:30:00+00:00")
+
+    summary = server.compute_day_analytics(DAY, allocations, events, SEATS, now)
+
+    assert summary["seatHours"] == 1.5
+    assert summary["seatHoursByHour"][12] == 0.0
+
+
+def test_calling_latency_runs_from_the_first_call_to_calling_off():
+    allocations = [{"id": "a1", "seatIds": ["seat-1"], "status": "Active"}]
+    events = [
+        event("a1", "Created", "Allocated", "10:00:00"),
+        event("a1", "Calling On", "Calling", "10:10:00"),
+        # Switching to Calling for Checkout doesn't restart the call
+        event("a1", "Calling On", "Calling for Checkout", "10:12:00"),
+        event("a1", "Calling Off", "Non Calling", "10:15:00"),
+        event("a1", "Calling On", "Calling", "11:00:00"),
+        event("a1", "Calling Off", "Non Calling", "11:00:20"),
+    ]
+
+    latency = server.compute_day_analytics(DAY, allocations, events, SEATS, NOW)["callingLatency"]
+
+    assert latency["count"] == 2
+    assert latency["totalSeconds"] == 320.0
+    assert latency["maxSeconds"] == 300.0
+    expected = [0] * (len(server.CALLING_LATENCY_BUCKETS) + 1)
+    expected[server.CALLING_LATENCY_BUCKETS.index(30)] += 1
+    expected[server.CALLING_LATENCY_BUCKETS.index(300)] += 1
+    assert latency["buckets"] == expected
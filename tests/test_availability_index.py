@@ -0,0 +1,90 @@
+import asyncio
+
+import server
+
+
+def allocate(client, setup, room, seat_ids, device_ids=()):
+    response = client.post("/api/allocations", json={
+        "propertyId": setup["propertyId"], "roomNumber": room,
+        "fbManagerId": setup["managerId"], "seatIds": seat_ids, "deviceIds": list(device_ids),
+    })
+    assert response.status_code == 200, response.json()
+    return response.json()["allocation"]
+
+
+def held(client, setup):
+    seats = client.get(f"/api/allocations/{setup['propertyId']}/allocated-seats").json()["allocatedSeatIds"]
+    devices = client.get(f"/api/allocations/{setup['propertyId']}/allocated-devices").json()["allocatedDeviceIds"]
+    return sorted(seats), sorted(devices)
+
+
+def test_writes_and_releases_keep_the_index_current(client, property_setup):
+    seats = property_setup["seatIds"]
+    device = client.post("/api/devices", json={"propertyId": property_setup["propertyId"], "deviceId": "PG1"}).json()["id"]
+    assert held(client, property_setup) == ([], [])
+
+    allocation = allocate(client, property_setup, "101", seats[0:2], [device])
+    assert held(client, property_setup) == (sorted(seats[0:2]), [device])
+
+    client.patch(f"/api/allocations/{allocation['id']}/status", json={"status": "Complete"})
+    assert held(client, property_setup) == ([], [])
+
+
+def test_a_write_seen_by_the_load_and_replayed_is_held_once(client, property_setup, monkeypatch):
+    seats = property_setup["seatIds"]
+    device = client.post("/api/devices", json={"propertyId": property_setup["propertyId"], "deviceId": "PG1"}).json()["id"]
+    allocation = allocate(client, property_setup, "101", seats[0:1], [device])
+    server.availability_index.reset()
+
+    load = server.availability_index._load
+
+    async def load_while_writing(property_id, allocation_date):
+        entry = await load(property_id, allocation_date)
+        # The write landed before the find read it, but was recorded while the load ran
+        server.availability_index.add_allocation(allocation)
+        return entry
+
+    monkeypatch.setattr(server.availability_index, "_load", load_while_writing)
+    assert held(client, property_setup) == (seats[0:1], [device])
+    monkeypatch.undo()
+
+    client.patch(f"/api/allocations/{allocation['id']}/status", json={"status": "Complete"})
+
+    assert held(client, property_setup) == ([], [])
+    allocate(client, property_setup, "102", seats[0:1], [device])
+
+
+def test_a_release_during_the_load_is_not_lost(client, property_setup, monkeypatch):
+    seats = property_setup["seatIds"]
+    allocation = allocate(client, property_setup, "101", seats[0:1])
+    server.availability_index.reset()
+
+    load = server.availability_index._load
+
+    async def load_while_releasing(property_id, allocation_date):
+        entry = await load(property_id, allocation_date)
+        server.availability_index.release_allocation(allocation)
+        return entry
+
+    monkeypatch.setattr(server.availability_index, "_load", load_while_releasing)
+    assert held(client, property_setup) == ([], [])
+
+
+def test_a_shared_seat_stays_held_until_every_holder_is_released():
+    index = server.AllocationAvailabilityIndex()
+    index._entries[("prop", "2026-10-19")] = {"seat": {}, "device": {}, "enabledDevice": {"d1"}, "freeDevice": {"d1"}}
+    first = {"id": "a1", "propertyId": "prop", "allocationDate": "2026-10-19", "seatIds": ["s1"], "deviceIds": ["d1"]}
+    second = {"id": "a2", "propertyId": "prop", "allocationDate": "2026-10-19", "seatIds": ["s1"], "deviceIds": ["d1"]}
+
+    index.add_allocation(first)
+    index.add_allocation(second)
+    index.add_allocation(second)
+    index.release_allocation(first)
+    entry = asyncio.run(index.get("prop", "2026-10-19"))
+    assert set(entry["seat"]) == {"s1"}
+    assert entry["freeDevice"] == set()
+
+    index.release_allocation(second)
+    index.release_allocation(second)
+    assert entry["seat"] == {}
+    assert entry["freeDevice"] == {"d1"}
@@ -0,0 +1,133 @@
+import server
+
+
+def bulk_allocate(client, setup, members, all_or_nothing=True):
+    return client.post("/api/allocations/bulk", json={
+        "propertyId": setup["propertyId"],
+        "fbManagerId": setup["managerId"],
+        "members": members,
+        "allOrNothing": all_or_nothing,
+    })
+
+
+def open_allocations(client, setup):
+    return client.get(f"/api/allocations/{setup['propertyId']}").json()["allocations"]
+
+
+def test_group_is_allocated_in_one_request(client, property_setup):
+    seats = property_setup["seatIds"]
+    response = bulk_allocate(client, property_setup, [
+        {"roomNumber": "101", "seatIds": seats[0:2]},
+        {"roomNumber": "102", "seatIds": seats[2:4]},
+    ])
+
+    assert response.status_code == 200, response.json()
+    assert response.json()["count"] == 2
+    assert sorted(a["roomNumber"] for a in open_allocations(client, property_setup)) == ["101", "102"]
+
+
+def test_members_requesting_the_same_seat_conflict(client, property_setup):
+    seats = property_setup["seatIds"]
+    response = bulk_allocate(client, property_setup, [
+        {"roomNumber": "101", "seatIds": seats[0:2]},
+        {"roomNumber": "102", "seatIds": seats[1:3]},
+    ])
+
+    assert response.status_code == 400
+    failures = response.json()["detail"]["failures"]
+    assert [(failure["index"], failure["roomNumber"]) for failure in failures] == [(1, "102")]
+    assert "another group member" in failures[0]["detail"]
+    assert open_allocations(client, property_setup) == []
+
+
+def test_seat_already_allocated_fails_its_member(client, property_setup):
+    seats = property_setup["seatIds"]
+    assert bulk_allocate(client, property_setup, [{"roomNumber": "101", "seatIds": seats[0:1]}]).status_code == 200
+
+    response = bulk_allocate(client, property_setup, [
+        {"roomNumber": "102", "seatIds": seats[0:2]},
+        {"roomNumber": "103", "seatIds": seats[2:3]},
+    ], all_or_nothing=False)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["count"] == 1
+    assert [failure["roomNumber"] for failure in body["failures"]] == ["102"]
+    assert "already allocated" in body["failures"][0]["detail"]
+    assert sorted(a["roomNumber"] for a in open_allocations(client, property_setup)) == ["101", "103"]
+
+
+def test_seat_listed_twice_fails_only_its_member(client, property_setup):
+    seats = property_setup["seatIds"]
+    response = bulk_allocate(client, property_setup, [
+        {"roomNumber": "101", "seatIds": [seats[0], seats[0]]},
+        {"roomNumber": "102", "seatIds": seats[1:2]},
+    ], all_or_nothing=False)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["count"] == 1
+    assert [failure["roomNumber"] for failure in body["failures"]] == ["101"]
+    assert "more than once" in body["failures"][0]["detail"]
+
+
+def test_single_create_rejects_a_seat_listed_twice(client, property_setup):
+    seat_id = property_setup["seatIds"][0]
+    response = client.post("/api/allocations", json={
+        "propertyId": property_setup["propertyId"],
+        "roomNumber": "101",
+        "fbManagerId": property_setup["managerId"],
+        "seatIds": [seat_id, seat_id],
+    })
+
+    assert response.status_code == 400
+    assert "more than once" in response.json()["detail"]
+
+
+def test_unknown_room_fails_its_member(client, property_setup):
+    seats = property_setup["seatIds"]
+    response = bulk_allocate(client, property_setup, [
+        {"roomNumber": "999", "seatIds": seats[0:1]},
+        {"roomNumber": "101", "seatIds": seats[1:2]},
+    ], all_or_nothing=False)
+
+    assert response.status_code == 200
+    assert response.json()["count"] == 1
+    assert response.json()["failures"][0]["roomNumber"] == "999"
+
+
+def test_a_failed_write_leaves_no_reservations_behind(client, property_setup, monkeypatch):
+    seats = property_setup["seatIds"]
+    set_seat_statuses = server.set_seat_statuses
+
+    async def fail_after_marking(*args, **kwargs):
+        await set_seat_statuses(*args, **kwargs)
+        raise RuntimeError("connection lost")
+
+    monkeypatch.setattr(server, "set_seat_statuses", fail_after_marking)
+    response = bulk_allocate(client, property_setup, [{"roomNumber": "101", "seatIds": seats[0:2]}])
+    assert response.status_code == 500
+    monkeypatch.undo()
+
+    assert open_allocations(client, property_setup) == []
+    statuses = {seat["id"]: seat["status"] for seat in client.get(f"/api/seats/{property_setup['propertyId']}").json()["seats"]}
+    assert statuses[seats[0]] == statuses[seats[1]] == "Free"
+    assert bulk_allocate(client, property_setup, [{"roomNumber": "102", "seatIds": seats[0:2]}]).status_code == 200
+
+
+def test_single_create_rejects_seats_of_another_property(client, property_setup):
+    other = client.post("/api/properties", json={
+        "organisationId": property_setup["organisationId"], "name": "Other", "email": "other@example.com", "phone": "1", "address": "Hill"
+    }).json()["property"]
+    client.post("/api/seats/bulk", json={"propertyId": other["id"], "seatTypeId": "lounger", "startNumber": 1, "endNumber": 1})
+    foreign_seat = client.get(f"/api/seats/{other['id']}").json()["seats"][0]["id"]
+
+    response = client.post("/api/allocations", json={
+        "propertyId": property_setup["propertyId"],
+        "roomNumber": "101",
+        "fbManagerId": property_setup["managerId"],
+        "seatIds": [foreign_seat],
+    })
+
+    assert response.status_code == 400
+    assert "not found" in response.json()["detail"]
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+import server
+
+
+@pytest.fixture(autouse=True)
+def small_batches(monkeypatch):
+    monkeypatch.setattr(server, "CASCADE_BATCH_SIZE", 3)
+    monkeypatch.setattr(server, "CASCADE_BATCH_PAUSE_SECONDS", 0)
+
+
+def run_queued_jobs():
+    """Run pending cascade jobs oldest first, as the worker does, until none are left"""
+    async def drain():
+        while job := await server.db.cascade_jobs.find_one({"status": "pending"}, {"_id": 0}, sort=[("createdAt", 1)]):
+            await server.run_cascade_job(job)
+            await server.db.cascade_jobs.update_one({"id": job["id"]}, {"$set": {"status": "done"}})
+    asyncio.run(drain())
+
+
+def count(collection, query):
+    return asyncio.run(server.db[collection].count_documents(query))
+
+
+def test_deleting_an_organisation_cleans_up_its_properties(client, property_setup):
+    pid = property_setup["propertyId"]
+    client.post("/api/allocations", json={
+        "propertyId": pid, "roomNumber": "101", "fbManagerId": property_setup["managerId"], "seatIds": property_setup["seatIds"][0:2],
+    })
+    other_org = client.post("/api/organisations", json={
+        "name": "Other", "email": "other@example.com", "phone": "1", "address": "Hill"
+    }).json()["organisation"]
+    other = client.post("/api/properties", json={
+        "organisationId": other_org["id"], "name": "Other", "email": "otherp@example.com", "phone": "1", "address": "Hill"
+    }).json()["property"]
+    client.post("/api/seats/bulk", json={"propertyId": other["id"], "seatTypeId": "lounger", "startNumber": 1, "endNumber": 4})
+
+    response = client.delete(f"/api/organisations/{property_setup['organisationId']}")
+    assert response.status_code == 200
+    run_queued_jobs()
+
+    assert count("properties", {"organisationId": property_setup["organisationId"]}) == 0
+    for collection in ("seats", "staff", "guests", "allocations", "allocation_events", "allocation_reservations"):
+        assert count(collection, {"propertyId": pid}) == 0, collection
+    assert count("seats", {"propertyId": other["id"]}) == 4
+    jobs = client.get("/api/admin/cascade-jobs").json()["jobs"]
+    property_job = next(job for job in jobs if job["kind"] == "property")
+    assert property_job["processed"]["seats"] == 10
+
+
+def test_deleting_a_section_clears_its_seats(client, property_setup):
+    seats = property_setup["seatIds"]
+    section = client.post("/api/sections", json={
+        "propertyId": property_setup["propertyId"], "name": "Pool", "seatIds": seats[0:5]
+    }).json()["section"]
+
+    client.delete(f"/api/sections/{section['id']}")
+    run_queued_jobs()
+
+    assert count("seats", {"sectionId": section["id"]}) == 0
+    assert count("seats", {"id": {"$in": seats[0:5]}, "sectionId": ""}) == 5
+
+
+def test_deleting_a_seat_drops_it_from_sections(client, property_setup):
+    seats = property_setup["seatIds"]
+    section = client.post("/api/sections", json={
+        "propertyId": property_setup["propertyId"], "name": "Pool", "seatIds": seats[0:3]
+    }).json()["section"]
+
+    client.delete(f"/api/seats/{seats[1]}")
+    run_queued_jobs()
+
+    current = client.get(f"/api/sections/{property_setup['propertyId']}").json()["sections"]
+    assert next(s for s in current if s["id"] == section["id"])["seatIds"] == [seats[0], seats[2]]
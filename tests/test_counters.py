@@ -0,0 +1,74 @@
+def property_counters(client, setup):
+    return client.get("/api/rollup", params={"propertyId": setup["propertyId"]}).json()["counters"]
+
+
+def test_seat_counters_follow_creation_blocking_and_deletion(client, property_setup):
+    seats = property_setup["seatIds"]
+    assert property_counters(client, property_setup)["seats"] == {"total": 10, "byStatus": {"Free": 10}}
+
+    client.patch(f"/api/seats/{seats[0]}/toggle-block")
+    client.delete(f"/api/seats/{seats[1]}")
+
+    assert property_counters(client, property_setup)["seats"] == {"total": 9, "byStatus": {"Free": 8, "Blocked": 1}}
+
+
+def test_allocation_counters_follow_the_lifecycle(client, property_setup):
+    seats = property_setup["seatIds"]
+    first = client.post("/api/allocations", json={
+        "propertyId": property_setup["propertyId"], "roomNumber": "101",
+        "fbManagerId": property_setup["managerId"], "seatIds": seats[0:2],
+    }).json()["allocation"]
+    second = client.post("/api/allocations", json={
+        "propertyId": property_setup["propertyId"], "roomNumber": "102",
+        "fbManagerId": property_setup["managerId"], "seatIds": seats[2:3],
+    }).json()["allocation"]
+
+    counters = property_counters(client, property_setup)
+    assert counters["allocations"] == {"active": 2}
+    assert counters["seats"]["byStatus"] == {"Free": 7, "Allocated": 3}
+
+    client.patch(f"/api/allocations/{first['id']}/status", json={"status": "Complete"})
+    client.delete(f"/api/allocations/{second['id']}")
+
+    counters = property_counters(client, property_setup)
+    assert counters["allocations"] == {"active": 0}
+    assert counters["seats"]["byStatus"] == {"Free": 10}
+
+
+def test_device_and_staff_counters(client, property_setup):
+    devices = [
+        client.post("/api/devices", json={"propertyId": property_setup["propertyId"], "deviceId": f"PG{i}"}).json()["id"]
+        for i in range(3)
+    ]
+    client.put(f"/api/devices/{devices[0]}", json={"enabled": False})
+    client.delete(f"/api/devices/{devices[1]}")
+    client.post("/api/staff", json={
+        "propertyId": property_setup["propertyId"], "roleId": "role-attendant", "name": "Attendant",
+        "email": "attendant@example.com", "username": "attendant", "pin": "1234"
+    })
+
+    counters = property_counters(client, property_setup)
+    assert counters["devices"] == {"total": 2, "enabled": 1}
+    assert counters["staff"] == {"total": 2, "byRole": {"role-fb": 1, "role-attendant": 1}}
+
+
+def test_recount_finds_nothing_to_correct_after_incremental_updates(client, property_setup):
+    seats = property_setup["seatIds"]
+    client.patch(f"/api/seats/{seats[0]}/toggle-block")
+    client.post("/api/allocations", json={
+        "propertyId": property_setup["propertyId"], "roomNumber": "101",
+        "fbManagerId": property_setup["managerId"], "seatIds": seats[1:3],
+    })
+
+    response = client.post("/api/admin/recount-counters", params={"propertyId": property_setup["propertyId"]})
+    assert response.json()["corrections"] == {}
+
+
+def test_global_counters_drop_a_deleted_property(client, property_setup):
+    assert client.get("/api/rollup").json()["counters"]["properties"] == 1
+
+    client.delete(f"/api/properties/{property_setup['propertyId']}")
+
+    counters = client.get("/api/rollup").json()["counters"]
+    assert counters["properties"] == 0
+    assert counters["seats"]["total"] == 0
@@ -0,0 +1,31 @@
+def provision(client, setup, **body):
+    return client.post("/api/devices/bulk", json={"propertyId": setup["propertyId"], **body})
+
+
+def device_ids(client, setup):
+    return sorted(device["deviceId"] for device in client.get(f"/api/devices/{setup['propertyId']}").json()["devices"])
+
+
+def test_range_is_expanded_with_padding(client, property_setup):
+    response = provision(client, property_setup, prefix="PG", startNumber=8, endNumber=10)
+
+    assert response.json()["count"] == 3
+    assert device_ids(client, property_setup) == ["PG08", "PG09", "PG10"]
+
+
+def test_existing_devices_are_skipped_even_without_the_unique_index(client, property_setup):
+    # The test database has no indexes, as when legacy duplicates stop the unique one being built
+    provision(client, property_setup, deviceIds=["PG1", "PG2"])
+
+    response = provision(client, property_setup, deviceIds=["PG2", "PG3", "PG3"])
+
+    assert response.json()["count"] == 1
+    assert response.json()["skipped"] == ["PG2"]
+    assert device_ids(client, property_setup) == ["PG1", "PG2", "PG3"]
+
+
+def test_oversized_ranges_are_refused(client, property_setup):
+    response = provision(client, property_setup, startNumber=1, endNumber=10**9)
+
+    assert response.status_code == 400
+    assert device_ids(client, property_setup) == []
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+import server
+
+
+@pytest.fixture
+def ringing(client, property_setup):
+    """Two devices, PG1 held by an allocation for room 101 and PG2 free"""
+    devices = {
+        physical: client.post("/api/devices", json={"propertyId": property_setup["propertyId"], "deviceId": physical}).json()["id"]
+        for physical in ("PG1", "PG2")
+    }
+    allocation = client.post("/api/allocations", json={
+        "propertyId": property_setup["propertyId"], "roomNumber": "101", "fbManagerId": property_setup["managerId"],
+        "seatIds": property_setup["seatIds"][0:1], "deviceIds": [devices["PG1"]],
+    }).json()["allocation"]
+    return {**property_setup, "devices": devices, "allocation": allocation}
+
+
+def press(client, setup, *events):
+    response = client.post("/api/devices/events", json={
+        "propertyId": setup["propertyId"],
+        "events": [{"deviceId": device_id, "action": action} for device_id, action in events],
+    })
+    assert response.status_code == 200, response.json()
+    return response.json()["results"]
+
+
+def calling_flag(client, setup):
+    allocations = client.get(f"/api/allocations/{setup['propertyId']}").json()["allocations"]
+    return next(a for a in allocations if a["id"] == setup["allocation"]["id"]).get("callingFlag")
+
+
+def test_presses_set_the_calling_flag_of_the_holding_allocation(client, ringing):
+    assert press(client, ringing, ("PG1", "call")) == ["applied"]
+    assert calling_flag(client, ringing) == "Calling"
+
+    assert press(client, ringing, ("PG1", "cancel")) == ["applied"]
+    assert calling_flag(client, ringing) == "Non Calling"
+
+
+def test_presses_that_cannot_be_routed_are_reported(client, ringing):
+    results = press(client, ringing, ("PG9", "call"), ("PG2", "call"), ("PG1", "dance"))
+
+    assert results == ["unknownDevice", "noAllocation", "invalidAction"]
+
+
+def test_repeats_are_deduplicated_and_only_the_last_press_applies(client, ringing):
+    results = press(client, ringing, ("PG1", "call"), ("PG1", "call"), ("PG1", "checkout"))
+
+    assert results == ["superseded", "duplicate", "applied"]
+    assert calling_flag(client, ringing) == "Calling for Checkout"
+    assert press(client, ringing, ("PG1", "checkout")) == ["duplicate"]
+
+
+def test_a_press_matching_the_current_flag_is_unchanged(client, ringing):
+    assert press(client, ringing, ("PG1", "cancel")) == ["unchanged"]
+
+
+def test_a_stale_cached_flag_is_refreshed_and_retried(client, ringing):
+    press(client, ringing, ("PG1", "call"))
+    # Changed behind the index's back, so the route's cached flag is stale
+    asyncio.run(server.db.allocations.update_one(
+        {"id": ringing["allocation"]["id"]}, {"$set": {"callingFlag": "Non Calling"}}
+    ))
+
+    assert press(client, ringing, ("PG1", "checkout")) == ["applied"]
+    assert calling_flag(client, ringing) == "Calling for Checkout"
+
+
+def test_a_completed_allocation_stops_ringing(client, ringing):
+    client.patch(f"/api/allocations/{ringing['allocation']['id']}/status", json={"status": "Complete"})
+
+    assert press(client, ringing, ("PG1", "call")) == ["noAllocation"]
@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta, timezone
+
+import server
+
+
+def reading(device_id, at, battery=None, signal=None):
+    return {"deviceId": device_id, "at": at, "battery": battery, "signal": signal}
+
+
+def updates_by_bucket(writes):
+    return {(write._filter["deviceId"], write._filter["bucket"]): write._doc for write in writes}
+
+
+def test_readings_fold_into_one_upsert_per_device_and_bucket():
+    start = datetime(2026, 10, 19, 12, 0, tzinfo=timezone.utc)
+    readings = [
+        reading("PG1", start + timedelta(seconds=5), battery=80, signal=-60),
+        reading("PG1", start + timedelta(seconds=40), battery=78, signal=-70),
+        reading("PG1", start + timedelta(seconds=65), battery=77),
+        reading("PG2", start + timedelta(seconds=10)),
+    ]
+
+    writes = server.telemetry_rollup_writes("prop", readings, "1m")
+    updates = updates_by_bucket(writes)
+
+    assert set(updates) == {
+        ("PG1", "2026-10-19T12:00:00+00:00"),
+        ("PG1", "2026-10-19T12:01:00+00:00"),
+        ("PG2", "2026-10-19T12:00:00+00:00"),
+    }
+    assert all(write._filter["propertyId"] == "prop" and write._upsert for write in writes)
+
+    first = updates[("PG1", "2026-10-19T12:00:00+00:00")]
+    assert first["$inc"] == {"count": 2, "batteryCount": 2, "batterySum": 158, "signalCount": 2, "signalSum": -130}
+    assert first["$min"] == {"batteryMin": 78, "signalMin": -70}
+    assert first["$max"] == {"lastSeenAt": (start + timedelta(seconds=40)).isoformat(), "batteryMax": 80, "signalMax": -60}
+    assert first["$set"] == {"batteryLast": 78, "signalLast": -70}
+    assert first["$setOnInsert"] == {"expireAt": start + timedelta(days=server.TELEMETRY_RESOLUTIONS["1m"]["retentionDays"])}
+
+
+def test_heartbeats_only_count_and_touch_last_seen():
+    at = datetime(2026, 10, 19, 12, 0, 10, tzinfo=timezone.utc)
+
+    update = updates_by_bucket(server.telemetry_rollup_writes("prop", [reading("PG2", at)], "1m"))[("PG2", "2026-10-19T12:00:00+00:00")]
+
+    assert update["$inc"] == {"count": 1}
+    assert update["$max"] == {"lastSeenAt": at.isoformat()}
+    assert "$min" not in update and "$set" not in update
+
+
+def test_hourly_rollup_spans_the_hour():
+    start = datetime(2026, 10, 19, 12, 0, tzinfo=timezone.utc)
+    readings = [reading("PG1", start + timedelta(minutes=minute), battery=100 - minute) for minute in range(0, 90, 15)]
+
+    updates = updates_by_bucket(server.telemetry_rollup_writes("prop", readings, "1h"))
+
+    assert updates[("PG1", "2026-10-19T12:00:00+00:00")]["$inc"]["count"] == 4
+    assert updates[("PG1", "2026-10-19T13:00:00+00:00")]["$inc"]["count"] == 2
+    assert updates[("PG1", "2026-10-19T13:00:00+00:00")]["$min"] == {"batteryMin": 25}
+
+
+def test_rollup_documents_read_back_as_series_points():
+    point = server.telemetry_point({
+        "bucket": "2026-10-19T12:00:00+00:00", "count": 3, "lastSeenAt": "2026-10-19T12:00:50+00:00",
+        "batteryCount": 2, "batterySum": 150, "batteryMin": 70, "batteryMax": 80, "batteryLast": 70,
+    })
+
+    assert point["battery"] == {"avg": 75.0, "min": 70, "max": 80, "last": 70}
+    assert point["signal"] is None
+    assert point["count"] == 3
@@ -0,0 +1,46 @@
+import json
+
+
+def load(client, content, filename):
+    return client.post("/api/admin/geo/load", files={"file": (filename, content.encode(), "text/plain")})
+
+
+CSV = """countryCode,countryName,stateCode,stateName,cityName
+PT,Portugal,11,Lisboa,Lisboa
+PT,Portugal,11,Lisboa,Sintra
+PT,Portugal,13,Porto,Porto
+ES,Spain,,,
+ES,Spain,,,Madrid
+,,,Nowhere,
+"""
+
+
+def test_csv_dataset_builds_the_hierarchy_and_reloads_as_a_no_op(client):
+    response = load(client, CSV, "geo.csv")
+
+    assert response.status_code == 200, response.json()
+    assert response.json()["inserted"] == {"countries": 2, "states": 2, "cities": 3}
+    assert response.json()["rowsSkipped"] == 2
+
+    tree = {country["code"]: country for country in client.get("/api/geo/tree").json()["countries"]}
+    assert sorted(tree) == ["ES", "PT"]
+    lisboa = next(state for state in tree["PT"]["states"] if state["name"] == "Lisboa")
+    assert sorted(city["name"] for city in lisboa["cities"]) == ["Lisboa", "Sintra"]
+
+    assert load(client, CSV, "geo.csv").json()["inserted"] == {"countries": 0, "states": 0, "cities": 0}
+
+
+def test_ndjson_rows_are_loaded(client):
+    rows = [{"countryCode": "FR", "countryName": "France", "stateName": "Occitanie", "cityName": "Toulouse"}]
+    content = "\n".join(json.dumps(row) for row in rows) + "\n\n"
+
+    assert load(client, content, "geo.ndjson").json()["inserted"] == {"countries": 1, "states": 1, "cities": 1}
+
+
+def test_malformed_datasets_are_rejected_with_400(client):
+    assert load(client, json.dumps({"countryCode": "PT"}), "geo.json").status_code == 400
+    assert load(client, json.dumps([{"countryCode": "PT", "countryName": "Portugal"}, "PT"]), "geo.json").status_code == 400
+    assert load(client, "[not json", "geo.json").status_code == 400
+    assert load(client, "a,b\n", "geo.xml").status_code == 400
+
+    assert client.get("/api/countries").json()["countries"] == []
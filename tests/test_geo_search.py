@@ -0,0 +1,51 @@
+import pytest
+
+
+@pytest.fixture
+def places(client):
+    """Brazil (Sao Paulo state with São Paulo and Campinas) and the US (California with San Jose)"""
+    ids = {}
+    for country, code, state, cities in (
+        ("Brazil", "BR", "Sao Paulo", ["São Paulo", "Campinas"]),
+        ("United States", "US", "California", ["San Jose"]),
+    ):
+        country_id = client.post("/api/countries", json={"name": country, "code": code}).json()["country"]["id"]
+        state_id = client.post("/api/states", json={"countryId": country_id, "name": state, "code": code}).json()["state"]["id"]
+        ids.update({code: country_id, state: state_id})
+        for city in cities:
+            ids[city] = client.post("/api/cities", json={"stateId": state_id, "name": city}).json()["city"]["id"]
+    return ids
+
+
+def search(client, q, **params):
+    response = client.get("/api/geo/search", params={"q": q, **params})
+    assert response.status_code == 200, response.json()
+    return [(result["type"], result["name"]) for result in response.json()["results"]]
+
+
+def test_prefixes_match_any_word_and_ignore_accents(client, places):
+    assert search(client, "sao p") == [("state", "Sao Paulo"), ("city", "São Paulo")]
+    assert search(client, "jose") == [("city", "San Jose")]
+    assert search(client, "sao", type="city") == [("city", "São Paulo")]
+
+
+def test_misspellings_fall_back_to_fuzzy_matches(client, places):
+    assert search(client, "campinsa") == [("city", "Campinas")]
+
+
+def test_results_can_be_narrowed_to_a_country_or_state(client, places):
+    assert search(client, "san", countryId=places["BR"]) == []
+    assert search(client, "s", stateId=places["Sao Paulo"]) == [("city", "São Paulo")]
+
+
+def test_changes_are_searchable_without_a_rebuild(client, places):
+    search(client, "jose")
+    client.delete(f"/api/cities/{places['San Jose']}")
+    client.post("/api/cities", json={"stateId": places["California"], "name": "San Diego"})
+
+    assert search(client, "san") == [("city", "San Diego")]
+
+
+def test_bad_parameters_are_refused(client):
+    assert client.get("/api/geo/search", params={"q": "a", "type": "town"}).status_code == 400
+    assert client.get("/api/geo/search", params={"q": "a", "limit": 0}).status_code == 400
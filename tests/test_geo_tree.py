@@ -0,0 +1,30 @@
+def add_country(client, name, code):
+    return client.post("/api/countries", json={"name": name, "code": code}).json()["country"]
+
+
+def test_the_tree_nests_cities_under_states_under_countries(client):
+    portugal = add_country(client, "Portugal", "PT")
+    lisboa = client.post("/api/states", json={"countryId": portugal["id"], "name": "Lisboa", "code": "11"}).json()["state"]
+    client.post("/api/cities", json={"stateId": lisboa["id"], "name": "Sintra"})
+
+    countries = client.get("/api/geo/tree").json()["countries"]
+
+    assert [country["code"] for country in countries] == ["PT"]
+    assert [state["name"] for state in countries[0]["states"]] == ["Lisboa"]
+    assert [city["name"] for city in countries[0]["states"][0]["cities"]] == ["Sintra"]
+
+
+def test_a_matching_etag_gets_304_until_the_data_changes(client):
+    add_country(client, "Portugal", "PT")
+    first = client.get("/api/geo/tree")
+    etag = first.headers["etag"]
+
+    assert client.get("/api/geo/tree", headers={"If-None-Match": etag}).status_code == 304
+
+    add_country(client, "Spain", "ES")
+    changed = client.get("/api/geo/tree", headers={"If-None-Match": etag})
+
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert changed.json()["version"] > first.json()["version"]
+    assert sorted(country["code"] for country in changed.json()["countries"]) == ["ES", "PT"]
@@ -0,0 +1,26 @@
+import asyncio
+import logging
+
+import pytest
+from pymongo.errors import OperationFailure
+
+import server
+
+
+def test_unique_index_over_duplicates_is_logged_with_what_it_protects(client, caplog):
+    asyncio.run(server.db.devices.insert_many([{"propertyId": "p", "deviceId": "PG1"}, {"propertyId": "p", "deviceId": "PG1"}]))
+
+    with caplog.at_level(logging.ERROR, logger=server.logger.name):
+        asyncio.run(server.ensure_indexes(["devices"]))
+
+    assert server.UNIQUE_INDEX_GUARANTEES["devices"] in caplog.text
+
+
+def test_startup_fails_without_the_reservation_index(client):
+    reservation = {"propertyId": "p", "allocationDate": "2026-10-19", "resourceType": "seat", "resourceId": "s1"}
+    asyncio.run(server.db.allocation_reservations.insert_many([
+        {**reservation, "allocationId": "a1"}, {**reservation, "allocationId": "a2"},
+    ]))
+
+    with pytest.raises(OperationFailure):
+        asyncio.run(server.ensure_indexes(["allocation_reservations"]))
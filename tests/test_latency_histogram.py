@@ -0,0 +1,63 @@
+import random
+
+import pytest
+
+from server import LatencyHistogram
+
+
+def bucket_range(index):
+    low = LatencyHistogram.highest_in_bucket(index - 1) + 1 if index else 0
+    return low, LatencyHistogram.highest_in_bucket(index)
+
+
+def test_small_values_have_exact_buckets():
+    for value in range(2 * LatencyHistogram.SUB_BUCKETS):
+        assert LatencyHistogram.bucket_of(value) == value
+        assert bucket_range(value) == (value, value)
+
+
+@pytest.mark.parametrize("value", [64, 65, 127, 128, 1000, 4095, 4096, 299_999, 300_000, 12_345_678])
+def test_bucket_bounds_contain_the_value_within_a_thirty_second(value):
+    low, high = bucket_range(LatencyHistogram.bucket_of(value))
+    assert low <= value <= high
+    assert high - low + 1 <= value / LatencyHistogram.SUB_BUCKETS + 1
+
+
+def test_buckets_are_contiguous_and_increase_with_the_value():
+    values = sorted(random.Random(7).randint(0, 1 << 24) for _ in range(5000))
+    buckets = [LatencyHistogram.bucket_of(value) for value in values]
+    assert buckets == sorted(buckets)
+    for index in range(1, 2 * LatencyHistogram.SUB_BUCKETS + 10 * LatencyHistogram.SUB_BUCKETS):
+        assert bucket_range(index)[0] == bucket_range(index - 1)[1] + 1
+
+
+def test_values_past_the_range_land_in_the_last_bucket():
+    histogram = LatencyHistogram()
+    histogram.record(1 << 40)
+    assert histogram.counts[-1] == 1
+
+
+def test_percentiles_are_within_bucket_precision_and_capped_at_max():
+    histogram = LatencyHistogram()
+    for value in range(1, 1001):
+        histogram.record(value * 1000)
+
+    assert histogram.percentile(0.5) == pytest.approx(500_000, rel=1 / LatencyHistogram.SUB_BUCKETS)
+    assert histogram.percentile(0.99) == pytest.approx(990_000, rel=1 / LatencyHistogram.SUB_BUCKETS)
+    assert histogram.percentile(1.0) == 1_000_000
+    assert LatencyHistogram().percentile(0.5) is None
+
+
+def test_merge_adds_counts_and_keeps_the_max():
+    first, second = LatencyHistogram(), LatencyHistogram()
+    first.record(1000)
+    second.record(5000)
+    second.record(70)
+
+    first.merge(second)
+
+    assert first.count == 3
+    assert first.total == 6070
+    assert first.max == 5000
+    assert first.summary()["calls"] == 3
+    assert first.summary()["maxSeconds"] == 5.0
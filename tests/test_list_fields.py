@@ -0,0 +1,21 @@
+def test_fields_limits_the_returned_keys_to_the_requested_ones_and_id(client, property_setup):
+    response = client.get(f"/api/seats/{property_setup['propertyId']}", params={"fields": "seatNumber, status"})
+
+    assert response.status_code == 200, response.json()
+    assert {tuple(sorted(seat)) for seat in response.json()["seats"]} == {("id", "seatNumber", "status")}
+
+
+def test_without_fields_the_whole_document_comes_back(client, property_setup):
+    seat = client.get(f"/api/seats/{property_setup['propertyId']}").json()["seats"][0]
+
+    assert {"propertyId", "seatTypeId", "seatNumber", "status"} <= set(seat)
+    assert "_id" not in seat
+
+
+def test_unknown_and_secret_fields_are_refused(client, property_setup):
+    pid = property_setup["propertyId"]
+
+    assert client.get(f"/api/seats/{pid}", params={"fields": "seatNumber,nonsense"}).status_code == 400
+    assert client.get(f"/api/staff/{pid}", params={"fields": "password"}).status_code == 400
+    staff = client.get(f"/api/staff/{pid}", params={"fields": "name"}).json()["staff"]
+    assert staff == [{"id": property_setup["managerId"], "name": "Manager"}]
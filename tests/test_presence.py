@@ -0,0 +1,95 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import server
+
+
+@pytest.fixture
+def crew(client, property_setup):
+    """The property with an attendant who logs in as "anna" and a section holding the first four seats"""
+    asyncio.run(server.db.roles.insert_one({"id": "role-attendant", "name": "Pool And Beach Attendant"}))
+    attendant = client.post("/api/staff", json={
+        "propertyId": property_setup["propertyId"], "roleId": "role-attendant", "name": "Anna",
+        "email": "anna@example.com", "username": "anna", "pin": "1234"
+    }).json()["staff"]["id"]
+    section = client.post("/api/sections", json={
+        "propertyId": property_setup["propertyId"], "name": "Pool", "seatIds": property_setup["seatIds"][0:4]
+    }).json()["section"]
+    return {**property_setup, "attendantId": attendant, "sectionId": section["id"]}
+
+
+def login(client, setup, username):
+    return client.post("/api/staff/login", json={"username": username, "pin": "1234", "propertyId": setup["propertyId"]})
+
+
+def on_duty(client, setup, section_id=None):
+    params = {"sectionId": section_id} if section_id else {}
+    staff = client.get(f"/api/presence/{setup['propertyId']}", params=params).json()["staff"]
+    return {entry["staffId"]: entry["sectionId"] for entry in staff}
+
+
+def shifts(staff_id):
+    return asyncio.run(server.db.staff_shifts.find({"staffId": staff_id}, {"_id": 0}).sort("checkedInAt", 1).to_list(None))
+
+
+def test_login_puts_property_wide_roles_on_duty_and_section_roles_at_check_in(client, crew):
+    assert login(client, crew, "manager").status_code == 200
+    assert login(client, crew, "anna").status_code == 200
+    assert on_duty(client, crew) == {crew["managerId"]: None}
+
+    client.post(f"/api/staff/{crew['attendantId']}/check-in", json={"sectionId": crew["sectionId"]})
+
+    assert on_duty(client, crew) == {crew["managerId"]: None, crew["attendantId"]: crew["sectionId"]}
+    assert on_duty(client, crew, "other-section") == {crew["managerId"]: None}
+
+
+def test_moving_section_closes_the_shift_and_checking_out_ends_the_duty(client, crew):
+    other = client.post("/api/sections", json={"propertyId": crew["propertyId"], "name": "Beach"}).json()["section"]
+    client.post(f"/api/staff/{crew['attendantId']}/check-in", json={"sectionId": crew["sectionId"]})
+    client.post(f"/api/staff/{crew['attendantId']}/check-in", json={"sectionId": other["id"]})
+    client.post(f"/api/staff/{crew['attendantId']}/check-out")
+
+    assert on_duty(client, crew) == {}
+    assert [(shift["sectionId"], shift["endReason"]) for shift in shifts(crew["attendantId"])] == [
+        (crew["sectionId"], "moved"), (other["id"], "checkout"),
+    ]
+    assert client.post(f"/api/staff/{crew['attendantId']}/heartbeat").status_code == 404
+
+
+def test_checking_in_to_another_property_s_section_is_refused(client, crew):
+    other = client.post("/api/properties", json={
+        "organisationId": crew["organisationId"], "name": "Other", "email": "other@example.com", "phone": "1", "address": "Hill"
+    }).json()["property"]
+    section = client.post("/api/sections", json={"propertyId": other["id"], "name": "Hill"}).json()["section"]
+
+    response = client.post(f"/api/staff/{crew['attendantId']}/check-in", json={"sectionId": section["id"]})
+
+    assert response.status_code == 404
+    assert on_duty(client, crew) == {}
+
+
+def test_silent_staff_expire_and_heartbeats_keep_others_on_duty(client, crew):
+    client.post(f"/api/staff/{crew['attendantId']}/check-in", json={"sectionId": crew["sectionId"]})
+    client.post(f"/api/staff/{crew['managerId']}/check-in", json={})
+    stale = (datetime.now(timezone.utc) - timedelta(seconds=server.PRESENCE_TIMEOUT_SECONDS + 1)).isoformat()
+    server.presence._entries[crew["attendantId"]]["lastSeenAt"] = stale
+    server.presence._entries[crew["managerId"]]["lastSeenAt"] = stale
+    assert client.post(f"/api/staff/{crew['managerId']}/heartbeat").status_code == 200
+
+    assert asyncio.run(server.presence.expire()) == 1
+
+    assert on_duty(client, crew) == {crew["managerId"]: None}
+    assert shifts(crew["attendantId"])[-1]["endReason"] == "expired"
+
+
+def test_open_shifts_are_restored_after_a_restart(client, crew):
+    client.post(f"/api/staff/{crew['attendantId']}/check-in", json={"sectionId": crew["sectionId"]})
+    server.presence.reset()
+    server.staffing.reset()
+
+    asyncio.run(server.presence.restore())
+
+    assert on_duty(client, crew) == {crew["attendantId"]: crew["sectionId"]}
+    assert server.staffing._on_duty[crew["propertyId"]] == {crew["attendantId"]: crew["sectionId"]}
@@ -0,0 +1,63 @@
+import asyncio
+import gzip
+import json
+
+import server
+
+
+def export(client, property_id):
+    response = client.get(f"/api/properties/{property_id}/export")
+    assert response.status_code == 200
+    return response.content
+
+
+def import_snapshot(client, snapshot):
+    return client.post("/api/properties/import", files={"file": ("export.ndjson.gz", snapshot)})
+
+
+def test_an_export_imports_as_a_copy_with_fresh_ids(client, property_setup):
+    pid = property_setup["propertyId"]
+    seats = property_setup["seatIds"]
+    section = client.post("/api/sections", json={"propertyId": pid, "name": "Pool", "seatIds": seats[0:3]}).json()["section"]
+    client.post("/api/allocations", json={
+        "propertyId": pid, "roomNumber": "101", "fbManagerId": property_setup["managerId"], "seatIds": seats[0:2],
+    })
+
+    response = import_snapshot(client, export(client, pid))
+
+    assert response.status_code == 200, response.json()
+    copy_id = response.json()["propertyId"]
+    assert copy_id != pid
+    assert response.json()["counts"]["seats"] == 10
+    copy = client.get(f"/api/seats/{copy_id}").json()["seats"]
+    assert sorted(seat["seatNumber"] for seat in copy) == [f"{n:02d}" for n in range(1, 11)]
+    assert not {seat["id"] for seat in copy} & set(seats)
+
+    # References inside the copy point at the copy's own documents
+    copy_section = client.get(f"/api/sections/{copy_id}").json()["sections"][0]
+    assert copy_section["id"] != section["id"]
+    by_id = {seat["id"]: seat for seat in copy}
+    assert sorted(by_id[seat_id]["seatNumber"] for seat_id in copy_section["seatIds"]) == ["01", "02", "03"]
+    allocation = client.get(f"/api/allocations/{copy_id}").json()["allocations"][0]
+    assert sorted(by_id[seat_id]["seatNumber"] for seat_id in allocation["seatIds"]) == ["01", "02"]
+
+    # The source property is left alone
+    assert len(client.get(f"/api/seats/{pid}").json()["seats"]) == 10
+
+
+def test_a_file_that_is_not_an_export_is_refused(client, property_setup):
+    snapshot = gzip.compress(json.dumps({"format": "something-else", "version": 1}).encode() + b"\n")
+
+    assert import_snapshot(client, snapshot).status_code == 400
+    assert import_snapshot(client, b"not gzip").status_code == 400
+
+
+def test_a_truncated_export_leaves_nothing_behind(client, property_setup):
+    lines = gzip.decompress(export(client, property_setup["propertyId"])).split(b"\n")
+    # Drop the property line, so the seats are written before the import finds out
+    snapshot = gzip.compress(b"\n".join(line for line in lines if b'"collection": "properties"' not in line))
+
+    response = import_snapshot(client, snapshot)
+
+    assert response.status_code == 400
+    assert asyncio.run(server.db.seats.count_documents({})) == 10
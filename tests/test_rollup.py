@@ -0,0 +1,62 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import server
+
+
+def days_ago(days):
+    return (datetime.now(timezone.utc) - timedelta(days=days)).strftime('%Y-%m-%d')
+
+
+def add_allocation(setup, allocation_id, date, status):
+    """An allocation on a past date, holding the first seat from ten to noon"""
+    seat_id = setup["seatIds"][0]
+    asyncio.run(server.db.allocations.insert_one({
+        "id": allocation_id, "propertyId": setup["propertyId"], "allocationDate": date, "seatIds": [seat_id], "status": status,
+    }))
+    asyncio.run(server.db.allocation_events.insert_many([
+        {"id": f"{allocation_id}-{n}", "allocationId": allocation_id, "propertyId": setup["propertyId"],
+         "eventType": event_type, "newValue": value, "timestamp": f"{date}T{time}+00:00"}
+        for n, (event_type, value, time) in enumerate([("Created", "Allocated", "10:00:00"), ("Status Change", status, "12:00:00")])
+    ]))
+
+
+def count(collection, query):
+    return asyncio.run(server.db[collection].count_documents(query))
+
+
+def rollup(client, setup):
+    response = client.post("/api/admin/rollup", params={"propertyId": setup["propertyId"]})
+    assert response.status_code == 200, response.json()
+    return response.json()
+
+
+def test_closed_days_are_summarised_once(client, property_setup):
+    add_allocation(property_setup, "closed", days_ago(5), "Complete")
+    add_allocation(property_setup, "open", days_ago(0), "Active")
+
+    assert rollup(client, property_setup)["daysMaterialized"] == 1
+    assert rollup(client, property_setup)["daysMaterialized"] == 0
+
+    summary = asyncio.run(server.db.analytics_daily.find_one({"propertyId": property_setup["propertyId"]}))
+    assert summary["date"] == days_ago(5)
+    assert summary["seatHours"] == 2.0
+
+
+def test_old_complete_allocations_move_to_the_archive_with_their_events(client, property_setup):
+    old = days_ago(server.ALLOCATION_RETENTION_DAYS + 1)
+    add_allocation(property_setup, "done", old, "Complete")
+    add_allocation(property_setup, "left-open", old, "Billing")
+
+    report = rollup(client, property_setup)
+
+    assert (report["allocationsArchived"], report["eventsArchived"]) == (1, 2)
+    assert count("allocations", {"id": "done"}) == 0
+    assert count("allocations_archive", {"id": "done"}) == 1
+    assert count("allocations", {"id": "left-open"}) == 1
+    timeline = client.get("/api/allocations/done/events").json()["events"]
+    assert [event["newValue"] for event in timeline] == ["Allocated", "Complete"]
+
+    # The day was summarised before its allocations left, and reports still see them
+    analytics = client.get(f"/api/analytics/{property_setup['propertyId']}", params={"startDate": old, "endDate": old}).json()
+    assert analytics["allocations"] == 2
@@ -0,0 +1,40 @@
+def blocks(client, setup, **params):
+    response = client.get(f"/api/seats/{setup['propertyId']}/layout/blocks", params=params)
+    assert response.status_code == 200, response.json()
+    return [block["seatNumbers"] for block in response.json()["blocks"]]
+
+
+def allocate(client, setup, room, seat_ids):
+    response = client.post("/api/allocations", json={
+        "propertyId": setup["propertyId"], "roomNumber": room, "fbManagerId": setup["managerId"], "seatIds": seat_ids,
+    })
+    assert response.status_code == 200, response.json()
+
+
+def test_taken_and_blocked_seats_split_runs_and_the_tightest_fit_comes_first(client, property_setup):
+    seats = property_setup["seatIds"]  # Loungers 01-10
+    allocate(client, property_setup, "101", [seats[2]])
+    client.patch(f"/api/seats/{seats[7]}/toggle-block")
+
+    assert blocks(client, property_setup, size=2) == [["01", "02"], ["09", "10"], ["04", "05"]]
+    assert blocks(client, property_setup, size=3) == [["04", "05", "06"]]
+    assert blocks(client, property_setup, size=5) == []
+
+
+def test_a_numbering_gap_ends_a_run(client, property_setup):
+    client.delete(f"/api/seats/{property_setup['seatIds'][4]}")
+
+    assert blocks(client, property_setup, size=4) == [["01", "02", "03", "04"], ["06", "07", "08", "09"]]
+
+
+def test_seat_types_and_sections_are_separate_rows(client, property_setup):
+    client.post("/api/seats/bulk", json={
+        "propertyId": property_setup["propertyId"], "seatTypeId": "cabana", "startNumber": 11, "endNumber": 12
+    })
+    section = client.post("/api/sections", json={
+        "propertyId": property_setup["propertyId"], "name": "Pool", "seatIds": property_setup["seatIds"][5:10]
+    }).json()["section"]
+
+    assert blocks(client, property_setup, size=2, seatTypeId="cabana") == [["11", "12"]]
+    assert blocks(client, property_setup, size=6) == []
+    assert blocks(client, property_setup, size=5, sectionId=section["id"]) == [["06", "07", "08", "09", "10"]]
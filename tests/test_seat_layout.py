@@ -0,0 +1,67 @@
+import pytest
+
+
+@pytest.fixture
+def cabanas(client, property_setup):
+    """Ten cabanas C01-C10 on a 5 x 2 grid with one unit spacing, C01 at the origin"""
+    client.post("/api/seats/bulk", json={
+        "propertyId": property_setup["propertyId"], "seatTypeId": "cabana", "prefix": "C",
+        "startNumber": 1, "endNumber": 10, "originX": 0, "originY": 0, "perRow": 5,
+    })
+    seats = client.get(f"/api/seats/{property_setup['propertyId']}").json()["seats"]
+    return {**property_setup, "cabanas": {seat["seatNumber"]: seat["id"] for seat in seats if seat["seatTypeId"] == "cabana"}}
+
+
+def layout(client, setup, query, **params):
+    response = client.get(f"/api/seats/{setup['propertyId']}/layout/{query}", params=params)
+    assert response.status_code == 200, response.json()
+    return response.json()
+
+
+def numbers(seats):
+    return sorted(seat["seatNumber"] for seat in seats)
+
+
+def test_range_returns_the_seats_inside_the_rectangle(client, cabanas):
+    seats = layout(client, cabanas, "range", minX=0, minY=0, maxX=1, maxY=1)["seats"]
+
+    assert numbers(seats) == ["C01", "C02", "C06", "C07"]
+
+
+def test_range_over_a_section_zone_uses_the_polygon(client, cabanas):
+    section = client.post("/api/sections", json={
+        "propertyId": cabanas["propertyId"], "name": "Corner", "zone": [[-0.5, -0.5], [3, -0.5], [-0.5, 3]],
+    }).json()["section"]
+
+    seats = layout(client, cabanas, "range", zone=section["id"])["seats"]
+
+    assert numbers(seats) == ["C01", "C02", "C03", "C06", "C07"]
+
+
+def test_nearest_skips_seats_that_are_taken(client, cabanas):
+    assert numbers(layout(client, cabanas, "nearest", x=4.2, y=1.1)["seats"]) == ["C10"]
+
+    client.post("/api/allocations", json={
+        "propertyId": cabanas["propertyId"], "roomNumber": "101", "fbManagerId": cabanas["managerId"],
+        "seatIds": [cabanas["cabanas"]["C10"]],
+    })
+
+    nearest = layout(client, cabanas, "nearest", x=4.2, y=1.1, count=2)["seats"]
+    assert [seat["seatNumber"] for seat in nearest] == ["C05", "C09"]
+    assert nearest[0]["distance"] == pytest.approx(1.118, abs=1e-3)
+
+
+def test_suggested_groups_are_adjacent_and_disjoint(client, cabanas):
+    suggestions = layout(client, cabanas, "suggest", size=3, x=0, y=0, seatTypeId="cabana")["suggestions"]
+
+    assert numbers(suggestions[0]["seats"]) == ["C01", "C02", "C06"]
+    seen = [seat_id for suggestion in suggestions for seat_id in suggestion["seatIds"]]
+    assert len(seen) == len(set(seen))
+
+
+def test_moving_a_seat_refreshes_the_layout(client, cabanas):
+    assert numbers(layout(client, cabanas, "nearest", x=10, y=10)["seats"]) == ["C10"]
+
+    client.put(f"/api/seats/{cabanas['cabanas']['C01']}", json={"x": 9, "y": 9})
+
+    assert numbers(layout(client, cabanas, "nearest", x=10, y=10)["seats"]) == ["C01"]
@@ -0,0 +1,116 @@
+import asyncio
+
+import server
+
+
+def sections(client, setup):
+    return {section["name"]: section for section in client.get(f"/api/sections/{setup['propertyId']}").json()["sections"]}
+
+
+def seat_sections(client, setup):
+    return {seat["id"]: seat.get("sectionId") for seat in client.get(f"/api/seats/{setup['propertyId']}").json()["seats"]}
+
+
+def create_section(client, setup, name, seat_ids):
+    return client.post("/api/sections", json={"propertyId": setup["propertyId"], "name": name, "seatIds": seat_ids}).json()["section"]
+
+
+class LateCursor:
+    """A cursor that runs `before` when it is first read"""
+
+    def __init__(self, cursor, before):
+        self.cursor = cursor
+        self.before = before
+
+    async def to_list(self, length=None):
+        await self.before()
+        return await self.cursor.to_list(length)
+
+    async def __aiter__(self):
+        await self.before()
+        async for doc in self.cursor:
+            yield doc
+
+
+class ConcurrentWriteDb:
+    """Database proxy that runs `write` just before the second seats/sections read"""
+
+    def __init__(self, db, write):
+        self.db = db
+        self.write = write
+        self.reads = 0
+
+    def __getattr__(self, name):
+        collection = getattr(self.db, name)
+        if name not in ("seats", "sections"):
+            return collection
+        proxy = self
+
+        class Collection:
+            def __getattr__(self, attr):
+                return getattr(collection, attr)
+
+            def find(self, *args, **kwargs):
+                proxy.reads += 1
+                if proxy.reads != 2:
+                    return collection.find(*args, **kwargs)
+
+                async def before():
+                    server.db = proxy.db
+                    await proxy.write()
+                    server.db = proxy
+
+                return LateCursor(collection.find(*args, **kwargs), before)
+
+        return Collection()
+
+    def __getitem__(self, name):
+        return self.db[name]
+
+
+def test_drift_is_repaired(client, property_setup):
+    seats = property_setup["seatIds"]
+    pool = create_section(client, property_setup, "Pool", seats[0:2])
+    beach = create_section(client, property_setup, "Beach", seats[2:3])
+    db = server.db
+
+    async def drift():
+        await db.seats.update_one({"id": seats[0]}, {"$set": {"sectionId": ""}})  # listed, but not pointing back
+        await db.seats.update_one({"id": seats[3]}, {"$set": {"sectionId": beach["id"]}})  # pointing, but not listed
+        await db.seats.update_one({"id": seats[4]}, {"$set": {"sectionId": "gone"}})  # pointing at no section
+        await db.sections.update_one({"id": beach["id"]}, {"$push": {"seatIds": {"$each": [seats[1], "deleted-seat"]}}})
+    asyncio.run(drift())
+
+    report = client.post("/api/admin/reconcile-sections", params={"propertyId": property_setup["propertyId"]}).json()
+
+    assert report["seatsUpdated"] == 2
+    current = sections(client, property_setup)
+    assert sorted(current["Pool"]["seatIds"]) == sorted(seats[0:2])
+    assert sorted(current["Beach"]["seatIds"]) == sorted(seats[2:4])
+    by_seat = seat_sections(client, property_setup)
+    assert by_seat[seats[0]] == by_seat[seats[1]] == pool["id"]
+    assert by_seat[seats[3]] == beach["id"]
+    assert by_seat[seats[4]] == ""
+
+    report = client.post("/api/admin/reconcile-sections", params={"propertyId": property_setup["propertyId"]}).json()
+    assert report["seatsUpdated"] == report["sectionsUpdated"] == 0
+
+
+def test_a_move_committed_between_the_reads_is_not_reverted(client, property_setup):
+    seats = property_setup["seatIds"]
+    create_section(client, property_setup, "Pool", seats[0:2])
+    beach = create_section(client, property_setup, "Beach", seats[2:3])
+
+    async def move_seat():
+        await server.update_section(beach["id"], server.SectionUpdate(seatIds=seats[1:3]))
+
+    server.db = ConcurrentWriteDb(server.db, move_seat)
+    try:
+        asyncio.run(server.reconcile_section_memberships(property_setup["propertyId"]))
+    finally:
+        server.db = server.db.db
+
+    current = sections(client, property_setup)
+    assert current["Pool"]["seatIds"] == seats[0:1]
+    assert sorted(current["Beach"]["seatIds"]) == sorted(seats[1:3])
+    assert seat_sections(client, property_setup)[seats[1]] == beach["id"]
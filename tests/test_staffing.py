@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+import server
+
+
+@pytest.fixture
+def staffed(client, property_setup):
+    """The property with two attendants and one server"""
+    asyncio.run(server.db.roles.insert_many([
+        {"id": "role-attendant", "name": "Pool And Beach Attendant"},
+        {"id": "role-server", "name": "Food and Beverages Server"},
+    ]))
+    staff = {}
+    for name, role in (("anna", "role-attendant"), ("ben", "role-attendant"), ("sam", "role-server")):
+        staff[name] = client.post("/api/staff", json={
+            "propertyId": property_setup["propertyId"], "roleId": role, "name": name,
+            "email": f"{name}@example.com", "username": name, "pin": "1234"
+        }).json()["staff"]["id"]
+    return {**property_setup, "staff": staff}
+
+
+def allocate(client, setup, room, seat_ids):
+    response = client.post("/api/allocations", json={
+        "propertyId": setup["propertyId"], "roomNumber": room,
+        "fbManagerId": setup["managerId"], "seatIds": seat_ids,
+    })
+    assert response.status_code == 200, response.json()
+    return response.json()["allocation"]
+
+
+def test_allocations_go_to_the_least_loaded_attendant(client, staffed):
+    seats = staffed["seatIds"]
+    first = allocate(client, staffed, "101", seats[0:1])
+    second = allocate(client, staffed, "102", seats[1:2])
+
+    attendants = {first["poolBeachAttendantIds"][0], second["poolBeachAttendantIds"][0]}
+    assert attendants == {staffed["staff"]["anna"], staffed["staff"]["ben"]}
+    assert first["fbServerIds"] == second["fbServerIds"] == [staffed["staff"]["sam"]]
+
+    # Completing the first frees its attendant, who takes the next one
+    client.patch(f"/api/allocations/{first['id']}/status", json={"status": "Complete"})
+    third = allocate(client, staffed, "103", seats[2:3])
+    assert third["poolBeachAttendantIds"] == first["poolBeachAttendantIds"]
+
+
+def test_staff_on_duty_for_the_section_are_preferred(client, staffed):
+    seats = staffed["seatIds"]
+    section = client.post("/api/sections", json={
+        "propertyId": staffed["propertyId"], "name": "Pool", "seatIds": seats[0:4]
+    }).json()["section"]
+    server.staffing.mark_on_duty(staffed["propertyId"], staffed["staff"]["ben"], section["id"])
+
+    in_section = [allocate(client, staffed, room, [seat]) for room, seat in (("101", seats[0]), ("102", seats[1]))]
+    outside = allocate(client, staffed, "103", seats[5:6])
+
+    assert all(a["poolBeachAttendantIds"] == [staffed["staff"]["ben"]] for a in in_section)
+    assert outside["poolBeachAttendantIds"] == [staffed["staff"]["anna"]]
+
+
+def test_going_off_duty_hands_allocations_to_colleagues(client, staffed):
+    seats = staffed["seatIds"]
+    server.staffing.mark_on_duty(staffed["propertyId"], staffed["staff"]["anna"])
+    server.staffing.mark_on_duty(staffed["propertyId"], staffed["staff"]["ben"])
+    allocations = [allocate(client, staffed, str(101 + i), seats[i:i + 1]) for i in range(4)]
+    anna_held = [a["id"] for a in allocations if a["poolBeachAttendantIds"] == [staffed["staff"]["anna"]]]
+    assert len(anna_held) == 2
+
+    moved = asyncio.run(server.staffing.staff_off_duty(staffed["propertyId"], staffed["staff"]["anna"]))
+
+    assert moved == 2
+    current = client.get(f"/api/allocations/{staffed['propertyId']}").json()["allocations"]
+    assert all(a["poolBeachAttendantIds"] == [staffed["staff"]["ben"]] for a in current)
+
+
+def test_the_section_comes_from_the_property_s_own_seats(client, staffed):
+    other = client.post("/api/properties", json={
+        "organisationId": staffed["organisationId"], "name": "Other", "email": "other@example.com", "phone": "1", "address": "Hill"
+    }).json()["property"]
+    client.post("/api/seats/bulk", json={"propertyId": other["id"], "seatTypeId": "lounger", "startNumber": 1, "endNumber": 1})
+    foreign_seat = client.get(f"/api/seats/{other['id']}").json()["seats"][0]["id"]
+    client.post("/api/sections", json={"propertyId": other["id"], "name": "Hill", "seatIds": [foreign_seat]})
+
+    entry_section = None
+
+    async def assign():
+        nonlocal entry_section
+        await server.staffing.assign(staffed["propertyId"], "allocation-1", [foreign_seat])
+        entry_section = server.staffing._states[staffed["propertyId"]]["allocations"]["allocation-1"]["section"]
+    asyncio.run(assign())
+
+    assert entry_section is None
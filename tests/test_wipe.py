@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+import server
+
+
+@pytest.fixture
+def two_properties(client, property_setup):
+    """The property plus a second one, with four seats, in another organisation"""
+    organisation = client.post("/api/organisations", json={
+        "name": "Other", "email": "other@example.com", "phone": "1", "address": "Hill"
+    }).json()["organisation"]
+    other = client.post("/api/properties", json={
+        "organisationId": organisation["id"], "name": "Other", "email": "otherp@example.com", "phone": "1", "address": "Hill"
+    }).json()["property"]
+    client.post("/api/seats/bulk", json={"propertyId": other["id"], "seatTypeId": "lounger", "startNumber": 1, "endNumber": 4})
+    return {**property_setup, "otherOrganisationId": organisation["id"], "otherPropertyId": other["id"]}
+
+
+def wipe(**scope):
+    job = {"id": "job", "scope": scope, "status": "running", "collections": {}, "error": None, "finishedAt": None}
+    asyncio.run(server.run_wipe_job(job))
+    assert job["status"] == "done", job["error"]
+    return server.wipe_job_summary(job)
+
+
+def count(collection, query=None):
+    return asyncio.run(server.db[collection].count_documents(query or {}))
+
+
+def test_a_property_wipe_leaves_other_properties_alone(client, two_properties):
+    pid = two_properties["propertyId"]
+    client.post("/api/allocations", json={
+        "propertyId": pid, "roomNumber": "101", "fbManagerId": two_properties["managerId"], "seatIds": two_properties["seatIds"][0:2],
+    })
+
+    summary = wipe(propertyId=pid)
+
+    assert summary["deleted"]["seats"] == 10
+    assert summary["progress"] == {"done": len(summary["deleted"]), "total": len(summary["deleted"])}
+    for collection in ("seats", "staff", "guests", "allocations", "allocation_reservations"):
+        assert count(collection, {"propertyId": pid}) == 0, collection
+    assert count("properties", {"id": pid}) == 0
+    assert count("organisations", {"id": two_properties["organisationId"]}) == 1
+    assert count("seats", {"propertyId": two_properties["otherPropertyId"]}) == 4
+    assert not any(key[0] == pid for key in server.availability_index._entries)
+
+
+def test_an_organisation_wipe_takes_its_properties_with_it(client, two_properties):
+    asyncio.run(server.db.roles.insert_one({"id": "role-fb", "name": "F&B Manager"}))
+
+    wipe(organisationId=two_properties["organisationId"])
+
+    assert count("organisations") == 1
+    assert count("properties") == 1
+    assert count("seats") == 4
+    assert count("roles") == 1
+
+
+def test_a_full_wipe_empties_everything_but_admins(client, two_properties):
+    asyncio.run(server.db.admins.insert_one({"id": "admin", "email": "admin@example.com"}))
+
+    summary = wipe()
+
+    assert set(summary["deleted"]) == set(server.WIPE_COLLECTIONS)
+    assert all(count(collection) == 0 for collection in server.WIPE_COLLECTIONS)
+    assert count("admins") == 1
+
+
+def test_only_one_wipe_runs_at_a_time(client):
+    server.wipe_jobs["busy"] = {"id": "busy", "status": "running", "finishedAt": None}
+    try:
+        assert client.post("/api/admin/clear-all-data").status_code == 409
+    finally:
+        del server.wipe_jobs["busy"]
+
+    assert client.post("/api/admin/clear-all-data", params={"organisationId": "o", "propertyId": "p"}).status_code == 400